@@ -2,6 +2,18 @@ from flask import Flask
 from config import Config
 from extensions import db, bcrypt, migrate, swagger
 from flask_cors import CORS
+from database.schema import check_schema_revision
+from metrics import init_metrics
+from profiler import init_profiler
+from recurrence import init_recurrence
+from jobs import init_jobs
+from concurrency import init_concurrency
+from idempotency import init_idempotency
+from shared_store import init_shared_store
+from ratelimit import init_rate_limits
+from replica import init_replica
+from shards import init_shards
+from response_cache import init_response_cache
 import logging
 
 def create_app():
@@ -15,8 +27,17 @@ def create_app():
     bcrypt.init_app(app)
     migrate.init_app(app, db) 
     swagger.init_app(app)
+
+    # Register the models with the metadata before create_all() looks at it,
+    # and the search index and feed triggers that are created with them
+    import models  # noqa: F401
+    import search  # noqa: F401
+    import calendar_feed  # noqa: F401
     with app.app_context():
-        db.create_all()  # Create tables if they do not exist
+        if app.config['DB_STARTUP_MODE'] == 'create_all':
+            db.create_all(bind_key=None)  # Create tables if they do not exist, never on the replica
+        elif app.config['DB_STARTUP_MODE'] == 'check':
+            check_schema_revision()
 
     if not app.debug:
         stream_handler = logging.StreamHandler()
@@ -36,6 +57,7 @@ def create_app():
     from blueprints.item import item_bp
     from blueprints.budget_planning import budget_planning_bp
     from blueprints.cost import cost_bp
+    from blueprints.calendar import calendar_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(user_bp)
@@ -46,7 +68,42 @@ def create_app():
     app.register_blueprint(item_bp)
     app.register_blueprint(budget_planning_bp)
     app.register_blueprint(cost_bp)
-    
+    app.register_blueprint(calendar_bp)
+
+    # The profiler's after_request has to run after the metrics one (Flask calls
+    # them in reverse order), so its EXPLAIN statements are not counted
+    init_profiler(app)
+    init_metrics(app)
+    init_shared_store(app)
+    # Before the other hooks, so refused requests cost as little as possible
+    init_rate_limits(app)
+    init_recurrence(app)
+    init_jobs(app)
+    init_concurrency(app)
+    init_idempotency(app)
+    init_shards(app)
+    init_response_cache(app)
+    # After the recurrence check, whose reads and writes stay on the primary
+    init_replica(app)
+
+    # Register CLI commands
+    from commands.db_inspect import db_inspect_cli
+    from commands.wg_transfer import wg_cli
+    from commands.startup import openapi_cli, startup_report
+    from commands.tasks import tasks_cli
+    from commands.worker import worker_command
+    from commands.search import search_cli
+    from commands.shards import shards_cli
+
+    app.cli.add_command(db_inspect_cli)
+    app.cli.add_command(wg_cli)
+    app.cli.add_command(openapi_cli)
+    app.cli.add_command(startup_report)
+    app.cli.add_command(tasks_cli)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(shards_cli)
+
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,243 @@
+"""ASGI entry point with async implementations of the heaviest read endpoints.
+
+    uvicorn asgi:create_asgi_app --factory --workers 4 --port 7701
+
+GET /wg/my, /wg/<id>, the task lists, shopping lists and budget plannings of a
+WG and /tasks/undone/me are answered on the event loop with an AsyncSession
+(aiosqlite or asyncpg), so slow clients and long-lived connections waiting on
+them do not pin a thread each. Every other request goes to the Flask app,
+which asgiref runs in a thread pool, so the synchronous blueprints work as
+before.
+
+The async views use the blueprints' loader options and serializers, so their
+responses are the same as those of the sync views. Only the request metrics,
+the read rate limit and the replica routing are applied to them; the other
+Flask hooks (SQL metrics, profiler, recurrence check) run on the requests
+Flask handles. With WG shards (shards.py) Flask handles every request.
+The rate limit and replica routing read the shared store in a thread, as its
+lock can be held by other workers.
+"""
+import asyncio
+import math
+import sqlite3
+import time
+
+import jwt
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import exists, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import create_app
+from blueprints.budget_planning import BUDGETPLANNING_LOAD_OPTIONS, serialize_budgetplanning
+from blueprints.shopping_list import SHOPPINGLIST_LOAD_OPTIONS, serialize_shoppinglist
+from blueprints.task import group_undone_tasks, undone_tasks_query
+from blueprints.task_list import TASKLIST_LOAD_OPTIONS, serialize_tasklist
+from blueprints.wg import WG_LOAD_OPTIONS, serialize_wg
+from extensions import REPLICA
+import shards
+from metrics import DB_ROUTED, IN_FLIGHT, RATE_LIMITED, REQUEST_LATENCY, REQUESTS
+from models import WG, BudgetPlanning, ShoppingList, TaskList, User, user_wg
+from shared_store import shared_store
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+def async_database_url(url):
+    """The URL of the same database with the async driver of its dialect."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+async def _is_member(session, user, wg_id):
+    return await session.scalar(select(exists().where(user_wg.c.wg_id == wg_id,
+                                                      user_wg.c.user_id == user.idUser)))
+
+
+async def get_my_wgs(session, user):
+    wgs = await session.scalars(select(WG).options(*WG_LOAD_OPTIONS).where(WG.users.contains(user)))
+    return [serialize_wg(wg) for wg in wgs], 200
+
+
+async def get_wg_info(session, user, wg_id):
+    wg = await session.get(WG, wg_id, options=WG_LOAD_OPTIONS)
+    if not wg:
+        return {'message': 'WG not found'}, 404
+    if user not in wg.users and user != wg.creator:
+        return {'message': 'Not authorized'}, 403
+    return serialize_wg(wg), 200
+
+
+def _wg_children(key, model, load_options, serialize):
+    async def view(session, user, wg_id):
+        if await session.get(WG, wg_id) is None:
+            return {'message': 'WG not found'}, 404
+        if not await _is_member(session, user, wg_id):
+            return {'message': 'Not authorized'}, 403
+        rows = await session.scalars(select(model).options(*load_options).where(model.wg_id == wg_id))
+        return {key: [serialize(row) for row in rows]}, 200
+    return view
+
+
+async def get_my_undone_tasks(session, user):
+    rows = await session.execute(undone_tasks_query(user.idUser))
+    return {'wgs': group_undone_tasks(rows)}, 200
+
+
+# Flask endpoint -> async view; the URL rules are those of the Flask app
+ASYNC_VIEWS = {
+    'wg_bp.get_my_wgs': get_my_wgs,
+    'wg_bp.get_wg_info': get_wg_info,
+    'wg_bp.get_tasklists_for_wg': _wg_children('tasklists', TaskList, TASKLIST_LOAD_OPTIONS, serialize_tasklist),
+    'wg_bp.get_shoppinglists_for_wg': _wg_children('shoppinglists', ShoppingList, SHOPPINGLIST_LOAD_OPTIONS,
+                                                   serialize_shoppinglist),
+    'wg_bp.get_budgetplannings_for_wg': _wg_children('budgetplannings', BudgetPlanning,
+                                                     BUDGETPLANNING_LOAD_OPTIONS, serialize_budgetplanning),
+    'task_bp.get_my_undone_tasks': get_my_undone_tasks,
+}
+
+
+class AsyncReadApp:
+    """Serves ASYNC_VIEWS itself and hands everything else to the Flask app."""
+
+    def __init__(self, flask_app, engine=None, replica_engine=None):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = engine or create_async_engine(
+            async_database_url(flask_app.config['SQLALCHEMY_DATABASE_URI']))
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        # Reads go to the replica like those of the sync GET views (replica.py)
+        replica_url = flask_app.config['SQLALCHEMY_BINDS'].get(REPLICA)
+        self.replica_engine = replica_engine or (
+            create_async_engine(async_database_url(replica_url)) if replica_url else None)
+        self.replica_sessions = self.replica_engine and async_sessionmaker(self.replica_engine,
+                                                                           expire_on_commit=False)
+        self.urls = flask_app.url_map.bind('')
+        self.sharded = shards.enabled(flask_app)
+        self.store = shared_store(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        view = args = None
+        if scope['type'] == 'http' and scope['method'] == 'GET' and not self.sharded:
+            try:
+                endpoint, args = self.urls.match(scope['path'], 'GET')
+                view = ASYNC_VIEWS.get(endpoint)
+            except HTTPException:
+                pass
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                       for name, value in scope['headers']}
+            body, status, extra = await self._dispatch(view, args, headers, scope)
+            await self._respond(send, headers, body, status, extra)
+            REQUESTS.labels(endpoint, 'GET', str(status)).inc()
+            REQUEST_LATENCY.labels(endpoint, 'GET').observe(time.perf_counter() - started)
+        finally:
+            IN_FLIGHT.dec()
+
+    async def _dispatch(self, view, args, headers, scope):
+        config = self.flask_app.config
+        token = self._token(headers)
+        try:
+            claims = jwt.decode(token, config['SECRET_KEY'], algorithms=['HS256']) if token else None
+        except jwt.InvalidTokenError as e:
+            claims, error = None, e
+
+        if config['RATE_LIMITS']:
+            caller = f"user:{claims.get('user_id')}" if claims else f"ip:{(scope.get('client') or ('',))[0]}"
+            try:
+                wait = await self._off_loop(
+                    self.flask_app.extensions['rate_limiter'].hit,
+                    f'read:{caller}', config['RATE_LIMIT_READ_RATE'], config['RATE_LIMIT_READ_BURST'])
+            except sqlite3.Error:
+                self.flask_app.logger.exception('Rate limit store failed, letting the request through')
+                wait = 0
+            if wait:
+                RATE_LIMITED.labels('read').inc()
+                return {'message': 'Too many requests'}, 429, {'Retry-After': str(math.ceil(wait))}
+
+        if not token:
+            return {'message': 'Token is missing!'}, 403, {}
+        if claims is None:
+            return {'message': 'Token is invalid!', 'error': str(error)}, 403, {}
+        sessions = await self._sessions(claims.get('user_id'))
+        try:
+            while True:
+                async with sessions() as session:
+                    user = await session.scalar(select(User).filter_by(
+                        idUser=claims.get('user_id'), strUser=claims.get('username'), strEmail=claims.get('email')))
+                    if user:
+                        body, status = await view(session, user, **args)
+                        break
+                # Like decorators.authenticate: the replica may not have caught
+                # up with a user who just registered
+                if sessions is self.sessions:
+                    return {'message': 'User not found!'}, 404, {}
+                sessions = self.sessions
+        except Exception:
+            self.flask_app.logger.exception('Async view failed')
+            return {'message': 'Internal Server Error'}, 500, {}
+        return body, status, {}
+
+    async def _off_loop(self, f, *args):
+        """Calls ``f`` in a thread if it may wait on the shared store, which
+        holds its lock for up to a second under contention from other workers."""
+        if self.store is None:
+            return f(*args)
+        return await asyncio.to_thread(f, *args)
+
+    async def _sessions(self, user_id):
+        if self.replica_sessions is None:
+            return self.sessions
+        writers = self.flask_app.extensions['recent_writers']
+        try:
+            recent_writer = await self._off_loop(writers.__contains__, user_id)
+        except sqlite3.Error:
+            self.flask_app.logger.exception('Shared store failed, reading from the primary')
+            recent_writer = True
+        DB_ROUTED.labels('primary' if recent_writer else REPLICA).inc()
+        return self.sessions if recent_writer else self.replica_sessions
+
+    @staticmethod
+    def _token(headers):
+        # Same parsing as decorators.authenticate
+        parts = headers.get('authorization', '').split()
+        return (parts[1] if len(parts) == 2 else parts[0]) if parts else None
+
+    async def _respond(self, send, headers, body, status, extra):
+        # Serialized like jsonify, so dates and key order match the sync views
+        payload = (self.flask_app.json.dumps(body, separators=(',', ':')) + '\n').encode()
+        response_headers = [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(payload)).encode())]
+        response_headers += [(name.lower().encode(), value.encode()) for name, value in extra.items()]
+        origin = headers.get('origin')
+        if origin:
+            # What Flask-Cors answers for origins=['*'] with credentials
+            response_headers += [(b'access-control-allow-origin', origin.encode('latin-1')),
+                                 (b'access-control-allow-credentials', b'true'),
+                                 (b'vary', b'Origin')]
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                if self.replica_engine is not None:
+                    await self.replica_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app():
+    return AsyncReadApp(create_app())
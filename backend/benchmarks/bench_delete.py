@@ -0,0 +1,101 @@
+"""Time and peak Python memory of deleting one large WG.
+
+Compares the delete_wg job, a single DELETE the foreign keys cascade, with
+deleting through the session with every child loaded, which is what
+db.session.delete(wg) amounted to before the cascades moved into the database.
+Run from the backend directory; SQLite by default, or any database with --url:
+
+    python -m benchmarks.bench_delete --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+def wg_shape(rows):
+    """Seed parameters for one WG with about ``rows`` rows below it."""
+    # 10 lists of each kind with a link row per task and item, 4 budget plans
+    # whose costs have two link rows each
+    return {'lists': 10, 'tasks': max(rows // 50, 1), 'items': max(rows // 50, 1),
+            'budgets': 4, 'costs': max(rows // 60, 1)}
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='Rows below the deleted WG.')
+    parser.add_argument('--url', help='Database URL; a temporary SQLite file by default.')
+    args = parser.parse_args()
+
+    path = None
+    url = args.url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+    # Config reads the environment on import
+    os.environ['DATABASE_URL'] = url
+    os.environ['JOB_WORKER_THREADS'] = '0'
+    os.environ['RECURRENCE_CHECK_SECONDS'] = '0'
+
+    from sqlalchemy.orm import selectinload
+    from app import create_app
+    from extensions import db
+    from models import WG, TaskList, Task, ShoppingList, Item, BudgetPlanning, Cost
+    from blueprints.wg import delete_wg_job
+    from benchmarks.seed import seed
+
+    def delete_loaded(wg_id):
+        wg = WG.query.options(
+            selectinload(WG.users), selectinload(WG.admins),
+            selectinload(WG.tasklists).selectinload(TaskList.users),
+            selectinload(WG.tasklists).selectinload(TaskList.tasks).selectinload(Task.users),
+            selectinload(WG.shoppinglists).selectinload(ShoppingList.users),
+            selectinload(WG.shoppinglists).selectinload(ShoppingList.items).selectinload(Item.users),
+            selectinload(WG.budgetplannings).selectinload(BudgetPlanning.users),
+            selectinload(WG.budgetplannings).selectinload(BudgetPlanning.costs).selectinload(Cost.users),
+        ).filter(WG.idWG == wg_id).one()
+        db.session.delete(wg)
+        db.session.commit()
+
+    def delete_bulk(wg_id):
+        delete_wg_job(wg_id)
+        db.session.commit()
+
+    app = create_app()
+    print(f"{'path':<22} {'rows':>8} {'seconds':>9} {'peak MB':>9} {'left':>6}")
+    try:
+        with app.app_context():
+            for name, delete in [('session, loaded', delete_loaded), ('bulk (cascade)', delete_bulk)]:
+                with db.engine.begin() as conn:
+                    counts, manifest = seed(conn, users=6, wgs=1, members=(6, 6),
+                                            prefix=name.split()[0], **wg_shape(args.rows))
+                rows = sum(counts.values()) - counts['USERS'] - counts['WG']
+                wg_id = manifest['wgs'][0]['id']
+                elapsed, peak = measure(lambda: delete(wg_id))
+                db.session.remove()
+                left = sum(db.session.execute(db.select(db.func.count()).select_from(table)).scalar()
+                           for table in (Task.__table__, Item.__table__, Cost.__table__))
+                print(f'{name:<22} {rows:>8} {elapsed:>9.2f} {peak / 2**20:>9.1f} {left:>6}')
+                db.session.execute(db.delete(WG))
+                db.session.commit()
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Insert throughput and index size of the primary key layouts.
+
+Compares the old layout (random UUID4 as 36 characters of text) with
+compact 16-byte keys, random (UUID4) and time-ordered (UUID7). Run from the
+backend directory; SQLite by default, or any DATABASE_URL given with --url:
+
+    python -m benchmarks.bench_keys --rows 200000
+    python -m benchmarks.bench_keys --url postgresql://localhost/bench
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+import sqlalchemy as sa
+
+from models.types import CompactUUID, uuid7
+
+BATCH_SIZE = 1000
+
+LAYOUTS = [
+    ('text uuid4', sa.String(36), lambda: str(uuid.uuid4())),
+    ('compact uuid4', CompactUUID(), lambda: str(uuid.uuid4())),
+    ('compact uuid7', CompactUUID(), lambda: str(uuid7())),
+]
+
+
+def build_tables(key_type):
+    metadata = sa.MetaData()
+    tasks = sa.Table(
+        'bench_task', metadata,
+        sa.Column('id', key_type, primary_key=True),
+        sa.Column('title', sa.String(120), nullable=False),
+        sa.Column('tasklist_id', key_type, index=True),
+    )
+    user_task = sa.Table(
+        'bench_user_task', metadata,
+        sa.Column('user_id', key_type, nullable=False),
+        sa.Column('task_id', key_type, nullable=False),
+        sa.PrimaryKeyConstraint('task_id', 'user_id'),
+    )
+    return metadata, tasks, user_task
+
+
+def relation_sizes(conn, metadata):
+    """Returns (table bytes, index bytes) summed over the benchmark tables."""
+    names = list(metadata.tables)
+    if conn.dialect.name == 'postgresql':
+        table_bytes = index_bytes = 0
+        for name in names:
+            table_bytes += conn.execute(sa.text('SELECT pg_table_size(:t)'), {'t': name}).scalar()
+            index_bytes += conn.execute(sa.text('SELECT pg_indexes_size(:t)'), {'t': name}).scalar()
+        return table_bytes, index_bytes
+    # dbstat lists every b-tree of the file; a primary key that is not an
+    # integer lives in its own sqlite_autoindex_* b-tree next to the table
+    rows = conn.execute(sa.text(
+        "SELECT s.name, m.type, sum(s.pgsize) FROM dbstat s "
+        "JOIN sqlite_master m ON m.name = s.name GROUP BY s.name, m.type"
+    ))
+    table_bytes = index_bytes = 0
+    for name, kind, size in rows:
+        if kind == 'table' and name in names:
+            table_bytes += size
+        elif kind == 'index' and any(t in name for t in names):
+            index_bytes += size
+    return table_bytes, index_bytes
+
+
+def run_layout(engine, key_type, make_id, rows):
+    metadata, tasks, user_task = build_tables(key_type)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    tasklist_ids = [make_id() for _ in range(max(rows // 50, 1))]
+    user_ids = [make_id() for _ in range(max(rows // 100, 1))]
+
+    started = time.perf_counter()
+    for start in range(0, rows, BATCH_SIZE):
+        count = min(BATCH_SIZE, rows - start)
+        task_rows = [{'id': make_id(), 'title': 'Task', 'tasklist_id': tasklist_ids[(start + i) % len(tasklist_ids)]}
+                     for i in range(count)]
+        link_rows = [{'user_id': user_ids[(start + i) % len(user_ids)], 'task_id': row['id']}
+                     for i, row in enumerate(task_rows)]
+        # One transaction per batch, like many concurrent requests creating tasks
+        with engine.begin() as conn:
+            conn.execute(tasks.insert(), task_rows)
+            conn.execute(user_task.insert(), link_rows)
+    elapsed = time.perf_counter() - started
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(sa.text('VACUUM ANALYZE bench_task'))
+        table_bytes, index_bytes = relation_sizes(conn, metadata)
+    metadata.drop_all(engine)
+    return rows / elapsed, table_bytes, index_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help='Tasks to insert per layout.')
+    parser.add_argument('--url', help='Database URL; a temporary SQLite file by default.')
+    args = parser.parse_args()
+
+    print(f"{'layout':<16} {'rows/s':>10} {'table MB':>10} {'index MB':>10}")
+    for name, key_type, make_id in LAYOUTS:
+        path = None
+        url = args.url
+        if not url:
+            fd, path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            url = f'sqlite:///{path}'
+        engine = sa.create_engine(url)
+        try:
+            throughput, table_bytes, index_bytes = run_layout(engine, key_type, make_id, args.rows)
+        finally:
+            engine.dispose()
+            if path:
+                os.remove(path)
+        print(f'{name:<16} {throughput:>10.0f} {table_bytes / 2**20:>10.2f} {index_bytes / 2**20:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
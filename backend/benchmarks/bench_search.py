@@ -0,0 +1,77 @@
+"""Latency of GET /wg/<id>/search with a large index.
+
+Seeds ``--wgs`` WGs of about 500 indexed rows each (2000 WGs give a million),
+then times search_wg for random WGs and queries. Run from the backend
+directory; SQLite by default, or any database with --url:
+
+    python -m benchmarks.bench_search --wgs 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Short and long prefixes, two words, and a word that is in no title
+QUERIES = ['milk', 'ba', 'kitchen pl', 'cleaning sup', 'groceries', 'nothing']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wgs', type=int, default=2000, help='WGs to seed.')
+    parser.add_argument('--queries', type=int, default=2000, help='Searches to time.')
+    parser.add_argument('--url', help='Database URL; a temporary SQLite file by default.')
+    args = parser.parse_args()
+
+    path = None
+    url = args.url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+    # Config reads the environment on import
+    os.environ['DATABASE_URL'] = url
+    os.environ['JOB_WORKER_THREADS'] = '0'
+    os.environ['RECURRENCE_CHECK_SECONDS'] = '0'
+
+    from app import create_app
+    from extensions import db
+    from search import search_wg
+    from benchmarks.seed import seed
+
+    app = create_app()
+    rng = random.Random(0)
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            with db.engine.begin() as conn:
+                _, manifest = seed(conn, users=args.wgs * 2, wgs=args.wgs, members=(2, 4), lists=3,
+                                   tasks=100, items=60, budgets=2, costs=10, prefix='search', rng=rng)
+            seeded = time.perf_counter() - started
+            indexed = db.session.execute(db.text('SELECT count(*) FROM search_doc')).scalar()
+            print(f'Seeded {indexed} indexed rows in {seeded:.1f}s (index kept by the triggers)')
+
+            wg_ids = [wg['id'] for wg in manifest['wgs']]
+            print(f"{'query':<14} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'hits':>6}")
+            for q in QUERIES:
+                timings, hits = [], 0
+                for _ in range(args.queries // len(QUERIES)):
+                    wg_id = rng.choice(wg_ids)
+                    started = time.perf_counter()
+                    results, _ = search_wg(wg_id, q)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    hits = max(hits, len(results))
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                print(f'{q:<14} {statistics.median(timings):>8.2f} {p95:>8.2f} {timings[-1]:>8.2f} {hits:>6}')
+            db.session.remove()
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
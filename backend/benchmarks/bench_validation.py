@@ -0,0 +1,73 @@
+"""Cost of request-body validation per request, in microseconds.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_validation
+"""
+import json
+import timeit
+
+import jsonschema
+from flask import Flask
+
+from validation import compile_schema, validate_json
+from blueprints.task import UPDATE_TASK_SCHEMA
+from blueprints.task_list import CREATE_TASKLIST_SCHEMA, ADD_TASK_SCHEMA
+from blueprints.budget_planning import ADD_COST_SCHEMA
+
+USER_ID = '5d0b6a8e-2a4f-4a53-9d4c-0c7f3c3f7e41'
+
+CASES = [
+    ('create tasklist', CREATE_TASKLIST_SCHEMA,
+     {'wg_id': USER_ID, 'title': 'Cleaning', 'description': 'Weekly plan', 'date': '2025-10-01'}),
+    ('add task', ADD_TASK_SCHEMA,
+     {'title': 'Kitchen', 'description': None, 'start_date': '2025-10-01T10:00', 'end_date': None}),
+    ('update task, 20 users', UPDATE_TASK_SCHEMA,
+     {'title': 'Kitchen', 'is_done': True, 'user_ids': [USER_ID] * 20}),
+    ('add cost', ADD_COST_SCHEMA,
+     {'title': 'Rent', 'goal': 1200.0, 'user_ids': [USER_ID] * 4}),
+    ('invalid body', ADD_TASK_SCHEMA,
+     {'title': 42}),
+]
+
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main(number=20000):
+    app = Flask(__name__)
+
+    def view():
+        return 'ok'
+
+    print(f"{'payload':<24} {'compiled':>10} {'jsonschema':>11} {'parse+check':>12}   (us per request)")
+    for name, schema, payload in CASES:
+        compiled = compile_schema(schema)
+        interpreted = jsonschema.Draft7Validator(schema)
+        decorated = validate_json(schema)(view)
+        body = json.dumps(payload)
+
+        def run_compiled():
+            try:
+                compiled(payload)
+            except Exception:
+                pass
+
+        def run_interpreted():
+            interpreted.is_valid(payload)
+
+        # Full decorator cost, including parsing the JSON body of the request
+        def run_decorated():
+            with app.test_request_context('/', method='POST', data=body, content_type='application/json'):
+                decorated()
+
+        baseline = per_call_us(lambda: app.test_request_context(
+            '/', method='POST', data=body, content_type='application/json').__enter__().pop(), number // 10)
+        print(f'{name:<24} {per_call_us(run_compiled, number):>10.2f} '
+              f'{per_call_us(run_interpreted, number // 10):>11.2f} '
+              f'{per_call_us(run_decorated, number // 10) - baseline:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Measures how many concurrent connections a server keeps answering.
+
+Seed the database with ``benchmarks.seed``, start the sync deployment or the
+ASGI one with rate limits off, and run from the backend directory:
+
+    RATE_LIMITS=0 gunicorn -c gunicorn.conf.py &
+    python -m benchmarks.capacity --manifest seed.json --connections 16 64 256 --slow 32 --save sync.json
+    RATE_LIMITS=0 uvicorn asgi:create_asgi_app --factory --workers 4 --port 7701 &
+    python -m benchmarks.capacity --manifest seed.json --connections 16 64 256 --slow 32 --baseline sync.json
+
+Every connection is kept open and requests /wg/my, /wg/<id> or
+/tasks/undone/me over and over, one request at a time. ``--slow`` further
+connections send their request headers a byte every ``--trickle`` seconds and
+never finish them, like clients on a bad mobile network; whatever reads them
+is pinned for as long as they last. For every number of connections the report
+shows the requests answered, errors (refused connections, timeouts and 5xx),
+throughput and latency.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from benchmarks.load import percentile
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def login_tokens(base_url, manifest, count, rng):
+    """Tokens and WG ids of up to ``count`` seeded members."""
+    users = rng.sample(manifest['users'], min(count, len(manifest['users'])))
+    tokens = []
+    for user in users:
+        response = requests.post(f'{base_url}/login',
+                                 json={'identifier': user['username'], 'password': manifest['password']})
+        response.raise_for_status()
+        tokens.append((response.json()['token'], user['wg_id']))
+    return tokens
+
+
+async def read_response(reader):
+    """Reads one response; returns its status and whether the connection stays open."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(host, port, token, wg_id, deadline, timeout, rng, latencies, errors):
+    paths = ['/wg/my', f'/wg/{wg_id}', '/tasks/undone/me']
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            request = (f'GET {rng.choice(paths)} HTTP/1.1\r\nHost: {host}\r\n'
+                       f'Authorization: Bearer {token}\r\n\r\n').encode()
+            started = time.perf_counter()
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            errors.append(None)
+            if writer is not None:
+                writer.close()
+                writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def slow_client(host, port, deadline, trickle):
+    try:
+        _, writer = await asyncio.open_connection(host, port)
+        writer.write(f'GET /wg/my HTTP/1.1\r\nHost: {host}\r\n'.encode())
+        for byte in b'X-Slow: ' + b'x' * 10_000:
+            if time.perf_counter() >= deadline:
+                break
+            writer.write(bytes([byte]))
+            await writer.drain()
+            await asyncio.sleep(trickle)
+        writer.close()
+    except OSError:
+        pass
+
+
+async def run_level(base_url, tokens, connections, slow, duration, trickle, timeout, seed):
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    slow_tasks = [asyncio.create_task(slow_client(host, port, deadline, trickle)) for _ in range(slow)]
+    # Let the slow clients take their connections first
+    await asyncio.sleep(min(1.0, duration / 10))
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        client(host, port, *tokens[n % len(tokens)], deadline, timeout, random.Random(seed + n), latencies, errors)
+        for n in range(connections)])
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*slow_tasks)
+    values = sorted(latencies)
+    return {
+        'connections': connections,
+        'requests': len(values),
+        'errors': len(errors),
+        'throughput': round(len(values) / elapsed, 2),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"{result['slow']} slow connections, {result['duration']}s per level")
+    print(f"{'connections':>11} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    old_levels = {level['connections']: level for level in (baseline or {}).get('levels', [])}
+    for level in result['levels']:
+        print(f"{level['connections']:>11} {level['requests']:>9} {level['errors']:>7} "
+              f"{level['throughput']:>9.1f} {level['p50_ms']:>9.2f} {level['p99_ms']:>9.2f}")
+        old = old_levels.get(level['connections'])
+        if old:
+            print(f"{'baseline':>11} {old['requests']:>9} {old['errors']:>7} "
+                  f"{old['throughput']:>9.1f} {old['p50_ms']:>9.2f} {old['p99_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:7701')
+    parser.add_argument('--manifest', default='seed.json')
+    parser.add_argument('--connections', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--slow', type=int, default=0, help='Connections that never finish their request.')
+    parser.add_argument('--trickle', type=float, default=1.0, help='Seconds between the bytes of slow clients.')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--users', type=int, default=32, help='Members to log in; connections share them.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Save the result of this run.')
+    parser.add_argument('--baseline', help='Show a saved result next to this one.')
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding='utf-8') as f:
+        manifest = json.load(f)
+    base_url = args.base_url.rstrip('/')
+    # Logging in is bcrypt-bound and not part of the measurement
+    tokens = login_tokens(base_url, manifest, args.users, random.Random(args.seed))
+    levels = [asyncio.run(run_level(base_url, tokens, connections, args.slow, args.duration,
+                                    args.trickle, args.timeout, args.seed))
+              for connections in args.connections]
+    result = {'slow': args.slow, 'duration': args.duration, 'levels': levels}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f'\nResult saved to {args.save}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Replays a realistic request mix against a running server.
+
+Seed the database with ``benchmarks.seed`` first, start the server (for
+example ``gunicorn -c gunicorn.conf.py``) and run from the backend directory:
+
+    python -m benchmarks.load --manifest seed.json --concurrency 16 --duration 30
+    python -m benchmarks.load --manifest seed.json --save-baseline baseline.json
+    python -m benchmarks.load --manifest seed.json --baseline baseline.json
+
+Queries per request are taken from the difference of the server's /metrics
+before and after the run, so they include every worker.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+
+# (name, weight) of the operations in the mix
+MIX = [
+    ('wg_my', 30),
+    ('wg_detail', 30),
+    ('check_item', 15),
+    ('check_task', 15),
+    ('add_cost', 10),
+]
+
+# Relative change above which a metric counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class VirtualUser:
+    """One logged-in member of a WG issuing requests from the mix."""
+
+    def __init__(self, base_url, login, password, wg, rng):
+        self.base_url = base_url
+        self.login_data = {'identifier': login['username'], 'password': password}
+        self.login = login
+        self.wg = wg
+        self.rng = rng
+        self.session = requests.Session()
+        self.authenticate()
+
+    def authenticate(self):
+        response = self.session.post(f'{self.base_url}/login', json=self.login_data)
+        response.raise_for_status()
+        self.session.headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+    def request(self, method, path, **kwargs):
+        response = self.session.request(method, self.base_url + path, **kwargs)
+        if response.status_code == 403 and 'Token' in response.text:
+            # Tokens expire after ten minutes
+            self.authenticate()
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        return response
+
+    def run(self, operation):
+        if operation == 'wg_my':
+            return self.request('GET', '/wg/my')
+        if operation == 'wg_detail':
+            return self.request('GET', f"/wg/{self.wg['id']}")
+        if operation == 'check_item' and self.wg['item_ids']:
+            return self.request('PUT', f"/item/{self.rng.choice(self.wg['item_ids'])}/check")
+        if operation == 'check_task' and self.login['task_ids']:
+            return self.request('POST', f"/task/{self.rng.choice(self.login['task_ids'])}/check")
+        if operation == 'add_cost' and self.wg['budgetplanning_ids']:
+            budget_id = self.rng.choice(self.wg['budgetplanning_ids'])
+            return self.request('POST', f'/budgetplanning/{budget_id}/add_cost',
+                                json={'title': 'Load test', 'goal': round(self.rng.uniform(1, 50), 2)})
+        return None
+
+
+def scrape_metrics(base_url, token=None):
+    """Returns {endpoint: (requests, sql statements)} from the server's /metrics."""
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    try:
+        response = requests.get(f'{base_url}/metrics', headers=headers, timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name == 'wg_http_requests_total':
+                totals[sample.labels['endpoint']][0] += sample.value
+            elif sample.name == 'wg_sql_statements_total':
+                totals[sample.labels['endpoint']][1] += sample.value
+    return totals
+
+
+def queries_per_request(before, after):
+    if before is None or after is None:
+        return {}
+    result = {}
+    for endpoint, (reqs, statements) in after.items():
+        prev_reqs, prev_statements = before.get(endpoint, (0.0, 0.0))
+        if reqs > prev_reqs:
+            result[endpoint] = round((statements - prev_statements) / (reqs - prev_reqs), 2)
+    return result
+
+
+def run_load(base_url, manifest, concurrency, duration, seed=0, metrics_token=None):
+    rng = random.Random(seed)
+    wgs = {wg['id']: wg for wg in manifest['wgs']}
+    logins = rng.sample(manifest['users'], min(concurrency, len(manifest['users'])))
+
+    # Logging in is bcrypt-bound and not part of the measured mix
+    users = [VirtualUser(base_url, login, manifest['password'], wgs[login['wg_id']],
+                         random.Random(seed + n)) for n, login in enumerate(logins)]
+
+    names = [name for name, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = None
+
+    def worker(user):
+        local, local_errors = defaultdict(list), defaultdict(int)
+        while time.perf_counter() < deadline:
+            operation = user.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = user.run(operation)
+            except requests.RequestException:
+                local_errors[operation] += 1
+                continue
+            if response is None:
+                continue
+            local[operation].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                local_errors[operation] += 1
+        with lock:
+            for operation, values in local.items():
+                latencies[operation].extend(values)
+            for operation, count in local_errors.items():
+                errors[operation] += count
+
+    before = scrape_metrics(base_url, metrics_token)
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    started = time.perf_counter()
+    deadline = started + duration
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    after = scrape_metrics(base_url, metrics_token)
+
+    operations = {}
+    for operation in names + ['total']:
+        if operation == 'total':
+            values = sorted(v for op in names for v in latencies[op])
+            error_count = sum(errors.values())
+        else:
+            values = sorted(latencies[operation])
+            error_count = errors[operation]
+        operations[operation] = {
+            'requests': len(values),
+            'errors': error_count,
+            'throughput': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+        }
+    return {
+        'concurrency': len(users),
+        'duration': round(elapsed, 2),
+        'operations': operations,
+        'queries_per_request': queries_per_request(before, after),
+    }
+
+
+def print_report(result):
+    print(f"{result['concurrency']} virtual users for {result['duration']}s")
+    print(f"{'operation':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, op in result['operations'].items():
+        print(f"{name:<12} {op['requests']:>9} {op['errors']:>7} {op['throughput']:>9.1f} "
+              f"{op['p50_ms']:>9.2f} {op['p95_ms']:>9.2f} {op['p99_ms']:>9.2f}")
+    if result['queries_per_request']:
+        print('\nSQL statements per request (from /metrics)')
+        for endpoint, value in sorted(result['queries_per_request'].items()):
+            print(f'  {endpoint:<40} {value:>8.2f}')
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Prints the change against a baseline and returns the regressions found."""
+    regressions = []
+
+    def check(label, new, old, higher_is_better=False):
+        if not old:
+            return
+        change = (new - old) / old
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        marker = '  REGRESSION' if worse else ''
+        print(f'  {label:<40} {old:>10.2f} -> {new:>10.2f} ({change:+.1%}){marker}')
+        if worse:
+            regressions.append(label)
+
+    print(f'\nCompared with baseline (tolerance {tolerance:.0%})')
+    for name, op in result['operations'].items():
+        old = baseline['operations'].get(name)
+        if not old:
+            continue
+        check(f'{name} req/s', op['throughput'], old['throughput'], higher_is_better=True)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            check(f'{name} {key}', op[key], old[key])
+    for endpoint, value in result['queries_per_request'].items():
+        old = baseline.get('queries_per_request', {}).get(endpoint)
+        check(f'{endpoint} queries', value, old)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:7701')
+    parser.add_argument('--manifest', default='seed.json')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--metrics-token', help='METRICS_TOKEN of the server, if set.')
+    parser.add_argument('--baseline', help='Compare the run with this saved result.')
+    parser.add_argument('--save-baseline', help='Save the result of this run as a baseline.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding='utf-8') as f:
+        manifest = json.load(f)
+    result = run_load(args.base_url.rstrip('/'), manifest, args.concurrency, args.duration,
+                      seed=args.seed, metrics_token=args.metrics_token)
+    print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f'\nBaseline saved to {args.save_baseline}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
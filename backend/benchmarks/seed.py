@@ -0,0 +1,206 @@
+"""Bulk-generates a realistic data set for load tests.
+
+Run from the backend directory (DATABASE_URL selects SQLite or Postgres):
+
+    python -m benchmarks.seed --users 1000 --wgs 250 --manifest seed.json
+
+Every generated user has the password ``benchmark``. The manifest lists the
+logins, WGs and object ids that ``benchmarks.load`` replays requests against.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from extensions import db, bcrypt
+from models.types import new_id
+
+PASSWORD = 'benchmark'
+BATCH_SIZE = 5000
+# Ids per WG written to the manifest; the load driver does not need all of them
+MANIFEST_SAMPLE = 50
+
+TASK_TITLES = ['Kitchen', 'Bathroom', 'Trash', 'Vacuum', 'Windows', 'Plants', 'Laundry', 'Hallway']
+ITEM_TITLES = ['Milk', 'Bread', 'Eggs', 'Coffee', 'Rice', 'Pasta', 'Apples', 'Soap', 'Tomatoes']
+COST_TITLES = ['Rent', 'Internet', 'Electricity', 'Groceries', 'Cleaning supplies', 'Furniture']
+
+
+class Writer:
+    """Buffers rows per table and writes them with executemany."""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, table_name, row):
+        buffer = self.buffers.setdefault(table_name, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Tables are flushed in dependency order so parents always exist first
+        for name in (t.name for t in db.metadata.sorted_tables):
+            rows = self.buffers.get(name)
+            if rows:
+                self.conn.execute(db.metadata.tables[name].insert(), rows)
+                self.counts[name] = self.counts.get(name, 0) + len(rows)
+                self.buffers[name] = []
+
+
+def seed(conn, users=1000, wgs=250, members=(2, 6), lists=3, tasks=20, items=15,
+         budgets=2, costs=10, prefix='bench', rng=None):
+    rng = rng or random.Random(0)
+    now = datetime.utcnow()
+    password_hash = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+    writer = Writer(conn)
+    manifest = {'password': PASSWORD, 'users': [], 'wgs': []}
+
+    user_ids, usernames = [], []
+    for n in range(users):
+        user_id, username = new_id(), f'{prefix}_user_{n}'
+        user_ids.append(user_id)
+        usernames.append(username)
+        writer.add('USERS', {
+            'idUser': user_id, 'strUser': username, 'strPassword': password_hash,
+            'strEmail': f'{username}@example.com', 'created_at': now, 'strHomePage': '/',
+        })
+    writer.flush()
+
+    for w in range(wgs):
+        # Membership is skewed: a fifth of the seats go to the first tenth of the
+        # users, who therefore live in several WGs
+        size = min(rng.randint(*members), users)
+        member_idx = set()
+        while len(member_idx) < size:
+            popular = rng.random() < 0.2
+            member_idx.add(rng.randrange(max(users // 10, 1)) if popular else rng.randrange(users))
+        member_idx = sorted(member_idx)
+        member_ids = [user_ids[i] for i in member_idx]
+        creator_id = member_ids[0]
+        admin_ids = [creator_id] + [m for m in member_ids[1:] if rng.random() < 0.25]
+
+        wg_id = new_id()
+        writer.add('WG', {
+            'idWG': wg_id, 'title': f'{prefix} WG {w}', 'address': f'{prefix} Street {w}',
+            'etage': str(w % 6), 'description': 'Generated for load tests',
+            'is_public': rng.random() < 0.5, 'creator_id': creator_id,
+        })
+        for user_id in member_ids:
+            writer.add('user_wg', {'user_id': user_id, 'wg_id': wg_id})
+        for user_id in admin_ids:
+            writer.add('admin_wg', {'user_id': user_id, 'wg_id': wg_id})
+
+        assigned = {user_id: [] for user_id in member_ids}
+        item_ids, budget_ids = [], []
+        for _ in range(lists):
+            tasklist_id = new_id()
+            writer.add('TASKLIST', {
+                'idTaskList': tasklist_id, 'title': rng.choice(TASK_TITLES) + ' plan',
+                'description': None, 'date': now, 'is_checked': False, 'wg_id': wg_id,
+            })
+            for user_id in member_ids:
+                writer.add('user_tasklist', {'user_id': user_id, 'tasklist_id': tasklist_id})
+            for _ in range(tasks):
+                task_id = new_id()
+                start = now + timedelta(days=rng.randint(-30, 30))
+                writer.add('TASK', {
+                    'idTask': task_id, 'title': rng.choice(TASK_TITLES), 'description': None,
+                    'start_date': start, 'end_date': start + timedelta(hours=rng.randint(1, 72)),
+                    'is_done': rng.random() < 0.4, 'is_template': False, 'tasklist_id': tasklist_id,
+                })
+                user_id = rng.choice(member_ids)
+                writer.add('user_task', {'user_id': user_id, 'task_id': task_id})
+                assigned[user_id].append(task_id)
+
+            shoppinglist_id = new_id()
+            writer.add('SHOPPINGLIST', {
+                'idShoppingList': shoppinglist_id, 'title': 'Groceries', 'description': None,
+                'date': now, 'is_checked': False, 'creator_id': rng.choice(member_ids), 'wg_id': wg_id,
+            })
+            for user_id in member_ids:
+                writer.add('user_shoppinglist', {'user_id': user_id, 'shoppinglist_id': shoppinglist_id})
+            for _ in range(items):
+                item_id = new_id()
+                item_ids.append(item_id)
+                writer.add('ITEM', {
+                    'idItem': item_id, 'title': rng.choice(ITEM_TITLES), 'description': None,
+                    'is_checked': rng.random() < 0.3, 'shoppinglist_id': shoppinglist_id,
+                })
+                writer.add('user_item', {'user_id': rng.choice(member_ids), 'item_id': item_id})
+
+        for _ in range(budgets):
+            budget_id = new_id()
+            budget_ids.append(budget_id)
+            goals = [round(rng.uniform(5, 500), 2) for _ in range(costs)]
+            writer.add('BUDGETPLANNING', {
+                'idBudgetPlanning': budget_id, 'title': 'Monthly budget', 'description': None,
+                'created_date': now, 'goal': sum(goals), 'deadline': now + timedelta(days=30),
+                'creator_id': creator_id, 'wg_id': wg_id,
+            })
+            for user_id in member_ids:
+                writer.add('user_budgetplanning', {'user_id': user_id, 'budgetplanning_id': budget_id})
+            for goal in goals:
+                cost_id = new_id()
+                writer.add('COST', {
+                    'idCost': cost_id, 'title': rng.choice(COST_TITLES), 'description': None,
+                    'goal': goal, 'paid': 0.0, 'budgetplanning_id': budget_id,
+                })
+                for user_id in rng.sample(member_ids, min(2, len(member_ids))):
+                    writer.add('user_cost', {'user_id': user_id, 'cost_id': cost_id})
+
+        manifest['wgs'].append({
+            'id': wg_id,
+            'item_ids': item_ids[:MANIFEST_SAMPLE],
+            'budgetplanning_ids': budget_ids,
+        })
+        for user_id, i in zip(member_ids, member_idx):
+            manifest['users'].append({
+                'username': usernames[i],
+                'wg_id': wg_id,
+                'admin': user_id in admin_ids,
+                'task_ids': assigned[user_id][:MANIFEST_SAMPLE],
+            })
+
+    writer.flush()
+    return writer.counts, manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--wgs', type=int, default=250)
+    parser.add_argument('--lists', type=int, default=3, help='Task lists and shopping lists per WG.')
+    parser.add_argument('--tasks', type=int, default=20, help='Tasks per task list.')
+    parser.add_argument('--items', type=int, default=15, help='Items per shopping list.')
+    parser.add_argument('--budgets', type=int, default=2, help='Budget plans per WG.')
+    parser.add_argument('--costs', type=int, default=10, help='Costs per budget plan.')
+    parser.add_argument('--prefix', default='bench', help='Prefix for usernames and WG titles.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--manifest', default='seed.json')
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            counts, manifest = seed(
+                conn, users=args.users, wgs=args.wgs, lists=args.lists, tasks=args.tasks,
+                items=args.items, budgets=args.budgets, costs=args.costs,
+                prefix=args.prefix, rng=random.Random(args.seed),
+            )
+        elapsed = time.perf_counter() - started
+
+    with open(args.manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    print(f'Inserted {sum(counts.values())} rows in {elapsed:.2f}s, manifest written to {args.manifest}')
+    for name, count in counts.items():
+        print(f'  {name:<22} {count:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,30 @@
 from sqlite3 import IntegrityError
 from flask import Blueprint, request, jsonify, current_app, session
 from decorators import token_required
+from validation import validate_json, object_schema
 from models import User
 from extensions import db, bcrypt
+from metrics import BCRYPT_DURATION
 import jwt
 from datetime import datetime, timedelta
 
 auth_bp = Blueprint('auth_bp', __name__)
 
+# Missing credentials are still answered by the views themselves (401 on login)
+LOGIN_SCHEMA = object_schema({
+    'identifier': {'type': 'string'},
+    'password': {'type': 'string'},
+})
+
+REGISTER_SCHEMA = object_schema({
+    'username': {'type': 'string', 'minLength': 1, 'maxLength': 80},
+    'email': {'type': 'string', 'minLength': 1, 'maxLength': 128},
+    'password': {'type': 'string', 'minLength': 1},
+}, required=['username', 'email', 'password'])
+
 
 @auth_bp.route('/login', methods=['POST'])
+@validate_json(LOGIN_SCHEMA)
 def login():
     """
     User login (username or email)
@@ -67,7 +82,11 @@ def login():
         (User.strUser == identifier) | (User.strEmail == identifier)
     ).first()
 
-    if not user or not bcrypt.check_password_hash(user.strPassword, password):
+    password_ok = False
+    if user:
+        with BCRYPT_DURATION.labels('check').time():
+            password_ok = bcrypt.check_password_hash(user.strPassword, password)
+    if not password_ok:
         return jsonify({"message": "Unable to verify"}), 403
 
     token = jwt.encode({
@@ -81,6 +100,7 @@ def login():
 
 
 @auth_bp.route('/register', methods=['POST'])
+@validate_json(REGISTER_SCHEMA)
 def register():
     """
     User registration
@@ -138,7 +158,8 @@ def register():
     if User.query.filter_by(strEmail=email).first():
         return jsonify({"message": "Email already exists"}), 409
 
-    hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
+    with BCRYPT_DURATION.labels('hash').time():
+        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
 
     new_user = User(
         strUser=username,
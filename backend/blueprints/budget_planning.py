@@ -1,12 +1,35 @@
 from flask import Blueprint, request, jsonify, g
+from sqlalchemy.orm import joinedload, selectinload
 from extensions import db
 from models import BudgetPlanning, Cost, WG, User
 from decorators import token_required
+from idempotency import idempotent
+from response_cache import cached_response
+from validation import validate_json, object_schema, ID, ID_LIST, TITLE, TEXT, DATE, AMOUNT
 from datetime import datetime
 from blueprints.cost import update_budgetplanning_goal
 
 budget_planning_bp = Blueprint('budget_planning_bp', __name__)
 
+BUDGETPLANNING_PROPERTIES = {
+    'wg_id': ID,
+    'title': TITLE,
+    'description': TEXT,
+    'goal': AMOUNT,
+    'deadline': DATE,
+}
+CREATE_BUDGETPLANNING_SCHEMA = object_schema(BUDGETPLANNING_PROPERTIES, required=['title', 'wg_id'])
+UPDATE_BUDGETPLANNING_SCHEMA = object_schema(BUDGETPLANNING_PROPERTIES)
+
+ADD_COST_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+    'goal': AMOUNT,
+    'user_ids': ID_LIST,
+}, required=['title'])
+
+CHECK_COST_SCHEMA = object_schema({'cost_id': ID, 'paid': AMOUNT}, required=['cost_id'])
+
 def is_user_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
     return wg and user in wg.users
@@ -15,6 +38,14 @@ def is_admin_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
     return wg and (user in wg.admins or g.current_user == wg.creator)
 
+# Loader options that fetch everything serialize_budgetplanning reads with a
+# fixed number of statements, however many costs the plan has
+BUDGETPLANNING_LOAD_OPTIONS = (
+    joinedload(BudgetPlanning.creator),
+    selectinload(BudgetPlanning.users),
+    selectinload(BudgetPlanning.costs).selectinload(Cost.users),
+)
+
 def serialize_budgetplanning(bp):
     return {
         'id': bp.idBudgetPlanning,
@@ -39,7 +70,9 @@ def serialize_budgetplanning(bp):
     }
 
 @budget_planning_bp.route('/budgetplanning', methods=['POST'])
+@validate_json(CREATE_BUDGETPLANNING_SCHEMA)
 @token_required
+@idempotent
 def create_budget_planning():
     """
     Create a new budget planning.
@@ -110,6 +143,7 @@ def create_budget_planning():
 
 @budget_planning_bp.route('/budgetplanning/<string:budgetplanning_id>', methods=['GET'])
 @token_required
+@cached_response(BudgetPlanning)
 def get_budget_planning(budgetplanning_id):
     """
     Get a specific budget planning by ID
@@ -132,7 +166,7 @@ def get_budget_planning(budgetplanning_id):
       404:
         description: Budget planning not found
     """
-    bp = BudgetPlanning.query.get(budgetplanning_id)
+    bp = BudgetPlanning.query.options(*BUDGETPLANNING_LOAD_OPTIONS).get(budgetplanning_id)
     if not bp:
         return jsonify({'message': 'Budget planning not found'}), 404
     
@@ -142,6 +176,7 @@ def get_budget_planning(budgetplanning_id):
     return jsonify(serialize_budgetplanning(bp)), 200
 
 @budget_planning_bp.route('/budgetplanning/<string:budgetplanning_id>', methods=['PUT'])
+@validate_json(UPDATE_BUDGETPLANNING_SCHEMA)
 @token_required
 def update_budget_planning(budgetplanning_id):
     """
@@ -240,7 +275,9 @@ def delete_budget_planning(budgetplanning_id):
     return jsonify({'message': 'Budget planning deleted successfully'}), 204
 
 @budget_planning_bp.route('/budgetplanning/<string:budgetplanning_id>/add_cost', methods=['POST'])
+@validate_json(ADD_COST_SCHEMA)
 @token_required
+@idempotent
 def add_cost(budgetplanning_id):
     """
     Add a cost to a budget planning
@@ -293,11 +330,12 @@ def add_cost(budgetplanning_id):
         users=users
     )
     db.session.add(new_cost)
-    update_budgetplanning_goal(data['budgetplanning_id'])
+    update_budgetplanning_goal(budgetplanning_id)
     db.session.commit()
     return jsonify({'id': new_cost.idCost, 'title': new_cost.title}), 201
 
 @budget_planning_bp.route('/budgetplanning/<string:budgetplanning_id>/check_cost', methods=['POST'])
+@validate_json(CHECK_COST_SCHEMA)
 @token_required
 def check_cost(budgetplanning_id):
     """
@@ -0,0 +1,224 @@
+import hashlib
+import secrets
+from datetime import timezone
+
+from flask import Blueprint, Response, jsonify, request, g, stream_with_context, url_for
+from extensions import db
+from decorators import token_required
+from idempotency import idempotent
+from validation import validate_json, object_schema
+from database.streaming import iter_rows
+from models import WG, FeedToken, user_wg
+import calendar_feed
+import shards
+
+calendar_bp = Blueprint('calendar_bp', __name__)
+
+CREATE_FEED_SCHEMA = object_schema({
+    'wg_id': {'type': ['string', 'null']},
+})
+
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def serialize_feed(feed):
+    return {'id': feed.idFeedToken, 'wg_id': feed.wg_id, 'created_at': feed.created_at}
+
+
+@calendar_bp.route('/calendar/feeds', methods=['POST'])
+@validate_json(CREATE_FEED_SCHEMA)
+@token_required
+@idempotent
+def create_feed():
+    """
+    Create a calendar feed of your tasks, or of all tasks of a WG
+    ---
+    tags:
+      - Calendar
+    security:
+      - BearerAuth: []
+    requestBody:
+      content:
+        application/json:
+          schema:
+            type: object
+            properties:
+              wg_id:
+                type: string
+                description: WG whose tasks the feed shows; without it, the feed shows your tasks in all your WGs
+    responses:
+      201:
+        description: The feed URL to subscribe to; it is only shown once and works until the feed is deleted
+        content:
+          application/json:
+            example: {"feed": {"id": "...", "wg_id": null, "created_at": "..."}, "url": "https://.../calendar/....ics"}
+      403:
+        description: Not authorized
+      404:
+        description: WG not found
+    """
+    wg_id = (request.get_json(silent=True) or {}).get('wg_id')
+    if wg_id is not None:
+        wg = WG.query.get(wg_id)
+        if not wg:
+            return jsonify({'message': 'WG not found'}), 404
+        if g.current_user not in wg.users:
+            return jsonify({'message': 'Not authorized'}), 403
+
+    token = secrets.token_urlsafe(32)
+    feed = FeedToken(token_hash=_hash_token(token), user_id=g.current_user.idUser, wg_id=wg_id)
+    db.session.add(feed)
+    db.session.commit()
+    return jsonify({
+        'feed': serialize_feed(feed),
+        'url': url_for('calendar_bp.get_feed', token=token, _external=True),
+    }), 201
+
+
+@calendar_bp.route('/calendar/feeds', methods=['GET'])
+@token_required
+def get_feeds():
+    """
+    List your calendar feeds
+    ---
+    tags:
+      - Calendar
+    security:
+      - BearerAuth: []
+    responses:
+      200:
+        description: Your feeds, without their URLs
+    """
+    feeds = FeedToken.query.filter_by(user_id=g.current_user.idUser).order_by(FeedToken.created_at)
+    return jsonify({'feeds': [serialize_feed(feed) for feed in feeds]}), 200
+
+
+@calendar_bp.route('/calendar/feeds/<string:feed_id>', methods=['DELETE'])
+@token_required
+def delete_feed(feed_id):
+    """
+    Delete a calendar feed; its URL stops working at once
+    ---
+    tags:
+      - Calendar
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: feed_id
+        in: path
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: Feed deleted
+      404:
+        description: Feed not found
+    """
+    feed = FeedToken.query.get(feed_id)
+    if not feed or feed.user_id != g.current_user.idUser:
+        return jsonify({'message': 'Feed not found'}), 404
+    db.session.delete(feed)
+    db.session.commit()
+    return jsonify({'message': 'Feed deleted'}), 200
+
+
+def _feed_wgs(feed):
+    """(id, title, tasks_version, tasks_changed_at) of the WGs a feed covers."""
+    query = (db.select(WG.idWG, WG.title, WG.tasks_version, WG.tasks_changed_at)
+             .join(user_wg, db.and_(user_wg.c.wg_id == WG.idWG, user_wg.c.user_id == feed.user_id))
+             .order_by(WG.idWG))
+    if feed.wg_id is not None:
+        query = query.where(WG.idWG == feed.wg_id)
+    wgs = [tuple(row) for row in db.session.execute(query)]
+    if not shards.enabled():
+        return wgs
+    # The triggers count the task changes of a WG in its copy on its shard
+    versions = {}
+    for name, ids in shards.group_by_shard([wg[0] for wg in wgs]).items():
+        if name != shards.MAIN:
+            with shards.shard_engine(name).connect() as conn:
+                versions.update((wg_id, (version, changed_at)) for wg_id, version, changed_at in conn.execute(
+                    db.select(WG.idWG, WG.tasks_version, WG.tasks_changed_at).where(WG.idWG.in_(ids))))
+    return [(wg_id, title, *versions.get(wg_id, rest)) for wg_id, title, *rest in wgs]
+
+
+def _iter_feed_rows(wg_ids, start, end, user_id=None):
+    """The rows of feed_query, from the shard of each WG."""
+    groups = shards.group_by_shard(wg_ids) if shards.enabled() else {shards.MAIN: wg_ids}
+    for name, ids in groups.items():
+        with shards.shard_engine(name).connect() as conn:
+            yield from iter_rows(conn, calendar_feed.feed_query(ids, start, end, user_id=user_id))
+
+
+def _not_modified(etag, modified):
+    # If-Modified-Since only counts without If-None-Match (RFC 9110, 13.1.3)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+@calendar_bp.route('/calendar/<string:token>.ics', methods=['GET'])
+def get_feed(token):
+    """
+    iCalendar feed for calendar apps, authenticated by the token in its URL
+    ---
+    tags:
+      - Calendar
+    parameters:
+      - name: token
+        in: path
+        required: true
+        schema:
+          type: string
+      - name: If-None-Match
+        in: header
+        schema:
+          type: string
+      - name: If-Modified-Since
+        in: header
+        schema:
+          type: string
+    responses:
+      200:
+        description: Tasks from 30 days ago to a year ahead, as text/calendar
+      304:
+        description: The feed has not changed
+      403:
+        description: The feed's owner is no longer a member of its WG
+      404:
+        description: Feed not found or deleted
+    """
+    feed = FeedToken.query.filter_by(token_hash=_hash_token(token)).first()
+    if not feed:
+        return jsonify({'message': 'Feed not found'}), 404
+
+    wgs = _feed_wgs(feed)
+    if feed.wg_id is not None and not wgs:
+        return jsonify({'message': 'Not authorized'}), 403
+
+    start, end = calendar_feed.feed_window()
+    kind = 'wg' if feed.wg_id is not None else 'user'
+    etag = calendar_feed.feed_etag(kind, feed.user_id, wgs, start)
+    modified = calendar_feed.last_modified(wgs, start)
+    headers = {'Cache-Control': 'private, no-cache'}
+    if _not_modified(etag, modified):
+        response = Response(status=304, headers=headers)
+    else:
+        if feed.wg_id is not None:
+            name, wg_titles = wgs[0][1], None
+            rows = _iter_feed_rows([feed.wg_id], start, end)
+        else:
+            name, wg_titles = 'WG tasks', {wg_id: title for wg_id, title, _, _ in wgs}
+            rows = _iter_feed_rows(list(wg_titles), start, end, user_id=feed.user_id)
+
+        def generate():
+            yield from calendar_feed.iter_ics(name, rows, modified, wg_titles)
+
+        response = Response(stream_with_context(generate()), mimetype='text/calendar', headers=headers)
+    response.set_etag(etag)
+    response.last_modified = modified.replace(tzinfo=timezone.utc)
+    return response
@@ -2,9 +2,19 @@ from flask import Blueprint, request, jsonify, g
 from extensions import db
 from models import Cost, BudgetPlanning, User, WG
 from decorators import token_required
+from validation import validate_json, object_schema, ID_LIST, TITLE, TEXT, AMOUNT
+from concurrency import version_mismatch, with_etag
 
 cost_bp = Blueprint('cost_bp', __name__)
 
+UPDATE_COST_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+    'goal': AMOUNT,
+    'paid': AMOUNT,
+    'user_ids': ID_LIST,
+})
+
 def is_user_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
     return wg and user in wg.users
@@ -17,6 +27,7 @@ def serialize_cost(cost):
         'goal': cost.goal,
         'paid': cost.paid,
         'budgetplanning_id': cost.budgetplanning_id,
+        'version': cost.version,
         'users': [{'id': u.idUser, 'name': u.strUser} for u in cost.users]
     }
 
@@ -32,6 +43,7 @@ def update_budgetplanning_goal(budgetplanning_id):
         return True
     return False
 @cost_bp.route('/cost/<string:cost_id>', methods=['PUT'])
+@validate_json(UPDATE_COST_SCHEMA)
 @token_required
 def update_cost(cost_id):
     """
@@ -114,12 +126,19 @@ def update_cost(cost_id):
         description: Not authorized
       404:
         description: Cost not found
+      409:
+        description: The cost was changed concurrently
+      412:
+        description: If-Match does not name the cost's current version
     """
     cost_updated = False
     cost = Cost.query.get_or_404(cost_id)
     bp = BudgetPlanning.query.get(cost.budgetplanning_id)
     if not bp or not is_user_of_wg(g.current_user, bp.wg_id):
         return jsonify({'message': 'Not authorized'}), 403
+    mismatch = version_mismatch(cost)
+    if mismatch:
+        return mismatch
     data = request.get_json()
     if 'goal' in data and data['goal'] != cost.goal:
         cost.goal = data['goal']
@@ -137,7 +156,7 @@ def update_cost(cost_id):
     if cost_updated:
         update_budgetplanning_goal(cost.budgetplanning_id)
     db.session.commit()
-    return jsonify(serialize_cost(cost)), 200
+    return with_etag(serialize_cost(cost), cost)
 
 @cost_bp.route('/cost/<string:cost_id>', methods=['DELETE'])
 @token_required
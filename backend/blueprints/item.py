@@ -2,9 +2,27 @@ from flask import Blueprint, request, jsonify, g
 from extensions import db
 from models import Item, ShoppingList, WG
 from decorators import token_required
+from idempotency import idempotent
+from validation import validate_json, object_schema, ID, TITLE, TEXT, BOOLEAN
+from concurrency import version_mismatch, with_etag
+from blueprints.shopping_list import refresh_shoppinglist_checked
 
 item_bp = Blueprint('item_bp', __name__)
 
+CREATE_ITEM_SCHEMA = object_schema({
+    'shoppinglist_id': ID,
+    'title': TITLE,
+    'description': TEXT,
+}, required=['shoppinglist_id', 'title'])
+
+UPDATE_ITEM_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+    'is_checked': BOOLEAN,
+})
+
+SET_CHECKED_SCHEMA = object_schema({'is_checked': BOOLEAN}, required=['is_checked'])
+
 def is_user_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
     return wg and user in wg.users
@@ -15,11 +33,14 @@ def serialize_item(item):
         'title': item.title,
         'description': item.description,
         'is_checked': item.is_checked,
-        'shoppinglist_id': item.shoppinglist_id
+        'shoppinglist_id': item.shoppinglist_id,
+        'version': item.version
     }
 
 @item_bp.route('/item', methods=['POST'])
+@validate_json(CREATE_ITEM_SCHEMA)
 @token_required
+@idempotent
 def create_item():
     """
     Create a new item
@@ -88,6 +109,7 @@ def create_item():
     return jsonify(serialize_item(new_item)), 201
 
 @item_bp.route('/item/<string:item_id>', methods=['PUT'])
+@validate_json(UPDATE_ITEM_SCHEMA)
 @token_required
 def update_item(item_id):
     """
@@ -144,21 +166,31 @@ def update_item(item_id):
                 shoppinglist_id:
                   type: integer
                   description: The ID of the parent Shopping List.
+                version:
+                  type: integer
+                  description: Incremented by every change; send it as If-Match to update only that version.
       403:
         description: Not authorized (e.g., user is not part of the shopping list's workgroup)
       404:
         description: Item not found
+      409:
+        description: The item was changed concurrently
+      412:
+        description: If-Match does not name the item's current version
     """
     item = Item.query.get_or_404(item_id)
     shopping_list = ShoppingList.query.get(item.shoppinglist_id)
     if not shopping_list or not is_user_of_wg(g.current_user, shopping_list.wg_id):
         return jsonify({'message': 'Not authorized'}), 403
+    mismatch = version_mismatch(item)
+    if mismatch:
+        return mismatch
     data = request.get_json()
     item.title = data.get('title', item.title)
     item.description = data.get('description', item.description)
     item.is_checked = data.get('is_checked', item.is_checked)
     db.session.commit()
-    return jsonify(serialize_item(item)), 200
+    return with_etag(serialize_item(item), item)
 
 @item_bp.route('/item/<string:item_id>', methods=['DELETE'])
 @token_required
@@ -192,11 +224,30 @@ def delete_item(item_id):
     db.session.commit()
     return jsonify({'message': 'Item deleted successfully'}), 204
 
+def _item_for_state_change(item_id):
+    item = Item.query.get(item_id)
+    if not item:
+        return None, (jsonify({'message': 'Item not found'}), 404)
+    shopping_list = ShoppingList.query.get(item.shoppinglist_id)
+    if not shopping_list or not is_user_of_wg(g.current_user, shopping_list.wg_id):
+        return None, (jsonify({'message': 'Not authorized'}), 403)
+    return item, version_mismatch(item)
+
+
+def set_item_checked(item, is_checked):
+    if item.is_checked != is_checked:
+        item.is_checked = is_checked
+        # UPDATE ... WHERE version = :v; a concurrent change fails it
+        db.session.flush()
+        refresh_shoppinglist_checked(item.shoppinglist_id)
+    db.session.commit()
+
+
 @item_bp.route('/item/<string:item_id>/check', methods=['PUT'])
 @token_required
 def check_item(item_id):
     """
-    Check/uncheck an item
+    Toggle whether an item is checked; prefer PUT /item/{item_id}/checked, which is safe to retry
     ---
     tags:
       - Item
@@ -215,17 +266,61 @@ def check_item(item_id):
         description: Not authorized
       404:
         description: Item not found
+      409:
+        description: The item was changed concurrently, e.g. toggled by someone else
+      412:
+        description: If-Match does not name the item's current version
     """
-    item = Item.query.get_or_404(item_id)
-    shopping_list = ShoppingList.query.get(item.shoppinglist_id)
-    if not shopping_list or not is_user_of_wg(g.current_user, shopping_list.wg_id):
-        return jsonify({'message': 'Not authorized'}), 403
-    
-    item.is_checked = not item.is_checked
-    
-    # Check if all items in the list are now checked
-    all_items_checked = all(i.is_checked for i in shopping_list.items)
-    shopping_list.is_checked = all_items_checked
-    
-    db.session.commit()
-    return jsonify(serialize_item(item)), 200
\ No newline at end of file
+    item, error = _item_for_state_change(item_id)
+    if error:
+        return error
+
+    set_item_checked(item, not item.is_checked)
+    return with_etag(serialize_item(item), item)
+
+
+@item_bp.route('/item/<string:item_id>/checked', methods=['PUT'])
+@validate_json(SET_CHECKED_SCHEMA)
+@token_required
+def set_item_checked_state(item_id):
+    """
+    Check or uncheck an item; repeating the request changes nothing
+    ---
+    tags:
+      - Item
+    security:
+      - Bearer: []
+    parameters:
+      - name: item_id
+        in: path
+        required: true
+        schema:
+          type: string
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            required: [is_checked]
+            properties:
+              is_checked:
+                type: boolean
+    responses:
+      200:
+        description: The item in its new state
+      403:
+        description: Not authorized
+      404:
+        description: Item not found
+      409:
+        description: The item was changed concurrently
+      412:
+        description: If-Match does not name the item's current version
+    """
+    item, error = _item_for_state_change(item_id)
+    if error:
+        return error
+
+    set_item_checked(item, request.get_json()['is_checked'])
+    return with_etag(serialize_item(item), item)
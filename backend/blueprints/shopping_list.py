@@ -1,10 +1,28 @@
 from flask import Blueprint, request, jsonify, g
+from sqlalchemy.orm import joinedload, selectinload
 from extensions import db
 from models import ShoppingList, Item, User, WG
 from decorators import token_required
+from idempotency import idempotent
+from response_cache import cached_response
+from validation import validate_json, object_schema, ID, TITLE, TEXT, BOOLEAN
+from concurrency import version_mismatch, with_etag
 
 shopping_list_bp = Blueprint('shopping_list_bp', __name__)
 
+CREATE_SHOPPINGLIST_SCHEMA = object_schema({
+    'wg_id': ID,
+    'title': TITLE,
+    'description': TEXT,
+}, required=['wg_id', 'title'])
+
+UPDATE_SHOPPINGLIST_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+})
+
+SET_CHECKED_SCHEMA = object_schema({'is_checked': BOOLEAN}, required=['is_checked'])
+
 def is_user_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
     return wg and user in wg.users
@@ -14,6 +32,13 @@ def is_admin_of_wg(user, wg_id):
     return wg and (user in wg.admins or g.current_user.idUser == wg.creator_id)
 
 
+# Loader options that fetch everything serialize_shoppinglist reads up front
+SHOPPINGLIST_LOAD_OPTIONS = (
+    joinedload(ShoppingList.creator),
+    selectinload(ShoppingList.items),
+)
+
+
 def serialize_shoppinglist(shoppinglist):
     return {
         'id': shoppinglist.idShoppingList,
@@ -23,19 +48,23 @@ def serialize_shoppinglist(shoppinglist):
         'is_checked':shoppinglist.is_checked,
         'creator': {'id': shoppinglist.creator_id, 'name': shoppinglist.creator.strUser if shoppinglist.creator else None},
         'wg_id': shoppinglist.wg_id,
+        'version': shoppinglist.version,
         'items': [
             {
                 'id': item.idItem,
                 'title': item.title,
                 'description': item.description,
-                'is_checked': item.is_checked
+                'is_checked': item.is_checked,
+                'version': item.version
             } for item in shoppinglist.items
         ]
     }
 
 
 @shopping_list_bp.route('/shoppinglist', methods=['POST'])
+@validate_json(CREATE_SHOPPINGLIST_SCHEMA)
 @token_required
+@idempotent
 def create_shopping_list():
     """
     Create a new shopping list
@@ -112,6 +141,7 @@ def create_shopping_list():
 
 @shopping_list_bp.route('/shoppinglist/<string:shoppinglist_id>', methods=['GET'])
 @token_required
+@cached_response(ShoppingList)
 def get_shopping_list(shoppinglist_id):
     """
     Get a specific shopping list by ID
@@ -134,7 +164,7 @@ def get_shopping_list(shoppinglist_id):
       404:
         description: Shopping list not found
     """
-    shopping_list = ShoppingList.query.get(shoppinglist_id)
+    shopping_list = ShoppingList.query.options(*SHOPPINGLIST_LOAD_OPTIONS).get(shoppinglist_id)
     if not shopping_list:
         return jsonify({'message': 'Shopping list not found'}), 404
     if not is_user_of_wg(g.current_user, shopping_list.wg_id):
@@ -177,6 +207,7 @@ def delete_shopping_list(shoppinglist_id):
     return jsonify({'message': 'Shopping list deleted successfully'}), 204
 
 @shopping_list_bp.route('/shoppinglist/<string:shoppinglist_id>', methods=['PUT'])
+@validate_json(UPDATE_SHOPPINGLIST_SCHEMA)
 @token_required
 def update_shopping_list(shoppinglist_id):
     """
@@ -208,21 +239,63 @@ def update_shopping_list(shoppinglist_id):
         description: Shopping list updated
       403:
         description: Not authorized
+      409:
+        description: The shopping list was changed concurrently
+      412:
+        description: If-Match does not name the shopping list's current version
     """
     shopping_list = ShoppingList.query.get(shoppinglist_id)
     if not shopping_list or not is_user_of_wg(g.current_user, shopping_list.wg_id):
         return jsonify({'message': 'Not authorized'}), 403
+    mismatch = version_mismatch(shopping_list)
+    if mismatch:
+        return mismatch
     data = request.get_json()
     shopping_list.title = data.get('title', shopping_list.title)
     shopping_list.description = data.get('description', shopping_list.description)
     db.session.commit()
-    return jsonify(serialize_shoppinglist(shopping_list)), 200
+    return with_etag(serialize_shoppinglist(shopping_list), shopping_list)
+
+def refresh_shoppinglist_checked(shoppinglist_id):
+    """Sets SHOPPINGLIST.is_checked to whether all of its items are checked.
+
+    Like a task list's flag it follows from the items, in one statement and
+    without bumping the list's version.
+    """
+    shoppinglist = ShoppingList.__table__
+    unchecked = db.exists().where(Item.shoppinglist_id == shoppinglist_id, Item.is_checked == False)
+    db.session.execute(shoppinglist.update().where(shoppinglist.c.idShoppingList == shoppinglist_id)
+                       .values(is_checked=~unchecked))
+
+
+def _shopping_list_for_state_change(shoppinglist_id):
+    shopping_list = ShoppingList.query.get(shoppinglist_id)
+    if not shopping_list:
+        return None, (jsonify({'message': 'Shopping list not found'}), 404)
+    if not is_user_of_wg(g.current_user, shopping_list.wg_id):
+        return None, (jsonify({'message': 'Not authorized'}), 403)
+    return shopping_list, version_mismatch(shopping_list)
+
+
+def set_shopping_list_checked(shopping_list, is_checked):
+    if shopping_list.is_checked != is_checked:
+        shopping_list.is_checked = is_checked
+        db.session.flush()
+        if is_checked:
+            # Checking the list checks all of its items, each of which changes
+            items = Item.__table__
+            db.session.execute(items.update()
+                               .where(items.c.shoppinglist_id == shopping_list.idShoppingList,
+                                      items.c.is_checked == False)
+                               .values(is_checked=True, version=items.c.version + 1))
+    db.session.commit()
+
 
 @shopping_list_bp.route('/shoppinglist/<string:shoppinglist_id>/check', methods=['PUT'])
 @token_required
 def check_shopping_list(shoppinglist_id):
     """
-    Check/uncheck a shopping list
+    Toggle whether a shopping list is checked; prefer PUT /shoppinglist/{shoppinglist_id}/checked, which is safe to retry
     ---
     tags:
       - ShoppingList
@@ -241,20 +314,63 @@ def check_shopping_list(shoppinglist_id):
         description: Not authorized
       404:
         description: Shopping list not found
+      409:
+        description: The shopping list was changed concurrently
+      412:
+        description: If-Match does not name the shopping list's current version
     """
-    shopping_list = ShoppingList.query.get(shoppinglist_id)
-    if not shopping_list:
-        return jsonify({'message': 'Shopping list not found'}), 404
-    if not is_user_of_wg(g.current_user, shopping_list.wg_id):
-        return jsonify({'message': 'Not authorized'}), 403
-    
-    # Toggle the shopping list's checked status
-    shopping_list.is_checked = not shopping_list.is_checked
-    
-    # If the shopping list is now checked, check all items
-    if shopping_list.is_checked:
-        for item in shopping_list.items:
-            item.is_checked = True
-    
-    db.session.commit()
-    return jsonify({'message': 'Shopping list checked successfully'}), 200
+    shopping_list, error = _shopping_list_for_state_change(shoppinglist_id)
+    if error:
+        return error
+
+    # Toggle the shopping list's checked status; checking it checks all items
+    set_shopping_list_checked(shopping_list, not shopping_list.is_checked)
+    return with_etag({'message': 'Shopping list checked successfully'}, shopping_list)
+
+
+@shopping_list_bp.route('/shoppinglist/<string:shoppinglist_id>/checked', methods=['PUT'])
+@validate_json(SET_CHECKED_SCHEMA)
+@token_required
+def set_shopping_list_checked_state(shoppinglist_id):
+    """
+    Check or uncheck a shopping list; checking it checks all of its items. Repeating the request changes nothing.
+    ---
+    tags:
+      - ShoppingList
+    security:
+      - Bearer: []
+    parameters:
+      - name: shoppinglist_id
+        in: path
+        required: true
+        schema:
+          type: string
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            required: [is_checked]
+            properties:
+              is_checked:
+                type: boolean
+    responses:
+      200:
+        description: The shopping list in its new state
+      403:
+        description: Not authorized
+      404:
+        description: Shopping list not found
+      409:
+        description: The shopping list was changed concurrently
+      412:
+        description: If-Match does not name the shopping list's current version
+    """
+    shopping_list, error = _shopping_list_for_state_change(shoppinglist_id)
+    if error:
+        return error
+
+    set_shopping_list_checked(shopping_list, request.get_json()['is_checked'])
+    shopping_list = ShoppingList.query.options(*SHOPPINGLIST_LOAD_OPTIONS).get(shoppinglist_id)
+    return with_etag(serialize_shoppinglist(shopping_list), shopping_list)
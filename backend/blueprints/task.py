@@ -1,8 +1,13 @@
 from flask import Blueprint, request, jsonify, g
+from sqlalchemy.orm import selectinload
 from extensions import db
-from models import Task, TaskList, User, WG, user_task
+from models import Task, TaskList, User, WG, user_task, user_tasklist, user_wg
 from decorators import token_required
+from validation import validate_json, object_schema, ID_LIST, TITLE, TEXT, DATE, BOOLEAN
+from concurrency import version_mismatch, with_etag
+from response_cache import bump_wgs
 from datetime import datetime
+import shards
 
 task_bp = Blueprint('task_bp', __name__)
 
@@ -10,6 +15,9 @@ def is_admin_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
     return wg and (user in wg.admins or user == wg.creator)
 
+# Loader options that fetch everything serialize_task reads in the same round trips
+TASK_LOAD_OPTIONS = (selectinload(Task.users),)
+
 def serialize_task(task):
     return {
         'id': task.idTask,
@@ -19,7 +27,9 @@ def serialize_task(task):
         'end_date': task.end_date,
         'is_done': task.is_done,
         'is_template': task.is_template,
+        'template_id': task.template_id,
         'tasklist_id': task.tasklist_id,
+        'version': task.version,
         'users': [{'id': u.idUser, 'name': u.strUser} for u in task.users]
     }
 
@@ -60,6 +70,10 @@ TASK_SCHEMA = {
             'type': 'integer',
             'description': 'The ID of the parent Task List.'
         },
+        'version': {
+            'type': 'integer',
+            'description': 'Incremented by every change; send it as If-Match to update only that version.'
+        },
         'users': {
             'type': 'array',
             'description': 'List of users assigned to the task.',
@@ -75,6 +89,20 @@ TASK_SCHEMA = {
     }
 }
 
+# Request body schemas, compiled into validators when the module is imported
+UPDATE_TASK_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+    'start_date': DATE,
+    'end_date': DATE,
+    'is_done': BOOLEAN,
+    'user_ids': ID_LIST,
+})
+
+USER_IDS_SCHEMA = object_schema({'user_ids': ID_LIST}, required=['user_ids'])
+
+SET_DONE_SCHEMA = object_schema({'is_done': BOOLEAN}, required=['is_done'])
+
 
 @task_bp.route('/task/<string:task_id>', methods=['GET'])
 @token_required
@@ -105,7 +133,7 @@ def get_task(task_id):
       404:
         description: Task not found
     """
-    task = Task.query.get(task_id)
+    task = Task.query.options(*TASK_LOAD_OPTIONS).get(task_id)
     if not task:
         return jsonify({'message': 'Task not found'}), 404
 
@@ -121,6 +149,7 @@ def get_task(task_id):
 
 
 @task_bp.route('/task/<string:task_id>', methods=['PUT'])
+@validate_json(UPDATE_TASK_SCHEMA)
 @token_required
 def update_task(task_id):
     """
@@ -179,6 +208,10 @@ def update_task(task_id):
         description: Task not found
       400:
         description: Invalid input (e.g., bad date format)
+      409:
+        description: The task was changed concurrently
+      412:
+        description: If-Match does not name the task's current version
       500:
         description: Error updating task users
     """
@@ -186,6 +219,9 @@ def update_task(task_id):
     tasklist = TaskList.query.get(task.tasklist_id)
     if not tasklist or g.current_user not in tasklist.users and not is_admin_of_wg(g.current_user, tasklist.wg_id):
         return jsonify({'message': 'Not authorized'}), 403
+    mismatch = version_mismatch(task)
+    if mismatch:
+        return mismatch
 
     data = request.get_json()
 
@@ -196,17 +232,20 @@ def update_task(task_id):
     # Convert start_date and end_date to datetime objects
     if 'start_date' in data:
         try:
-            task.start_date = datetime.fromisoformat(data['start_date'])
+            task.start_date = datetime.fromisoformat(data['start_date']) if data['start_date'] else None
         except ValueError:
             return jsonify({'message': 'Invalid start_date format. Use ISO 8601 format.'}), 400
 
     if 'end_date' in data:
         try:
-            task.end_date = datetime.fromisoformat(data['end_date'])
+            task.end_date = datetime.fromisoformat(data['end_date']) if data['end_date'] else None
         except ValueError:
             return jsonify({'message': 'Invalid end_date format. Use ISO 8601 format.'}), 400
 
     task.is_done = data.get('is_done', task.is_done)
+    # The conditional UPDATE runs here, so a lost race is a 409 and not a 500
+    # from the user handling below
+    db.session.flush()
 
     # Update assigned users if provided (logic omitted for brevity, docstring is the focus)
     if 'user_ids' in data:
@@ -243,10 +282,9 @@ def update_task(task_id):
             # Add new users to tasklist if they're not already there
             for user_id in added_user_ids:
                 if user_id not in current_tasklist_user_ids:
-                    # Use raw SQL to avoid SQLAlchemy relationship issues
+                    # Core statement to avoid SQLAlchemy relationship issues
                     db.session.execute(
-                        db.text("INSERT INTO user_tasklist (user_id, tasklist_id) VALUES (:user_id, :tasklist_id)"),
-                        {"user_id": user_id, "tasklist_id": tasklist.idTaskList}
+                        user_tasklist.insert().values(user_id=user_id, tasklist_id=tasklist.idTaskList)
                     )
             
             # Check if removed users should be removed from tasklist
@@ -254,27 +292,25 @@ def update_task(task_id):
                 if user_id in current_tasklist_user_ids:
                     # Check if this user is assigned to any other tasks in this tasklist
                     other_tasks_count = db.session.execute(
-                        db.text("""
-                            SELECT COUNT(*) 
-                            FROM user_task ut 
-                            JOIN TASK t ON ut.task_id = t.idTask 
-                            WHERE t.tasklist_id = :tasklist_id 
-                            AND t.idTask != :current_task_id 
-                            AND ut.user_id = :user_id
-                        """),
-                        {
-                            "tasklist_id": tasklist.idTaskList,
-                            "current_task_id": task.idTask,
-                            "user_id": user_id
-                        }
+                        db.select(db.func.count())
+                        .select_from(user_task.join(Task, user_task.c.task_id == Task.idTask))
+                        .where(
+                            Task.tasklist_id == tasklist.idTaskList,
+                            Task.idTask != task.idTask,
+                            user_task.c.user_id == user_id,
+                        )
                     ).scalar()
                     
                     # If user is not assigned to any other task in this tasklist, remove them
                     if other_tasks_count == 0:
                         db.session.execute(
-                            db.text("DELETE FROM user_tasklist WHERE user_id = :user_id AND tasklist_id = :tasklist_id"),
-                            {"user_id": user_id, "tasklist_id": tasklist.idTaskList}
+                            user_tasklist.delete().where(
+                                user_tasklist.c.user_id == user_id,
+                                user_tasklist.c.tasklist_id == tasklist.idTaskList,
+                            )
                         )
+            # The Core statements above do not flush, so the cached responses are invalidated here
+            bump_wgs([tasklist.wg_id])
             
             # Commit all changes
             db.session.commit()
@@ -289,7 +325,7 @@ def update_task(task_id):
 
     # Refresh the task to get updated relationships
     db.session.refresh(task)
-    return jsonify(serialize_task(task)), 200
+    return with_etag(serialize_task(task), task)
 
 @task_bp.route('/task/<string:task_id>', methods=['DELETE'])
 @token_required
@@ -370,10 +406,12 @@ def get_undone_tasks_for_wg(wg_id):
     # query undone tasks for current user within this WG
     tasks = (
         Task.query
+        .options(*TASK_LOAD_OPTIONS)
         .join(TaskList)
         .filter(
             Task.users.contains(g.current_user),
             Task.is_done == False,
+            Task.is_template == False,
             TaskList.wg_id == wg_id
         )
         .all()
@@ -381,11 +419,105 @@ def get_undone_tasks_for_wg(wg_id):
 
     return jsonify([serialize_task(task) for task in tasks]), 200
 
+@task_bp.route('/tasks/undone/me', methods=['GET'])
+@token_required
+def get_my_undone_tasks():
+    """
+    Get the current user's undone tasks in all of their WGs, grouped by WG
+    ---
+    tags:
+      - Task
+    security:
+      - Bearer: []
+    responses:
+      200:
+        description: WGs ordered by title with the user's undone tasks, earliest end date first
+        content:
+          application/json:
+            example:
+              wgs:
+                - id: "..."
+                  title: WG Mitte
+                  tasks: [{"id": "...", "title": "Clean the kitchen", "is_done": false, "users": []}]
+    """
+    user_id = g.current_user.idUser
+    if not shards.enabled():
+        rows = db.session.execute(undone_tasks_query(user_id))
+        return jsonify({'wgs': group_undone_tasks(rows)}), 200
+    wg_ids = db.session.execute(db.select(user_wg.c.wg_id).where(user_wg.c.user_id == user_id)).scalars()
+    rows = []
+    for _ in shards.each_shard(wg_ids):
+        rows += db.session.execute(undone_tasks_query(user_id)).all()
+    # The order of undone_tasks_query across the shards
+    rows.sort(key=lambda row: (row[2], row[1], row[0].end_date is None, row[0].end_date or datetime.min,
+                               row[0].idTask))
+    return jsonify({'wgs': group_undone_tasks(rows)}), 200
+
+
+def undone_tasks_query(user_id):
+    """(Task, WG id, WG title) of the user's undone tasks, ordered by WG and due date."""
+    # Starts from the user's links in ix_user_task_user_task; user_wg leaves
+    # out tasks of WGs the user has left
+    return (
+        db.select(Task, WG.idWG, WG.title)
+        .join(user_task, db.and_(user_task.c.task_id == Task.idTask, user_task.c.user_id == user_id))
+        .join(TaskList, TaskList.idTaskList == Task.tasklist_id)
+        .join(user_wg, db.and_(user_wg.c.wg_id == TaskList.wg_id, user_wg.c.user_id == user_id))
+        .join(WG, WG.idWG == TaskList.wg_id)
+        .where(Task.is_done == False, Task.is_template == False)
+        .options(*TASK_LOAD_OPTIONS)
+        .order_by(WG.title, WG.idWG, Task.end_date.is_(None), Task.end_date, Task.idTask)
+    )
+
+
+def group_undone_tasks(rows):
+    wgs = []
+    for task, wg_id, title in rows:
+        if not wgs or wgs[-1]['id'] != wg_id:
+            wgs.append({'id': wg_id, 'title': title, 'tasks': []})
+        wgs[-1]['tasks'].append(serialize_task(task))
+    return wgs
+
+def refresh_tasklist_checked(tasklist_id):
+    """Sets TASKLIST.is_checked to whether all of its tasks are done, in one statement.
+
+    The flag is derived, not edited, so it does not bump the list's version:
+    housemates ticking off tasks of the same list do not conflict over it.
+    """
+    tasklist = TaskList.__table__
+    open_tasks = db.exists().where(Task.tasklist_id == tasklist_id, Task.is_template == False,
+                                   Task.is_done == False)
+    db.session.execute(tasklist.update().where(tasklist.c.idTaskList == tasklist_id)
+                       .values(is_checked=~open_tasks))
+
+
+def _task_for_state_change(task_id):
+    """Loads a task the current user may tick off, or returns the error response."""
+    task = Task.query.get(task_id)
+    if not task:
+        return None, (jsonify({'message': 'Task not found'}), 404)
+    tasklist = TaskList.query.get(task.tasklist_id)
+
+    # Check if the user is assigned to the task
+    if g.current_user not in task.users and not is_admin_of_wg(g.current_user, tasklist.wg_id):
+        return None, (jsonify({'message': 'Not authorized'}), 403)
+    return task, version_mismatch(task)
+
+
+def set_task_done(task, is_done):
+    if task.is_done != is_done:
+        task.is_done = is_done
+        # UPDATE ... WHERE version = :v; a concurrent change fails it
+        db.session.flush()
+        refresh_tasklist_checked(task.tasklist_id)
+    db.session.commit()
+
+
 @task_bp.route('/task/<string:task_id>/check', methods=['POST'])
 @token_required
 def check_task(task_id):
     """
-    Mark a task as done
+    Toggle whether a task is done; prefer PUT /task/{task_id}/done, which is safe to retry
     ---
     tags:
       - Task
@@ -399,38 +531,77 @@ def check_task(task_id):
           type: integer
     responses:
       200:
-        description: Task marked as done
+        description: Task marked as done or as not done
       403:
         description: Not authorized
       404:
         description: Task not found
+      409:
+        description: The task was changed concurrently, e.g. toggled by someone else
+      412:
+        description: If-Match does not name the task's current version
     """
-    task = Task.query.get(task_id)
-    tasklist = TaskList.query.get(task.tasklist_id)
-    if not task:
-        return jsonify({'message': 'Task not found'}), 404
+    task, error = _task_for_state_change(task_id)
+    if error:
+        return error
 
-    # Check if the user is assigned to the task
-    if g.current_user not in task.users and not is_admin_of_wg(g.current_user, tasklist.wg_id):
-        return jsonify({'message': 'Not authorized'}), 403
+    set_task_done(task, not task.is_done)
+    message = 'Task marked as done' if task.is_done else 'Task marked as not done'
+    return with_etag({'message': message}, task)
 
-    # Mark the task as done
-    if task.is_done is True:
-      task.is_done = False
-      tasklist.is_checked = False
-      db.session.commit()
-      return jsonify({'message': 'Task marked as not done'}), 200
-    else:
-      task.is_done = True
-      # Check if all tasks in the tasklist are done
-      all_done = all(t.is_done for t in tasklist.tasks)
-      if all_done:
-          tasklist.is_checked = True
-      db.session.commit()
-      return jsonify({'message': 'Task marked as done'}), 200
-    
+
+@task_bp.route('/task/<string:task_id>/done', methods=['PUT'])
+@validate_json(SET_DONE_SCHEMA)
+@token_required
+def set_task_done_state(task_id):
+    """
+    Mark a task as done or as not done; repeating the request changes nothing
+    ---
+    tags:
+      - Task
+    security:
+      - Bearer: []
+    parameters:
+      - name: task_id
+        in: path
+        required: true
+        schema:
+          type: string
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            required: [is_done]
+            properties:
+              is_done:
+                type: boolean
+    responses:
+      200:
+        description: The task in its new state
+        content:
+          application/json:
+            schema:
+              $TASK_SCHEMA
+      403:
+        description: Not authorized
+      404:
+        description: Task not found
+      409:
+        description: The task was changed concurrently
+      412:
+        description: If-Match does not name the task's current version
+    """
+    task, error = _task_for_state_change(task_id)
+    if error:
+        return error
+
+    set_task_done(task, request.get_json()['is_done'])
+    return with_etag(serialize_task(task), task)
 
 @task_bp.route('/task/<string:task_id>/assign_users', methods=['POST'])
+@validate_json(USER_IDS_SCHEMA)
 @token_required
 def assign_users_to_task(task_id):
     """
@@ -495,6 +666,7 @@ def assign_users_to_task(task_id):
         return jsonify({'message': f'Error assigning users to task: {str(e)}'}), 500
 
 @task_bp.route('/task/<string:task_id>/remove_users', methods=['POST'])
+@validate_json(USER_IDS_SCHEMA)
 @token_required
 def remove_users_from_task(task_id):
     """
@@ -1,11 +1,65 @@
 from datetime import datetime
 from flask import Blueprint, request, jsonify, g
+from sqlalchemy.orm import selectinload
 from extensions import db
 from models import TaskList, Task, User, WG, user_tasklist
 from decorators import token_required
+from idempotency import idempotent
+from response_cache import bump_wgs, cached_response
+from recurrence import UNITS, materialize_due
+import shards
+from validation import validate_json, object_schema, ID, ID_LIST, TITLE, TEXT, DATE
 
 task_list_bp = Blueprint('task_list_bp', __name__)
 
+CREATE_TASKLIST_SCHEMA = object_schema({
+    'wg_id': ID,
+    'title': TITLE,
+    'description': TEXT,
+    'date': DATE,
+}, required=['wg_id', 'title'])
+
+UPDATE_TASKLIST_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+})
+
+ADD_TASK_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+    'start_date': DATE,
+    'end_date': DATE,
+}, required=['title'])
+
+RECURRENCE = {
+    'type': ['object', 'null'],
+    'required': ['unit'],
+    'properties': {
+        'unit': {'enum': list(UNITS)},
+        'interval': {'type': 'integer', 'minimum': 1, 'maximum': 366},
+    },
+}
+
+CREATE_TEMPLATE_SCHEMA = object_schema({
+    'title': TITLE,
+    'description': TEXT,
+    'start_date': DATE,
+    'end_date': DATE,
+    'recurrence': RECURRENCE,
+    'user_ids': ID_LIST,
+}, required=['title'])
+
+ADD_FROM_TEMPLATE_SCHEMA = object_schema({'template_id': ID}, required=['template_id'])
+
+USER_IDS_SCHEMA = object_schema({'user_ids': ID_LIST}, required=['user_ids'])
+
+# Loader options that fetch everything serialize_tasklist reads with a fixed
+# number of statements, however many tasks the list has
+TASKLIST_LOAD_OPTIONS = (
+    selectinload(TaskList.users),
+    selectinload(TaskList.tasks).selectinload(Task.users),
+)
+
 
 def is_user_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
@@ -25,6 +79,7 @@ def serialize_tasklist(tasklist):
         'date': tasklist.date,
         'is_checked': tasklist.is_checked,
         'wg_id': tasklist.wg_id,
+        'version': tasklist.version,
         'users': [{'id': u.idUser, 'name': u.strUser} for u in tasklist.users],
         'tasks': [
             {
@@ -34,14 +89,33 @@ def serialize_tasklist(tasklist):
                 'is_done': t.is_done,
                 'start_date': t.start_date,
                 'end_date': t.end_date,
+                'version': t.version,
                 'users': [{'id': u.idUser, 'name': u.strUser} for u in t.users]
-            } for t in tasklist.tasks
-        ]
+            } for t in tasklist.tasks if not t.is_template
+        ],
+        'templates': [serialize_template(t) for t in tasklist.tasks if t.is_template],
+    }
+
+
+def serialize_template(template):
+    return {
+        'id': template.idTask,
+        'title': template.title,
+        'description': template.description,
+        'start_date': template.start_date,
+        'end_date': template.end_date,
+        'recurrence': {
+            'unit': template.recurrence,
+            'interval': template.recurrence_interval,
+        } if template.recurrence else None,
+        'next_occurrence': template.next_occurrence,
+        'users': [{'id': u.idUser, 'name': u.strUser} for u in template.users],
     }
 
 
 @task_list_bp.route('/tasklist/<string:tasklist_id>', methods=['GET'])
 @token_required
+@cached_response(TaskList)
 def get_task_list(tasklist_id):
     """
     Get a task list
@@ -64,7 +138,7 @@ def get_task_list(tasklist_id):
       404:
         description: Task list not found
     """
-    task_list = TaskList.query.get(tasklist_id)
+    task_list = TaskList.query.options(*TASKLIST_LOAD_OPTIONS).get(tasklist_id)
     if not task_list:
         return jsonify({'message': 'Task list not found'}), 404
     if not (is_user_of_wg(g.current_user, task_list.wg_id) or is_admin_of_wg(g.current_user, task_list.wg_id)):
@@ -74,7 +148,9 @@ def get_task_list(tasklist_id):
 
 
 @task_list_bp.route('/tasklist', methods=['POST'])
+@validate_json(CREATE_TASKLIST_SCHEMA)
 @token_required
+@idempotent
 def create_task_list():
     """
     Create a new task list
@@ -166,7 +242,10 @@ def create_task_list():
 
     # Handle the optional date field
     task_date_str = data.get('date')
-    task_date = datetime.fromisoformat(task_date_str) if task_date_str else None
+    try:
+        task_date = datetime.fromisoformat(task_date_str) if task_date_str else None
+    except ValueError:
+        return jsonify({'message': 'Invalid date format. Use ISO 8601 format.'}), 400
 
     new_task_list = TaskList(
         title=data['title'],
@@ -216,7 +295,9 @@ def delete_task_list(tasklist_id):
 
 
 @task_list_bp.route('/tasklist/<string:tasklist_id>/add_task', methods=['POST'])
+@validate_json(ADD_TASK_SCHEMA)
 @token_required
+@idempotent
 def add_task(tasklist_id):
     """
     Add a task to a task list
@@ -254,8 +335,8 @@ def add_task(tasklist_id):
     data = request.get_json()
     # Convert start_date and end_date to datetime objects
     try:
-        start_date = datetime.fromisoformat(data['start_date']) if 'start_date' in data else None
-        end_date = datetime.fromisoformat(data['end_date']) if 'end_date' in data else None
+        start_date = datetime.fromisoformat(data['start_date']) if data.get('start_date') else None
+        end_date = datetime.fromisoformat(data['end_date']) if data.get('end_date') else None
     except ValueError:
         return jsonify({'message': 'Invalid date format. Use ISO 8601 format.'}), 400
 
@@ -274,97 +355,172 @@ def add_task(tasklist_id):
     return jsonify({'id': task.idTask, 'title': task.title}), 201
 
 
-# @task_list_bp.route('/tasklist/<string:tasklist_id>/add_task_from_template', methods=['POST'])
-# @token_required
-# def add_task_from_template(tasklist_id):
-#     """
-#     Add a task from a template to a task list
-#     ---
-#     tags:
-#       - TaskList
-#     security:
-#       - Bearer: []
-#     parameters:
-#       - name: tasklist_id
-#         in: path
-#         required: true
-#         schema:
-#           type: integer
-#     requestBody:
-#       required: true
-#       content:
-#         application/json:
-#           schema:
-#             type: object
-#             properties:
-#               template_id:
-#                 type: integer
-#     responses:
-#       201:
-#         description: Task created from template
-#       403:
-#         description: Not authorized
-#       404:
-#         description: Template task not found
-#     """
-#     task_list = TaskList.query.get(tasklist_id)
-#     if not task_list or not is_user_of_wg(g.current_user, task_list.wg_id):
-#         return jsonify({'message': 'Not authorized'}), 403
-#     data = request.get_json()
-#     template_task = Task.query.get(data['template_id'])
-#     if template_task and template_task.is_template:
-#         new_task = Task(
-#             title=template_task.title,
-#             description=template_task.description,
-#             tasklist_id=tasklist_id,
-#             start_date=template_task.start_date,
-#             end_date=template_task.end_date,
-#             is_template=False
-#         )
-#         db.session.add(new_task)
-#         db.session.commit()
-#         return jsonify({'id': new_task.idTask, 'title': new_task.title}), 201
-#     return jsonify({'message': 'Template task not found'}), 404
-
-
-# @task_list_bp.route('/tasklist/create_template', methods=['POST'])
-# @token_required
-# def create_task_template():
-#     """
-#     Create a new task template
-#     ---
-#     tags:
-#       - TaskList
-#     security:
-#       - Bearer: []
-#     requestBody:
-#       required: true
-#       content:
-#         application/json:
-#           schema:
-#             type: object
-#             properties:
-#               title:
-#                 type: string
-#               description:
-#                 type: string
-#     responses:
-#       201:
-#         description: Task template created
-#     """
-#     data = request.get_json()
-#     # Any user can create a template
-#     template_task = Task(
-#         title=data['title'],
-#         description=data.get('description'),
-#         is_template=True
-#     )
-#     db.session.add(template_task)
-#     db.session.commit()
-#     return jsonify({'id': template_task.idTask, 'title': template_task.title}), 201
+@task_list_bp.route('/tasklist/<string:tasklist_id>/add_task_from_template', methods=['POST'])
+@validate_json(ADD_FROM_TEMPLATE_SCHEMA)
+@token_required
+@idempotent
+def add_task_from_template(tasklist_id):
+    """
+    Add a task from a template to a task list
+    ---
+    tags:
+      - TaskList
+    security:
+      - Bearer: []
+    parameters:
+      - name: tasklist_id
+        in: path
+        required: true
+        schema:
+          type: string
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            properties:
+              template_id:
+                type: string
+    responses:
+      201:
+        description: Task created from template
+      403:
+        description: Not authorized
+      404:
+        description: Template task not found
+    """
+    task_list = TaskList.query.get(tasklist_id)
+    if not task_list or not is_user_of_wg(g.current_user, task_list.wg_id):
+        return jsonify({'message': 'Not authorized'}), 403
+    data = request.get_json()
+    template_task = Task.query.options(selectinload(Task.users)).get(data['template_id'])
+    # Templates are only shared within their WG
+    if not template_task or not template_task.is_template or not template_task.tasklist \
+            or template_task.tasklist.wg_id != task_list.wg_id:
+        return jsonify({'message': 'Template task not found'}), 404
+    new_task = Task(
+        title=template_task.title,
+        description=template_task.description,
+        tasklist_id=tasklist_id,
+        start_date=template_task.start_date,
+        end_date=template_task.end_date,
+        is_done=False,
+        is_template=False,
+        template_id=template_task.idTask,
+        users=list(template_task.users),
+    )
+    task_list.is_checked = False
+    db.session.add(new_task)
+    db.session.commit()
+    return jsonify({'id': new_task.idTask, 'title': new_task.title}), 201
+
+
+@task_list_bp.route('/tasklist/<string:tasklist_id>/create_template', methods=['POST'])
+@validate_json(CREATE_TEMPLATE_SCHEMA)
+@token_required
+@idempotent
+def create_task_template(tasklist_id):
+    """
+    Create a task template, optionally recurring
+    ---
+    tags:
+      - TaskList
+    security:
+      - Bearer: []
+    parameters:
+      - name: tasklist_id
+        in: path
+        required: true
+        schema:
+          type: string
+    requestBody:
+      required: true
+      content:
+        application/json:
+          schema:
+            type: object
+            properties:
+              title:
+                type: string
+              description:
+                type: string
+              start_date:
+                type: string
+                description: First occurrence; required for a recurring template.
+              end_date:
+                type: string
+                description: Due date of the first occurrence; later ones keep the same duration.
+              recurrence:
+                type: object
+                properties:
+                  unit:
+                    type: string
+                    enum: [daily, weekly, monthly]
+                  interval:
+                    type: integer
+                    description: Every N units, 1 by default.
+              user_ids:
+                type: array
+                items:
+                  type: string
+                description: Members every instance is assigned to.
+    responses:
+      201:
+        description: Task template created
+      400:
+        description: Invalid dates
+      403:
+        description: Not authorized
+    """
+    task_list = TaskList.query.get(tasklist_id)
+    if not task_list or not is_user_of_wg(g.current_user, task_list.wg_id):
+        return jsonify({'message': 'Not authorized'}), 403
+    data = request.get_json()
+    try:
+        start_date = datetime.fromisoformat(data['start_date']) if data.get('start_date') else None
+        end_date = datetime.fromisoformat(data['end_date']) if data.get('end_date') else None
+    except ValueError:
+        return jsonify({'message': 'Invalid date format. Use ISO 8601 format.'}), 400
+    recurrence = data.get('recurrence')
+    if recurrence and not start_date:
+        return jsonify({'message': 'A recurring template needs a start_date'}), 400
+    if start_date and end_date and end_date < start_date:
+        return jsonify({'message': 'end_date must not be before start_date'}), 400
+
+    users = []
+    if data.get('user_ids'):
+        users = User.query.filter(User.idUser.in_(data['user_ids'])).all()
+        wg = WG.query.get(task_list.wg_id)
+        if any(user not in wg.users for user in users):
+            return jsonify({'message': 'Users must be members of the WG'}), 400
+
+    template_task = Task(
+        title=data['title'],
+        description=data.get('description'),
+        tasklist_id=tasklist_id,
+        start_date=start_date,
+        end_date=end_date,
+        is_done=False,
+        is_template=True,
+        recurrence=recurrence['unit'] if recurrence else None,
+        recurrence_interval=recurrence.get('interval', 1) if recurrence else 1,
+        next_occurrence=start_date if recurrence else None,
+        users=users,
+    )
+    for user in users:
+        if user not in task_list.users:
+            task_list.users.append(user)
+    db.session.add(template_task)
+    db.session.commit()
+    if recurrence:
+        # Fill the window right away instead of waiting for the next run
+        materialize_due(template_ids=[template_task.idTask], engine=shards.shard_engine())
+    return jsonify({'id': template_task.idTask, 'title': template_task.title}), 201
 
 
 @task_list_bp.route('/tasklist/<string:tasklist_id>/assign_users', methods=['POST'])
+@validate_json(USER_IDS_SCHEMA)
 @token_required
 def assign_users_to_tasklist(tasklist_id):
     """
@@ -412,6 +568,7 @@ def assign_users_to_tasklist(tasklist_id):
 
 
 @task_list_bp.route('/tasklist/<string:tasklist_id>/remove_users', methods=['POST'])
+@validate_json(USER_IDS_SCHEMA)
 @token_required
 def remove_users_from_tasklist(tasklist_id):
     """
@@ -462,6 +619,8 @@ def remove_users_from_tasklist(tasklist_id):
         user_tasklist.c.tasklist_id == tasklist_id,
         user_tasklist.c.user_id.in_(user_ids_to_remove)
     ).delete(synchronize_session=False)
+    # A bulk delete does not flush, so the cached responses are invalidated here
+    bump_wgs([task_list.wg_id])
 
     db.session.commit()
     
@@ -559,6 +718,7 @@ def uncheck_tasklist(tasklist_id):
 
 
 @task_list_bp.route('/tasklist/<string:tasklist_id>', methods=['PUT'])
+@validate_json(UPDATE_TASKLIST_SCHEMA)
 @token_required
 def update_tasklist(tasklist_id):
     """
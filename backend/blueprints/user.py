@@ -2,14 +2,29 @@
 from datetime import datetime, timedelta
 from sqlite3 import IntegrityError
 from extensions import bcrypt
+from metrics import BCRYPT_DURATION
 from flask import Blueprint, jsonify, request, current_app, g
 import jwt
 from extensions import db
 from decorators import token_required
+from cache import LRUCache
+from database.prefix import fold, folded, starts_with
+from ratelimit import rate_limit
+from jobs import enqueue, job_handler
+from validation import validate_json, object_schema
 from models import WG, User
+import response_cache
+import shards
 
 user_bp = Blueprint('user_bp', __name__)
 
+UPDATE_USER_SCHEMA = object_schema({
+    'username': {'type': 'string', 'minLength': 1, 'maxLength': 80},
+    'email': {'type': 'string', 'minLength': 1, 'maxLength': 128},
+    'new_password': {'type': ['string', 'null']},
+    'home_page_wg_id': {'type': ['string', 'null']},
+})
+
 @user_bp.route('/user', methods=['GET'])
 @token_required
 def user():
@@ -35,6 +50,7 @@ def user():
 
 
 @user_bp.route('/user', methods=['PUT'])
+@validate_json(UPDATE_USER_SCHEMA)
 @token_required
 def update_user():
     """
@@ -87,7 +103,8 @@ def update_user():
 
     # Handle new password
     if 'new_password' in data and data['new_password']:
-        user.strPass = bcrypt.generate_password_hash(data['new_password']).decode('utf-8')
+        with BCRYPT_DURATION.labels('hash').time():
+            user.strPass = bcrypt.generate_password_hash(data['new_password']).decode('utf-8')
 
     # NEW: Handle preferred home page update
     home_page_wg_id = data.get('home_page_wg_id')
@@ -153,18 +170,28 @@ def delete_user():
     security:
       - BearerAuth: []
     responses:
-      204:
-        description: User deleted successfully
+      202:
+        description: User deletion queued
       404:
         description: User not found
     """
     user = g.current_user
     if user:
-        db.session.delete(user)
+        # The user's WGs are deleted with them, so this runs as a job
+        job = enqueue('delete_user', user_id=user.idUser)
         db.session.commit()
-        return jsonify({'message': 'User deleted successfully'}), 204
+        return jsonify({'message': 'User deletion queued', 'job_id': job.idJob}), 202
     return jsonify({'user': None}), 404
 
+
+@job_handler('delete_user')
+def delete_user_job(user_id):
+    # Memberships and the WGs the user created go with the user through the
+    # foreign keys; lists they created stay, without a creator
+    shards.forget_user(user_id)
+    response_cache.bump_wgs(db.session.scalars(response_cache.user_wgs(user_id)))
+    db.session.execute(db.delete(User).where(User.idUser == user_id))
+
 @user_bp.route('/user/join/<string:wg_id>', methods=['POST'])
 @token_required
 def join_wg(wg_id):
@@ -273,4 +300,67 @@ def leave_wg(wg_id):
             db.session.rollback()
             return jsonify({'message': f'An error occurred: {str(e)}'}), 500
             
-    return jsonify({'message': 'User not authenticated'}), 401
\ No newline at end of file
+    return jsonify({'message': 'User not authenticated'}), 401
+
+
+# Suggestions returned per prefix
+SUGGEST_LIMIT = 10
+
+
+@user_bp.record_once
+def _init_suggestion_cache(state):
+    """Builds the LRU of suggestions per folded prefix when the blueprint is registered."""
+    config = state.app.config
+    state.app.extensions['user_suggest_cache'] = LRUCache(
+        'user_suggest', maxsize=config['USER_SUGGEST_CACHE_SIZE'], ttl=config['USER_SUGGEST_CACHE_SECONDS'])
+
+
+def _users_starting_with(prefix):
+    # One more than needed, as the caller is left out of their own suggestions
+    query = (db.select(User.idUser, User.strUser)
+             .where(starts_with(User.strUser, prefix))
+             .order_by(folded(User.strUser))
+             .limit(SUGGEST_LIMIT + 1))
+    return [tuple(row) for row in db.session.execute(query)]
+
+
+@user_bp.route('/users/suggest', methods=['GET'])
+@token_required
+@rate_limit('user_suggest', 'USER_SUGGEST_RATE', 'USER_SUGGEST_BURST')
+def suggest_users():
+    """
+    Suggest usernames starting with a prefix, e.g. to invite a user
+    ---
+    tags:
+      - User
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: prefix
+        in: query
+        required: true
+        description: Start of the username, case-insensitive
+        schema:
+          type: string
+    responses:
+      200:
+        description: Up to 10 users, ordered by username; may lag behind new and renamed users by USER_SUGGEST_CACHE_SECONDS
+        content:
+          application/json:
+            example: {"users": [{"id": "...", "username": "testuser"}]}
+      400:
+        description: Prefix is missing
+      429:
+        description: Too many requests; retry after the Retry-After header's seconds
+    """
+    prefix = request.args.get('prefix', '').strip()[:80]
+    if not prefix:
+        return jsonify({'message': 'Prefix is required'}), 400
+
+    prefix = fold(prefix)
+    cache = current_app.extensions['user_suggest_cache']
+    users = cache.get_or_set(prefix, lambda: _users_starting_with(prefix))
+    return jsonify({'users': [
+        {'id': user_id, 'username': username}
+        for user_id, username in users if user_id != g.current_user.idUser
+    ][:SUGGEST_LIMIT]}), 200
@@ -1,13 +1,46 @@
-from flask import Blueprint, request, jsonify, g
+import base64
+import binascii
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+import search
+import shards
+from calendar_feed import in_window
 from extensions import db
-from models import WG, User
+from database.prefix import folded, starts_with
+from database.streaming import iter_lines
+from database.wg_transfer import iter_wg_export, import_wg, is_wg_conflict, WGImportError
+from models import WG, User, TaskList, Task, ShoppingList, BudgetPlanning, user_wg, user_task
 from decorators import token_required
-from blueprints.shopping_list import serialize_shoppinglist
-from blueprints.budget_planning import serialize_budgetplanning
-from blueprints.task_list import serialize_tasklist
+from idempotency import idempotent
+from response_cache import cached_response
+from jobs import enqueue, job_handler
+from validation import validate_json, object_schema, ID, TITLE, TEXT
+from blueprints.shopping_list import serialize_shoppinglist, SHOPPINGLIST_LOAD_OPTIONS
+from blueprints.budget_planning import serialize_budgetplanning, BUDGETPLANNING_LOAD_OPTIONS
+from blueprints.task_list import serialize_tasklist, TASKLIST_LOAD_OPTIONS
 
 wg_bp = Blueprint('wg_bp', __name__)
 
+WG_PROPERTIES = {
+    'title': TITLE,
+    'address': {'type': 'string', 'minLength': 1, 'maxLength': 255},
+    'etage': {'type': 'string', 'minLength': 1, 'maxLength': 20},
+    'description': TEXT,
+    'is_public': {'type': ['boolean', 'null']},
+}
+CREATE_WG_SCHEMA = object_schema(WG_PROPERTIES, required=['title', 'address', 'etage'])
+# Empty strings are ignored by update_wg, so they are allowed here
+UPDATE_WG_SCHEMA = object_schema(
+    dict(WG_PROPERTIES, **{name: dict(WG_PROPERTIES[name], minLength=0) for name in ('title', 'address', 'etage')})
+)
+USERNAME_SCHEMA = object_schema({'username': {'type': 'string', 'minLength': 1}}, required=['username'])
+USER_ID_SCHEMA = object_schema({'user_id': ID}, required=['user_id'])
+
 
 def is_user_of_wg(user, wg_id):
     wg = WG.query.get(wg_id)
@@ -19,6 +52,18 @@ def is_admin_of_wg(user, wg_id):
     return wg and (user in wg.admins or g.current_user == wg.creator)
 
 
+# Loader options that fetch everything serialize_wg reads with one statement
+# per relationship instead of one per WG and relationship
+WG_LOAD_OPTIONS = (
+    joinedload(WG.creator),
+    selectinload(WG.users),
+    selectinload(WG.admins),
+    selectinload(WG.tasklists),
+    selectinload(WG.shoppinglists),
+    selectinload(WG.budgetplannings),
+)
+
+
 def serialize_wg(wg):
     return {
         'id': wg.idWG,
@@ -37,7 +82,9 @@ def serialize_wg(wg):
 
 
 @wg_bp.route('/wg', methods=['POST'])
+@validate_json(CREATE_WG_SCHEMA)
 @token_required
+@idempotent
 def create_wg():
     """
     Create a new WG (Wohngemeinschaft) and set the creator's home page.
@@ -114,6 +161,7 @@ def create_wg():
         
         # NEW: Set the creator's home page to the new WG
         creator.strHomePage = f'/wg/{new_wg.idWG}'
+        shards.place_wg(new_wg.idWG)
 
         db.session.commit()
         serialized_wg = serialize_wg(new_wg)
@@ -140,8 +188,8 @@ def delete_wg(wg_id):
           type: integer
         description: WG ID to delete
     responses:
-      204:
-        description: WG deleted successfully
+      202:
+        description: WG deletion queued
       403:
         description: Not authorized
       404:
@@ -155,12 +203,23 @@ def delete_wg(wg_id):
         return jsonify({'message': 'Not authorized'}), 403
     if g.current_user.strHomePage == f'/wg/{wg.idWG}':
         g.current_user.strHomePage = "/"
-    db.session.delete(wg)
+    # Deleting a WG cascades through all of its lists, so it runs as a job
+    job = enqueue('delete_wg', wg_id=wg.idWG)
     db.session.commit()
-    return jsonify({'message': 'WG deleted successfully'}), 204
+    return jsonify({'message': 'WG deletion queued', 'job_id': job.idJob}), 202
+
+
+@job_handler('delete_wg')
+def delete_wg_job(wg_id):
+    # A single DELETE: the foreign keys cascade to everything below the WG, so
+    # no child is loaded into the session however large the WG is
+    db.session.execute(db.update(User).where(User.strHomePage == f'/wg/{wg_id}').values(strHomePage='/'))
+    shards.forget_wg(wg_id)
+    db.session.execute(db.delete(WG).where(WG.idWG == wg_id))
 
 
 @wg_bp.route('/wg/<string:wg_id>/invite_by_username', methods=['POST'])
+@validate_json(USERNAME_SCHEMA)
 @token_required
 def invite_user_by_username(wg_id):
     """
@@ -218,6 +277,7 @@ def invite_user_by_username(wg_id):
 
 
 @wg_bp.route('/wg/<string:wg_id>/kick', methods=['POST'])
+@validate_json(USER_ID_SCHEMA)
 @token_required
 def kick_user(wg_id):
     """
@@ -277,6 +337,7 @@ def kick_user(wg_id):
 
 
 @wg_bp.route('/wg/<string:wg_id>/admin', methods=['POST'])
+@validate_json(USER_ID_SCHEMA)
 @token_required
 def toggle_user_admin(wg_id):
     """
@@ -366,13 +427,119 @@ def get_my_wgs():
             ]
     """
     user = g.current_user
-    wgs = user.wgs  # Get all WGs the user is part of
+    if shards.enabled():
+        # The lists of each WG come from its shard
+        wg_ids = db.session.execute(db.select(user_wg.c.wg_id).where(user_wg.c.user_id == user.idUser)).scalars()
+        serialized_wgs = []
+        for ids in shards.each_shard(wg_ids):
+            wgs = WG.query.options(*WG_LOAD_OPTIONS).filter(WG.idWG.in_(ids)).all()
+            serialized_wgs += [serialize_wg(wg) for wg in wgs]
+        return jsonify(serialized_wgs), 200
+    # Get all WGs the user is part of
+    wgs = WG.query.options(*WG_LOAD_OPTIONS).filter(WG.users.contains(user)).all()
     serialized_wgs = [serialize_wg(wg) for wg in wgs]
     return jsonify(serialized_wgs), 200
 
 
+# Largest page of the public WG directory
+DIRECTORY_MAX_PER_PAGE = 50
+
+
+def _encode_cursor(sort_key, wg_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_key, wg_id]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        sort_key, wg_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        return None
+    if not isinstance(sort_key, str) or not isinstance(wg_id, str):
+        return None
+    return sort_key, wg_id
+
+
+@wg_bp.route('/wg/public', methods=['GET'])
+@token_required
+def get_public_wgs():
+    """
+    Browse the public WGs, e.g. to find one to join
+    ---
+    tags:
+      - WG
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: q
+        in: query
+        description: Prefix of the title or the address, case-insensitive
+        schema:
+          type: string
+      - name: cursor
+        in: query
+        description: next_cursor of the previous page
+        schema:
+          type: string
+      - name: per_page
+        in: query
+        schema:
+          type: integer
+          default: 20
+          maximum: 50
+    responses:
+      200:
+        description: Public WGs ordered by title
+        content:
+          application/json:
+            example:
+              wgs:
+                - id: "..."
+                  title: MyWG
+                  address: Hauptstrasse 1
+                  etage: "2"
+                  description: A nice shared apartment
+                  member_count: 3
+              next_cursor: null
+      400:
+        description: Invalid cursor
+    """
+    q = request.args.get('q', '').strip()
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), DIRECTORY_MAX_PER_PAGE)
+
+    sort_key = folded(WG.title)
+    member_count = (db.select(db.func.count()).select_from(user_wg)
+                    .where(user_wg.c.wg_id == WG.idWG).scalar_subquery())
+    query = (db.select(WG.idWG, WG.title, WG.address, WG.etage, WG.description,
+                       sort_key.label('sort_key'), member_count.label('member_count'))
+             .where(WG.is_public == True)
+             .order_by(sort_key, WG.idWG)
+             .limit(per_page + 1))
+    if q:
+        query = query.where(db.or_(starts_with(WG.title, q), starts_with(WG.address, q)))
+    if request.args.get('cursor'):
+        after = _decode_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        # The first condition is the one the index can seek with
+        query = query.where(sort_key >= after[0], db.tuple_(sort_key, WG.idWG) > after)
+
+    rows = db.session.execute(query).all()
+    wgs = [{
+        'id': row.idWG,
+        'title': row.title,
+        'address': row.address,
+        'etage': row.etage,
+        'description': row.description,
+        'member_count': row.member_count,
+    } for row in rows[:per_page]]
+    next_cursor = _encode_cursor(rows[per_page - 1].sort_key, rows[per_page - 1].idWG) \
+        if len(rows) > per_page else None
+    return jsonify({'wgs': wgs, 'next_cursor': next_cursor}), 200
+
+
 @wg_bp.route('/wg/<string:wg_id>', methods=['GET'])
 @token_required
+@cached_response(WG)
 def get_wg_info(wg_id):
     """
     Get information about a WG
@@ -410,7 +577,7 @@ def get_wg_info(wg_id):
       404:
         description: WG not found
     """
-    wg = WG.query.get(wg_id)
+    wg = WG.query.options(*WG_LOAD_OPTIONS).get(wg_id)
     if not wg:
         return jsonify({'message': 'WG not found'}), 404
     if g.current_user not in wg.users and g.current_user != wg.creator:
@@ -419,6 +586,7 @@ def get_wg_info(wg_id):
 
 
 @wg_bp.route('/wg/<string:wg_id>', methods=['PUT'])
+@validate_json(UPDATE_WG_SCHEMA)
 @token_required
 def update_wg(wg_id):
     """
@@ -505,6 +673,7 @@ def update_wg(wg_id):
 
 
 @wg_bp.route('/wg/<string:wg_id>/transfer_creator', methods=['POST'])
+@validate_json(USERNAME_SCHEMA)
 @token_required
 def transfer_creator(wg_id):
     """
@@ -582,6 +751,7 @@ def transfer_creator(wg_id):
 
 @wg_bp.route('/wg/<string:wg_id>/tasklists', methods=['GET'])
 @token_required
+@cached_response(WG)
 def get_tasklists_for_wg(wg_id):
     """
     Get all task lists for a specific WG.
@@ -611,11 +781,13 @@ def get_tasklists_for_wg(wg_id):
     if not is_user_of_wg(g.current_user, wg_id):
         return jsonify({'message': 'Not authorized'}), 403
 
-    tasklists = [serialize_tasklist(tl) for tl in wg.tasklists] 
+    tasklists = [serialize_tasklist(tl) for tl in
+                 TaskList.query.options(*TASKLIST_LOAD_OPTIONS).filter_by(wg_id=wg_id)]
     return jsonify({'tasklists': tasklists}), 200
 
 @wg_bp.route('/wg/<string:wg_id>/shoppinglists', methods=['GET'])
 @token_required
+@cached_response(WG)
 def get_shoppinglists_for_wg(wg_id):
     """
     Get all shopping lists for a specific WG.
@@ -645,11 +817,13 @@ def get_shoppinglists_for_wg(wg_id):
     if not is_user_of_wg(g.current_user, wg_id):
         return jsonify({'message': 'Not authorized'}), 403
 
-    shoppinglists = [serialize_shoppinglist(sl) for sl in wg.shoppinglists]
+    shoppinglists = [serialize_shoppinglist(sl) for sl in
+                     ShoppingList.query.options(*SHOPPINGLIST_LOAD_OPTIONS).filter_by(wg_id=wg_id)]
     return jsonify({'shoppinglists': shoppinglists}), 200
 
 @wg_bp.route('/wg/<string:wg_id>/budgetplanning', methods=['GET'])
 @token_required
+@cached_response(WG)
 def get_budgetplannings_for_wg(wg_id):
     """
     Get all budget plannings for a specific WG.
@@ -679,6 +853,297 @@ def get_budgetplannings_for_wg(wg_id):
     if not is_user_of_wg(g.current_user, wg_id):
         return jsonify({'message': 'Not authorized'}), 403
 
-    # Assuming a relationship 'budgetplannings' exists on the WG model
-    budgetplannings = [serialize_budgetplanning(bp) for bp in wg.budgetplannings]
-    return jsonify({'budgetplannings': budgetplannings}), 200
\ No newline at end of file
+    budgetplannings = [serialize_budgetplanning(bp) for bp in
+                       BudgetPlanning.query.options(*BUDGETPLANNING_LOAD_OPTIONS).filter_by(wg_id=wg_id)]
+    return jsonify({'budgetplannings': budgetplannings}), 200
+
+# Longest window the calendar answers at once
+CALENDAR_MAX_DAYS = 100
+
+
+def _calendar_datetime(name):
+    """Parses an ISO 8601 query argument into the naive UTC the dates are stored in."""
+    value = datetime.fromisoformat(request.args[name])
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@wg_bp.route('/wg/<string:wg_id>/tasks', methods=['GET'])
+@token_required
+def get_calendar_tasks(wg_id):
+    """
+    Get the tasks of a WG that overlap a time window, e.g. for a month view.
+    ---
+    tags:
+      - WG
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: wg_id
+        in: path
+        required: true
+        schema:
+          type: string
+      - name: from
+        in: query
+        required: true
+        description: Start of the window (ISO 8601), inclusive
+        schema:
+          type: string
+          format: date-time
+      - name: to
+        in: query
+        required: true
+        description: End of the window (ISO 8601), exclusive; at most 100 days after from
+        schema:
+          type: string
+          format: date-time
+      - name: assignee
+        in: query
+        description: Only tasks assigned to this user id, or "me"
+        schema:
+          type: string
+      - name: done
+        in: query
+        description: Only done (true) or open (false) tasks
+        schema:
+          type: boolean
+    responses:
+      200:
+        description: Tasks ordered by start, with ISO 8601 dates in UTC; a task without an end is shown at its start, one without a start at its end
+        content:
+          application/json:
+            example:
+              tasks:
+                - id: "..."
+                  title: Clean the kitchen
+                  start: "2026-10-01T18:00:00"
+                  end: "2026-10-01T20:00:00"
+                  done: false
+                  tasklist_id: "..."
+                  users: ["..."]
+      400:
+        description: Missing or invalid window or filter
+      403:
+        description: Not authorized
+      404:
+        description: WG not found
+    """
+    wg = WG.query.get(wg_id)
+    if not wg:
+        return jsonify({'message': 'WG not found'}), 404
+
+    if not is_user_of_wg(g.current_user, wg_id):
+        return jsonify({'message': 'Not authorized'}), 403
+
+    try:
+        start, end = _calendar_datetime('from'), _calendar_datetime('to')
+    except (KeyError, ValueError):
+        return jsonify({'message': 'from and to must be ISO 8601 dates'}), 400
+    if not start < end <= start + timedelta(days=CALENDAR_MAX_DAYS):
+        return jsonify({'message': f'to must be after from, by at most {CALENDAR_MAX_DAYS} days'}), 400
+
+    query = (db.select(Task.idTask, Task.title, Task.start_date, Task.end_date, Task.is_done, Task.tasklist_id)
+             .join(TaskList, Task.tasklist_id == TaskList.idTaskList)
+             .where(TaskList.wg_id == wg_id, Task.is_template == False, in_window(start, end))
+             .order_by(db.func.coalesce(Task.start_date, Task.end_date), Task.idTask))
+
+    done = request.args.get('done')
+    if done is not None:
+        if done not in ('true', 'false'):
+            return jsonify({'message': 'done must be true or false'}), 400
+        query = query.where(Task.is_done == (done == 'true'))
+    assignee = request.args.get('assignee')
+    if assignee:
+        user_id = g.current_user.idUser if assignee == 'me' else assignee
+        query = query.where(db.exists().where(user_task.c.task_id == Task.idTask,
+                                              user_task.c.user_id == user_id))
+
+    rows = db.session.execute(query).all()
+    users = defaultdict(list)
+    if rows:
+        links = db.select(user_task.c.task_id, user_task.c.user_id) \
+            .where(user_task.c.task_id.in_([row.idTask for row in rows]))
+        for task_id, user_id in db.session.execute(links):
+            users[task_id].append(user_id)
+
+    # ISO 8601 like from and to, which is also shorter and quicker to encode
+    # than the HTTP dates jsonify writes for datetimes
+    tasks = [{
+        'id': row.idTask,
+        'title': row.title,
+        'start': row.start_date.isoformat() if row.start_date else None,
+        'end': row.end_date.isoformat() if row.end_date else None,
+        'done': row.is_done,
+        'tasklist_id': row.tasklist_id,
+        'users': users[row.idTask],
+    } for row in rows]
+    return jsonify({'tasks': tasks}), 200
+
+@wg_bp.route('/wg/<string:wg_id>/search', methods=['GET'])
+@token_required
+def search_in_wg(wg_id):
+    """
+    Search the titles and descriptions of a WG's lists, tasks, items and costs.
+    ---
+    tags:
+      - WG
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: wg_id
+        in: path
+        required: true
+        schema:
+          type: string
+      - name: q
+        in: query
+        required: true
+        description: Words to search for; every word has to match, the last one as a prefix
+        schema:
+          type: string
+      - name: page
+        in: query
+        schema:
+          type: integer
+          default: 1
+      - name: per_page
+        in: query
+        schema:
+          type: integer
+          default: 20
+          maximum: 50
+    responses:
+      200:
+        description: Matches, title matches first
+        content:
+          application/json:
+            example:
+              results:
+                - kind: task
+                  id: "..."
+                  parent_id: "..."
+                  title: Descale the boiler
+                  description: null
+              page: 1
+              per_page: 20
+              has_more: false
+      400:
+        description: No words to search for
+      403:
+        description: Not authorized
+      404:
+        description: WG not found
+    """
+    wg = WG.query.get(wg_id)
+    if not wg:
+        return jsonify({'message': 'WG not found'}), 404
+
+    if not is_user_of_wg(g.current_user, wg_id):
+        return jsonify({'message': 'Not authorized'}), 403
+
+    q = request.args.get('q', '')
+    if not search.query_words(q):
+        return jsonify({'message': 'Search query is required'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), search.MAX_PER_PAGE)
+
+    results, has_more = search.search_wg(wg_id, q, page=page, per_page=per_page)
+    return jsonify({'results': results, 'page': page, 'per_page': per_page, 'has_more': has_more}), 200
+
+@wg_bp.route('/wg/<string:wg_id>/export', methods=['GET'])
+@token_required
+def export_wg(wg_id):
+    """
+    Export a WG with all of its lists, tasks, items, costs and memberships.
+    ---
+    tags:
+      - WG
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: wg_id
+        in: path
+        required: true
+        schema:
+          type: string
+    responses:
+      200:
+        description: JSON lines document, one row per line, streamed table by table
+        content:
+          application/x-ndjson:
+            example: |
+              {"_type": "header", "format": "wg-export", "version": 1, "wg_id": "..."}
+              {"_table": "WG", "idWG": "...", "title": "MyWG", ...}
+      403:
+        description: Not authorized
+      404:
+        description: WG not found
+    """
+    wg = WG.query.get(wg_id)
+    if not wg:
+        return jsonify({'message': 'WG not found'}), 404
+    if g.current_user not in wg.admins and g.current_user != wg.creator:
+        return jsonify({'message': 'Not authorized'}), 403
+
+    response = Response(stream_with_context(iter_wg_export(wg.idWG, engine=shards.shard_engine())), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="wg-{wg.idWG}.jsonl"'
+    return response
+
+
+@wg_bp.route('/wg/import', methods=['POST'])
+@token_required
+def import_wg_export():
+    """
+    Import a WG export as a new WG owned by the current user.
+    ---
+    tags:
+      - WG
+    security:
+      - BearerAuth: []
+    parameters:
+      - name: title
+        in: query
+        required: false
+        schema:
+          type: string
+        description: New title, required when the original title is taken
+      - name: address
+        in: query
+        required: false
+        schema:
+          type: string
+      - name: etage
+        in: query
+        required: false
+        schema:
+          type: string
+    requestBody:
+      required: true
+      content:
+        application/x-ndjson:
+          schema:
+            type: string
+            description: Document produced by GET /wg/{wg_id}/export
+    responses:
+      201:
+        description: WG imported with new ids
+        content:
+          application/json:
+            example: {"id": "...", "rows": {"WG": 1, "ITEM": 100000}, "skipped": 0}
+      400:
+        description: Malformed export
+      409:
+        description: WG with same title or address/etage already exists, or the import conflicts with existing rows
+    """
+    overrides = {key: request.args.get(key) for key in ('title', 'address', 'etage')}
+    try:
+        summary = import_wg(iter_lines(request.stream), creator_id=g.current_user.idUser, overrides=overrides)
+    except WGImportError as e:
+        return jsonify({'message': f'Invalid export: {str(e)}'}), 400
+    except IntegrityError as e:
+        if is_wg_conflict(e):
+            return jsonify({'message': 'WG with this title or address and etage already exists'}), 409
+        return jsonify({'message': 'Import conflicts with existing data'}), 409
+    return jsonify({'id': summary['wg_id'], 'rows': summary['rows'], 'skipped': summary['skipped']}), 201
@@ -0,0 +1,61 @@
+"""Small in-process caches.
+
+Every process keeps its own copy, so an entry can be stale for up to its
+time to live after another process changed the data behind it. Only cache
+what may be that stale.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe mapping that keeps the ``maxsize`` most recently used entries.
+
+    With ``ttl`` (seconds) entries also expire that long after they were set.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and self.ttl is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._entries.move_to_end(key)
+        CACHE_LOOKUPS.labels(self.name, 'miss' if entry is _MISSING else 'hit').inc()
+        return default if entry is _MISSING else entry[0]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, compute):
+        """Returns the cached value of ``key``, computing and caching it on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,221 @@
+"""iCalendar feeds of tasks, for calendar apps to subscribe to.
+
+Calendar apps poll a feed every few minutes, so a feed is answered with a 304
+whenever nothing changed. Every WG carries ``tasks_version``, bumped together
+with ``tasks_changed_at`` by database triggers on every write to its tasks and
+their assignees; the ETag of a feed is derived from the versions of the WGs it
+covers and the day its window starts, so checking it reads one or two rows and
+no tasks at all.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Task, TaskList, user_task
+
+# Tasks are included from this many days back to this many days ahead
+PAST_DAYS = 30
+FUTURE_DAYS = 365
+
+# Part of every ETag, so a change to the output invalidates the cached copies
+FEED_FORMAT = 1
+
+# Octets per line before a line is folded (RFC 5545, 3.1)
+LINE_OCTETS = 75
+
+
+def _sqlite_ddl():
+    bump = ('UPDATE "WG" SET tasks_version = tasks_version + 1,'
+            " tasks_changed_at = strftime('%Y-%m-%d %H:%M:%S', 'now') WHERE \"idWG\" IN ")
+    of_lists = 'SELECT wg_id FROM "TASKLIST" WHERE "idTaskList" IN ({})'
+    of_task = ('SELECT l.wg_id FROM "TASK" t JOIN "TASKLIST" l ON l."idTaskList" = t.tasklist_id'
+               ' WHERE t."idTask" = {}.task_id')
+    return [
+        'CREATE TRIGGER IF NOT EXISTS wg_tasks_task_insert AFTER INSERT ON "TASK" BEGIN '
+        + bump + '(' + of_lists.format('NEW.tasklist_id') + '); END',
+        # Only the columns a feed shows; moving the next occurrence of a
+        # template does not change any feed
+        'CREATE TRIGGER IF NOT EXISTS wg_tasks_task_update AFTER UPDATE OF'
+        ' title, description, start_date, end_date, is_done, is_template, tasklist_id ON "TASK" BEGIN '
+        + bump + '(' + of_lists.format('OLD.tasklist_id, NEW.tasklist_id') + '); END',
+        'CREATE TRIGGER IF NOT EXISTS wg_tasks_task_delete AFTER DELETE ON "TASK" BEGIN '
+        + bump + '(' + of_lists.format('OLD.tasklist_id') + '); END',
+        'CREATE TRIGGER IF NOT EXISTS wg_tasks_user_insert AFTER INSERT ON user_task BEGIN '
+        + bump + '(' + of_task.format('NEW') + '); END',
+        'CREATE TRIGGER IF NOT EXISTS wg_tasks_user_delete AFTER DELETE ON user_task BEGIN '
+        + bump + '(' + of_task.format('OLD') + '); END',
+    ]
+
+
+# Statement-level triggers bump each WG once per statement, however many rows
+# a bulk insert or cascade delete touches
+POSTGRES_BUMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION wg_tasks_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'TASK' THEN
+        UPDATE "WG" SET tasks_version = tasks_version + 1, tasks_changed_at = timezone('utc', now())
+        WHERE "idWG" IN (SELECT l.wg_id FROM "TASKLIST" l
+                         JOIN changed_rows c ON c.tasklist_id = l."idTaskList");
+    ELSE
+        UPDATE "WG" SET tasks_version = tasks_version + 1, tasks_changed_at = timezone('utc', now())
+        WHERE "idWG" IN (SELECT l.wg_id FROM "TASKLIST" l
+                         JOIN "TASK" t ON t.tasklist_id = l."idTaskList"
+                         JOIN changed_rows c ON c.task_id = t."idTask");
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+POSTGRES_TRIGGERS = [
+    ('wg_tasks_task_insert', 'INSERT', 'TASK', 'NEW'),
+    ('wg_tasks_task_update', 'UPDATE', 'TASK', 'NEW'),
+    ('wg_tasks_task_delete', 'DELETE', 'TASK', 'OLD'),
+    ('wg_tasks_user_insert', 'INSERT', 'user_task', 'NEW'),
+    ('wg_tasks_user_delete', 'DELETE', 'user_task', 'OLD'),
+]
+
+
+def _postgres_ddl():
+    statements = [POSTGRES_BUMP_FUNCTION]
+    for name, operation, table, rows in POSTGRES_TRIGGERS:
+        statements += [
+            f'DROP TRIGGER IF EXISTS {name} ON "{table}"',
+            f'CREATE TRIGGER {name} AFTER {operation} ON "{table}"'
+            f' REFERENCING {rows} TABLE AS changed_rows'
+            f' FOR EACH STATEMENT EXECUTE FUNCTION wg_tasks_changed()',
+        ]
+    return statements
+
+
+def install(connection):
+    """Creates the triggers that keep WG.tasks_version current; safe to run repeatedly."""
+    ddl = _postgres_ddl() if connection.dialect.name == 'postgresql' else _sqlite_ddl()
+    for statement in ddl:
+        connection.exec_driver_sql(statement)
+
+
+def uninstall(connection):
+    postgres = connection.dialect.name == 'postgresql'
+    for name, _, table, _ in POSTGRES_TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}' + (f' ON "{table}"' if postgres else ''))
+    if postgres:
+        connection.exec_driver_sql('DROP FUNCTION IF EXISTS wg_tasks_changed()')
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _install_after_create(target, connection, **kw):
+    install(connection)
+
+
+def in_window(start, end):
+    """Tasks overlapping [start, end): a task without an end is shown at its
+    start, one without a start at its end.
+
+    Both branches are ranges in ix_task_tasklist_end_start for every list.
+    """
+    return db.or_(
+        db.and_(Task.end_date >= start,
+                db.or_(Task.start_date < end, db.and_(Task.start_date == None, Task.end_date < end))),
+        db.and_(Task.end_date == None, Task.start_date >= start, Task.start_date < end))
+
+
+def feed_window(now=None):
+    """The window of a feed, from midnight PAST_DAYS ago; it moves once a day."""
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=PAST_DAYS), today + timedelta(days=FUTURE_DAYS + 1)
+
+
+def feed_query(wg_ids, start, end, user_id=None):
+    """Tasks of the given WGs in the window, optionally only those assigned to a user."""
+    query = (db.select(Task.idTask, Task.title, Task.description, Task.start_date, Task.end_date,
+                       Task.is_done, TaskList.wg_id)
+             .join(TaskList, Task.tasklist_id == TaskList.idTaskList)
+             .where(TaskList.wg_id.in_(wg_ids), Task.is_template == False, in_window(start, end))
+             .order_by(db.func.coalesce(Task.start_date, Task.end_date), Task.idTask))
+    if user_id is not None:
+        query = query.where(db.exists().where(user_task.c.task_id == Task.idTask,
+                                              user_task.c.user_id == user_id))
+    return query
+
+
+def feed_etag(kind, owner_id, wgs, window_start):
+    """Strong ETag of a feed from (id, title, tasks_version) of each WG it covers."""
+    state = [FEED_FORMAT, kind, owner_id, window_start.isoformat(),
+             [[wg_id, title, version] for wg_id, title, version, _ in wgs]]
+    return hashlib.sha256(json.dumps(state).encode()).hexdigest()[:32]
+
+
+def last_modified(wgs, window_start):
+    """The latest change to any of the WGs, or the day the window last moved."""
+    # A change before the window moved can still be the latest one
+    window_moved = window_start + timedelta(days=PAST_DAYS)
+    return max([changed_at for _, _, _, changed_at in wgs if changed_at] + [window_moved])
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n'))
+
+
+def fold(line):
+    """Folds a content line into lines of at most LINE_OCTETS octets, ending in CRLF."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= LINE_OCTETS:
+        return line + '\r\n'
+    parts = []
+    limit = LINE_OCTETS
+    while len(encoded) > limit:
+        cut = limit
+        # Never split a multi-byte character
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        # Continuation lines start with a space, which counts towards the limit
+        limit = LINE_OCTETS - 1
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _timestamp(value):
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def iter_ics(name, rows, stamp, wg_titles=None):
+    """Yields an iCalendar document of one VEVENT per task row.
+
+    ``stamp`` is the DTSTAMP of every event, the feed's last change, so the
+    same state of the tasks always renders to the same bytes. With
+    ``wg_titles`` (id -> title) each event is categorized by its WG.
+    """
+    yield ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//WG-App//Tasks//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(name)}',
+    ))
+    stamp = _timestamp(stamp)
+    for row in rows:
+        start = row.start_date or row.end_date
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:{row.idTask}@wg-app',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{_timestamp(start)}',
+        ]
+        if row.start_date and row.end_date and row.end_date > row.start_date:
+            lines.append(f'DTEND:{_timestamp(row.end_date)}')
+        lines.append('SUMMARY:' + escape(('\u2713 ' if row.is_done else '') + row.title))
+        if row.description:
+            lines.append(f'DESCRIPTION:{escape(row.description)}')
+        if wg_titles:
+            lines.append(f'CATEGORIES:{escape(wg_titles[row.wg_id])}')
+        lines.append('END:VEVENT')
+        yield ''.join(fold(line) for line in lines)
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,137 @@
+import sys
+
+import click
+from flask.cli import AppGroup
+
+from extensions import db
+from database.streaming import (
+    DEFAULT_BATCH_SIZE, get_table, wg_scope, iter_rows, iter_jsonl, iter_csv, json_default
+)
+
+db_inspect_cli = AppGroup('db-inspect', help='Inspect and maintain the database.')
+
+
+def _scope(table, wg_id):
+    """wg_scope of the table, or None if it has no path to a WG (e.g. JOB)."""
+    try:
+        return wg_scope(table, wg_id)
+    except ValueError:
+        return None
+
+
+def _resolve_tables(names, wg_id=None):
+    """The named tables, or all of them; with ``wg_id`` all those that can be scoped to it."""
+    if not names:
+        return [table for table in db.metadata.sorted_tables
+                if not wg_id or _scope(table, wg_id) is not None]
+    tables = []
+    for name in names:
+        table = get_table(name)
+        if table is None:
+            raise click.BadParameter(f'Unknown table: {name}', param_hint='TABLES')
+        if wg_id and _scope(table, wg_id) is None:
+            raise click.BadParameter(f'Table {name} cannot be scoped to a WG', param_hint='TABLES')
+        tables.append(table)
+    return tables
+
+
+def _select(table, wg_id=None, limit=None, offset=None):
+    stmt = db.select(table)
+    if wg_id:
+        stmt = stmt.where(wg_scope(table, wg_id))
+    if table.primary_key.columns:
+        stmt = stmt.order_by(*table.primary_key.columns)
+    if limit:
+        stmt = stmt.limit(limit)
+    if offset:
+        stmt = stmt.offset(offset)
+    return stmt
+
+
+@db_inspect_cli.command('tables')
+@click.option('--wg', 'wg_id', help='Only count rows belonging to this WG.')
+def list_tables(wg_id):
+    """List all tables with their row counts; with --wg those that belong to WGs."""
+    with db.engine.connect() as conn:
+        for table in _resolve_tables((), wg_id):
+            stmt = db.select(db.func.count()).select_from(table)
+            if wg_id:
+                stmt = stmt.where(wg_scope(table, wg_id))
+            count = conn.execute(stmt).scalar()
+            click.echo(f'{table.name:<22} {count:>10}')
+
+
+@db_inspect_cli.command('show')
+@click.argument('table_name')
+@click.option('--wg', 'wg_id', help='Only show rows belonging to this WG.')
+@click.option('--limit', type=int, help='Maximum number of rows to show.')
+@click.option('--offset', type=int, help='Number of rows to skip.')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--no-pager', is_flag=True, help='Write straight to stdout.')
+def show_table(table_name, wg_id, limit, offset, batch_size, no_pager):
+    """Show the rows of a table, one page at a time."""
+    table = get_table(table_name)
+    if table is None:
+        raise click.BadParameter(f'Unknown table: {table_name}', param_hint='TABLE_NAME')
+    if wg_id and _scope(table, wg_id) is None:
+        raise click.BadParameter(f'Table {table_name} cannot be scoped to a WG', param_hint='TABLE_NAME')
+    columns = [c.name for c in table.columns]
+
+    def lines():
+        with db.engine.connect() as conn:
+            yield ' | '.join(columns) + '\n'
+            for row in iter_rows(conn, _select(table, wg_id, limit, offset), batch_size):
+                yield ' | '.join('' if v is None else json_default(v) for v in row) + '\n'
+
+    if no_pager:
+        for line in lines():
+            click.echo(line, nl=False)
+    else:
+        click.echo_via_pager(lines())
+
+
+@db_inspect_cli.command('dump')
+@click.argument('table_names', metavar='[TABLES]...', nargs=-1)
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default='jsonl', show_default=True)
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help='File to write to, "-" for stdout.')
+@click.option('--wg', 'wg_id', help='Only dump rows belonging to this WG.')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+def dump_tables(table_names, fmt, output, wg_id, batch_size):
+    """Stream tables to CSV or JSON lines.
+
+    JSON lines tag every row with its table, so several tables can share one
+    file. CSV only supports a single table per file.
+    """
+    tables = _resolve_tables(table_names, wg_id)
+    if fmt == 'csv' and len(tables) != 1:
+        raise click.UsageError('CSV output requires exactly one table.')
+
+    out = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+    try:
+        with db.engine.connect() as conn:
+            for table in tables:
+                columns = [c.name for c in table.columns]
+                rows = iter_rows(conn, _select(table, wg_id), batch_size)
+                if fmt == 'csv':
+                    chunks = iter_csv(rows, columns)
+                else:
+                    chunks = iter_jsonl(rows, columns, extra={'_table': table.name})
+                for chunk in chunks:
+                    out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+@db_inspect_cli.command('vacuum')
+@click.option('--analyze/--no-analyze', default=True, show_default=True,
+              help='Refresh the planner statistics as well.')
+def vacuum(analyze):
+    """Reclaim free space and refresh planner statistics."""
+    # VACUUM cannot run inside a transaction on either SQLite or Postgres
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('VACUUM')
+        if analyze:
+            conn.exec_driver_sql('ANALYZE')
+    click.echo('Vacuum finished.')
@@ -0,0 +1,55 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import shards
+from extensions import db
+from models import WGShard
+
+shards_cli = AppGroup('shards', help='Place WGs in several databases.')
+
+
+@shards_cli.command('init')
+def init_command():
+    """Create the tables in every shard that lacks them."""
+    for name in shards.shard_names()[1:]:
+        db.metadata.create_all(shards.shard_engine(name))
+        click.echo(f'Shard {name} is ready')
+
+
+@shards_cli.command('list')
+def list_command():
+    """Show how many WGs every shard holds."""
+    counts = shards.wg_counts()
+    for name in shards.shard_names():
+        click.echo(f'{name:<20} {counts.get(name, 0):>10}')
+
+
+@shards_cli.command('move')
+@click.argument('wg_id')
+@click.argument('shard')
+def move_command(wg_id, shard):
+    """Move a WG's lists, tasks, items and costs to another shard, online."""
+    if not shards.enabled():
+        raise click.ClickException('No shards configured, set SHARD_DATABASE_URLS')
+    started = time.perf_counter()
+    try:
+        copied = shards.move_wg(wg_id, shard, log=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Moved {sum(copied.values())} rows in {time.perf_counter() - started:.2f}s')
+    for table, count in copied.items():
+        click.echo(f'  {table:<22} {count:>10}')
+
+
+@shards_cli.command('sync')
+def sync_command():
+    """Refresh the copies of the WGs, memberships and users on every shard."""
+    placed = db.session.execute(
+        db.select(WGShard.wg_id, WGShard.shard).where(WGShard.shard != shards.MAIN)).all()
+    for wg_id, name in placed:
+        if name in current_app.config['SHARD_DATABASE_URLS']:
+            shards.sync_wg(wg_id, name)
+    click.echo(f'Refreshed {len(placed)} WGs')
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from extensions import swagger
+
+basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+openapi_cli = AppGroup('openapi', help='Build the cached OpenAPI spec.')
+
+# Runs in a fresh interpreter so that every import is measured, and prints the
+# wall time of create_app() itself on the last line.
+PROFILE_SNIPPET = (
+    'import time; t = time.perf_counter(); '
+    'from app import create_app; create_app(); '
+    'print("create_app %.1f" % ((time.perf_counter() - t) * 1000))'
+)
+
+
+@openapi_cli.command('build')
+def build_spec():
+    """Compile the OpenAPI spec from the view docstrings into a static file."""
+    path = swagger.write_spec()
+    click.echo(f'OpenAPI spec written to {path}')
+
+
+def parse_importtime(output):
+    """Parses ``-X importtime`` lines into (self_us, cumulative_us, module)."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        entries.append((int(parts[0]), int(parts[1]), parts[2].rstrip()))
+    return entries
+
+
+@click.command('startup-report')
+@click.option('--top', type=int, default=25, show_default=True, help='Number of modules to list.')
+@click.option('--sort', type=click.Choice(['cumulative', 'self']), default='cumulative', show_default=True)
+def startup_report(top, sort):
+    """Report import and start-up time of the app factory (python -X importtime)."""
+    env = dict(os.environ)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROFILE_SNIPPET],
+        cwd=basedir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise click.ClickException(proc.stderr.strip().splitlines()[-1])
+
+    entries = parse_importtime(proc.stderr)
+    # Nested imports are indented by two spaces per level below the top one
+    top_level = [e for e in entries if not e[2].startswith('  ')]
+    total_imports = sum(e[1] for e in top_level)
+    wall = next((line.split()[1] for line in proc.stdout.splitlines() if line.startswith('create_app ')), '?')
+
+    click.echo(f'create_app() wall time: {wall} ms')
+    click.echo(f'imports: {len(entries)} modules, {total_imports / 1000:.1f} ms')
+    click.echo(f"DB_STARTUP_MODE: {current_app.config['DB_STARTUP_MODE']}, "
+               f"cached OpenAPI spec: {'yes' if os.path.exists(swagger.spec_file) else 'no'}")
+    click.echo()
+    click.echo(f"{'self [ms]':>10} {'cumul [ms]':>11}  module")
+    key = 1 if sort == 'cumulative' else 0
+    for self_us, cumulative_us, module in sorted(entries, key=lambda e: e[key], reverse=True)[:top]:
+        click.echo(f'{self_us / 1000:>10.1f} {cumulative_us / 1000:>11.1f}  {module.strip()}')
@@ -0,0 +1,18 @@
+import time
+
+import click
+from flask.cli import AppGroup
+
+from recurrence import materialize_due
+from shards import shard_engine, shard_names
+
+tasks_cli = AppGroup('tasks', help='Maintain recurring tasks.')
+
+
+@tasks_cli.command('materialize')
+@click.option('--window-days', type=int, help='Days ahead to create instances for; RECURRENCE_WINDOW_DAYS by default.')
+def materialize_command(window_days):
+    """Create the instances of every recurring template that is due."""
+    started = time.perf_counter()
+    created = sum(materialize_due(window_days=window_days, engine=shard_engine(name)) for name in shard_names())
+    click.echo(f'Created {created} tasks in {time.perf_counter() - started:.2f}s')
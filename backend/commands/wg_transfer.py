@@ -0,0 +1,62 @@
+import sys
+import time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from models import User, WG
+from database.wg_transfer import iter_wg_export, import_wg, WGImportError
+from shards import shard_engine, shard_of
+
+wg_cli = AppGroup('wg', help='Export and import whole WGs.')
+
+
+@wg_cli.command('export')
+@click.argument('wg_id')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help='File to write to, "-" for stdout.')
+def export_command(wg_id, output):
+    """Stream a WG and everything below it as JSON lines."""
+    if not WG.query.get(wg_id):
+        raise click.BadParameter(f'WG {wg_id} not found', param_hint='WG_ID')
+    out = sys.stdout if output == '-' else open(output, 'w', encoding='utf-8')
+    try:
+        for line in iter_wg_export(wg_id, engine=shard_engine(shard_of(wg_id))):
+            out.write(line)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+@wg_cli.command('import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--creator', help='Username that becomes the creator of the imported WG.')
+@click.option('--keep-ids', is_flag=True, help='Keep the original ids instead of generating new ones.')
+@click.option('--title', help='Title for the imported WG.')
+@click.option('--address', help='Address for the imported WG.')
+@click.option('--etage', help='Etage for the imported WG.')
+def import_command(source, creator, keep_ids, title, address, etage):
+    """Bulk-import a WG export in a single transaction."""
+    creator_id = None
+    if creator:
+        user = User.query.filter_by(strUser=creator).first()
+        if not user:
+            raise click.BadParameter(f'User {creator} not found', param_hint='--creator')
+        creator_id = user.idUser
+
+    started = time.perf_counter()
+    try:
+        summary = import_wg(source, creator_id=creator_id, keep_ids=keep_ids,
+                            overrides={'title': title, 'address': address, 'etage': etage})
+    except WGImportError as e:
+        raise click.ClickException(f'Invalid export: {e}')
+    except IntegrityError as e:
+        raise click.ClickException(f'Import conflicts with existing data: {e.orig}')
+
+    total = sum(summary['rows'].values())
+    click.echo(f"Imported WG {summary['wg_id']}: {total} rows in {time.perf_counter() - started:.2f}s")
+    for table, count in summary['rows'].items():
+        click.echo(f'  {table:<22} {count:>10}')
+    if summary['skipped']:
+        click.echo(f"  skipped {summary['skipped']} rows referencing unknown users")
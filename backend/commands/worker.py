@@ -0,0 +1,37 @@
+import signal
+import threading
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from jobs import Worker, start_workers
+
+
+@click.command('worker')
+@click.option('--threads', type=int, default=2, show_default=True, help='Worker threads.')
+@click.option('--drain', is_flag=True, help='Run the jobs that are due and exit.')
+@with_appcontext
+def worker_command(threads, drain):
+    """Process background jobs until interrupted."""
+    app = current_app._get_current_object()
+    if drain:
+        worker = Worker(app)
+        count = 0
+        while worker.run_once():
+            count += 1
+        click.echo(f'Ran {count} jobs')
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    workers = start_workers(app, threads, stop)
+    click.echo(f'Processing jobs with {threads} threads, Ctrl+C to stop')
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        stop.set()
+    # Jobs in progress finish; anything cut short is retried after its visibility timeout
+    for thread in workers:
+        thread.join()
@@ -0,0 +1,43 @@
+"""Optimistic concurrency for rows with a ``version`` column.
+
+Tasks, items, costs, task lists and shopping lists are mapped with
+``version_id_col``: every ORM update is ``UPDATE ... WHERE version = :v``
+and bumps the version, so of two concurrent writes based on the same state
+one succeeds and the other fails with StaleDataError instead of silently
+overwriting it. No row is locked while a client thinks.
+
+Serialized rows include their ``version``; clients may send the one they last
+saw as ``If-Match``, and the responses of writes carry the new one as the
+``ETag``. Changes to assignees do not bump it.
+"""
+from flask import jsonify, request
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+
+
+def version_mismatch(obj):
+    """The 412 response when If-Match names another version than obj's, else None."""
+    if request.if_match and not request.if_match.contains(str(obj.version)):
+        return jsonify({'message': 'Precondition failed', 'version': obj.version}), 412
+    return None
+
+
+def with_etag(body, obj, status=200):
+    """A JSON response carrying obj's version as its ETag."""
+    response = jsonify(body)
+    response.status_code = status
+    response.set_etag(str(obj.version))
+    return response
+
+
+def _conflict(error):
+    db.session.rollback()
+    # With If-Match the precondition failed, only after it was checked
+    status = 412 if request.if_match else 409
+    return jsonify({'message': 'Modified concurrently, reload and try again'}), status
+
+
+def init_concurrency(app):
+    """Answers writes that lost a race with 409, or 412 under If-Match."""
+    app.register_error_handler(StaleDataError, _conflict)
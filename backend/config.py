@@ -7,7 +7,80 @@ class Config:
     # Generate a random secret if one is not provided in the environment
     SECRET_KEY = uuid.uuid4().hex
     # SQLite database URI – the database file will be stored in a folder named "themealdb"
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'database', 'wg_app.db')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        'sqlite:///' + os.path.join(basedir, 'database', 'wg_app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Read-only copy of the database that GET requests read from (replica.py);
+    # a user who wrote reads from the primary for REPLICA_STICKY_SECONDS
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    # Further databases WG subtrees are placed in (shards.py), as space-separated
+    # name=url pairs; new WGs go to NEW_WG_SHARD, 'auto' picks the one with the
+    # fewest WGs. Every process caches where a WG is for SHARD_CACHE_SECONDS
+    SHARD_DATABASE_URLS = dict(pair.split('=', 1) for pair in os.environ.get('SHARD_DATABASE_URLS', '').split())
+    NEW_WG_SHARD = os.environ.get('NEW_WG_SHARD', 'auto')
+    SHARD_CACHE_SECONDS = float(os.environ.get('SHARD_CACHE_SECONDS', '5'))
+    SQLALCHEMY_BINDS = {
+        **({'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}),
+        **{f'shard_{name}': url for name, url in SHARD_DATABASE_URLS.items()},
+    }
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
     BCRYPT_LOG_ROUNDS = 13
+    # 'create_all' creates missing tables on start (development), 'check' only
+    # verifies that the database is at the latest Alembic revision, 'none' skips both
+    DB_STARTUP_MODE = os.environ.get('DB_STARTUP_MODE', 'create_all')
+    # Pre-built spec written by 'flask openapi build'; defaults to static/openapi.json
+    OPENAPI_SPEC_FILE = os.environ.get('OPENAPI_SPEC_FILE')
+    # When set, GET /metrics requires 'Authorization: Bearer <METRICS_TOKEN>'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # SQL profiling (profiler.py): always on with SQL_PROFILING=1, or per request
+    # by sending PROFILE_TOKEN in the X-Profile header
+    SQL_PROFILING = os.environ.get('SQL_PROFILING') == '1'
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '50'))
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '3'))
+    # Recurring tasks (recurrence.py): instances are created this many days
+    # ahead, checked by requests at most every RECURRENCE_CHECK_SECONDS per
+    # process; 0 leaves it to 'flask tasks materialize'
+    RECURRENCE_WINDOW_DAYS = int(os.environ.get('RECURRENCE_WINDOW_DAYS', '28'))
+    RECURRENCE_CHECK_SECONDS = int(os.environ.get('RECURRENCE_CHECK_SECONDS', '300'))
+    # Background jobs (jobs.py): worker threads started in every app process;
+    # set to 0 when a separate 'flask worker' process handles the queue
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', '1'))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '1'))
+    JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT', '300'))
+    JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', '5'))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+    # Username suggestions (GET /users/suggest): requests a second per user with
+    # bursts up to USER_SUGGEST_BURST, and an LRU of the answers per prefix
+    USER_SUGGEST_RATE = float(os.environ.get('USER_SUGGEST_RATE', '10'))
+    USER_SUGGEST_BURST = int(os.environ.get('USER_SUGGEST_BURST', '20'))
+    USER_SUGGEST_CACHE_SIZE = int(os.environ.get('USER_SUGGEST_CACHE_SIZE', '2048'))
+    USER_SUGGEST_CACHE_SECONDS = float(os.environ.get('USER_SUGGEST_CACHE_SECONDS', '30'))
+    # Idempotency keys (idempotency.py): responses are replayed for this long,
+    # and expired ones deleted at most every IDEMPOTENCY_PURGE_SECONDS per process.
+    # A request still unfinished after IDEMPOTENCY_LEASE_SECONDS (a little over
+    # gunicorn's 30 s timeout) is taken for dead and its key may be claimed again
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+    IDEMPOTENCY_PURGE_SECONDS = int(os.environ.get('IDEMPOTENCY_PURGE_SECONDS', '300'))
+    IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+    # Responses of the WG read endpoints (response_cache.py): entries kept per
+    # process (0 switches the cache off), and for how long the workers share
+    # them through SHARED_STORE
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '512'))
+    RESPONSE_CACHE_SECONDS = float(os.environ.get('RESPONSE_CACHE_SECONDS', '300'))
+    # SQLite file through which the workers of a host share rate limit buckets, the
+    # recent writers of the replica routing and cached responses (shared_store.py);
+    # gunicorn.conf.py sets it
+    SHARED_STORE = os.environ.get('SHARED_STORE')
+    # Rate limits (ratelimit.py) per route class: requests a second and burst per
+    # client IP for login and registration, per user (or IP) for writes and reads
+    RATE_LIMITS = os.environ.get('RATE_LIMITS', '1') == '1'
+    RATE_LIMIT_AUTH_RATE = float(os.environ.get('RATE_LIMIT_AUTH_RATE', '0.1'))
+    RATE_LIMIT_AUTH_BURST = int(os.environ.get('RATE_LIMIT_AUTH_BURST', '10'))
+    RATE_LIMIT_WRITE_RATE = float(os.environ.get('RATE_LIMIT_WRITE_RATE', '5'))
+    RATE_LIMIT_WRITE_BURST = int(os.environ.get('RATE_LIMIT_WRITE_BURST', '30'))
+    RATE_LIMIT_READ_RATE = float(os.environ.get('RATE_LIMIT_READ_RATE', '20'))
+    RATE_LIMIT_READ_BURST = int(os.environ.get('RATE_LIMIT_READ_BURST', '100'))
+    # Number of reverse proxies in front of the app whose X-Forwarded-For is trusted
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
     SECRET_KEY = os.environ.get('SECRET_KEY') or '8e8409ab91164b33b5db1e5cd2a69653'
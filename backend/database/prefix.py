@@ -0,0 +1,32 @@
+"""Case-insensitive prefix matching that seeks in a lower(column) index.
+
+The indexes are declared with models._lower_indexes.
+"""
+import string
+
+from extensions import db
+
+# SQLite's lower() only folds ASCII letters
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def folded(column):
+    """lower(column) as the prefix indexes compare it, byte by byte."""
+    expression = db.func.lower(column)
+    if db.engine.dialect.name == 'postgresql':
+        expression = expression.collate('C')
+    return expression
+
+
+def fold(prefix):
+    """``prefix`` as the database's lower() folds it, so equal results share a cache key."""
+    if db.engine.dialect.name == 'sqlite':
+        return prefix.translate(_ASCII_LOWER)
+    return prefix.lower()
+
+
+def starts_with(column, prefix):
+    """lower(column) starts with lower(prefix)."""
+    # A range rather than LIKE: SQLite does not use an expression index for LIKE
+    prefix = db.func.lower(prefix)
+    return db.and_(folded(column) >= prefix, folded(column) < prefix + '\U0010ffff')
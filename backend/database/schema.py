@@ -0,0 +1,39 @@
+import os
+
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from extensions import db
+
+basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+MIGRATIONS_DIR = os.path.join(basedir, 'migrations')
+
+
+class SchemaOutOfDateError(RuntimeError):
+    pass
+
+
+def get_head_revisions():
+    return set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+
+
+def get_current_revisions():
+    with db.engine.connect() as conn:
+        return set(MigrationContext.configure(conn).get_current_heads())
+
+
+def check_schema_revision():
+    """Makes sure the database was migrated to the latest Alembic revision.
+
+    This only reads ``alembic_version`` and the revision headers of the
+    migration scripts, which is much cheaper than reflecting every table the
+    way ``db.create_all()`` does on each start.
+    """
+    current = get_current_revisions()
+    heads = get_head_revisions()
+    if current != heads:
+        raise SchemaOutOfDateError(
+            f"Database schema is at revision {', '.join(sorted(current)) or '<none>'}, "
+            f"expected {', '.join(sorted(heads))}. Run 'flask db upgrade'."
+        )
+    return current
@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from extensions import db
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_table(table_name):
+    """Returns the mapped Table for a name, matching case-insensitively."""
+    tables = db.metadata.tables
+    if table_name in tables:
+        return tables[table_name]
+    for name, table in tables.items():
+        if name.lower() == table_name.lower():
+            return table
+    return None
+
+
+def _wg_link(table):
+    """Finds the foreign key that leads from a table towards the WG table.
+
+    The association tables also reference USERS, so foreign keys pointing at
+    USERS are skipped, as are references within the same table such as the
+    template of a task; every other table reaches WG through exactly one parent.
+    """
+    for fk in table.foreign_keys:
+        if fk.column.table.name != 'USERS' and fk.column.table is not table:
+            return fk
+    return None
+
+
+def wg_scope(table, wg_id):
+    """Builds a WHERE clause restricting a table to the rows of a single WG.
+
+    The clause is made of nested ``IN (SELECT ...)`` sub-queries along the
+    foreign keys, so the database resolves the scope without loading any
+    parent rows into Python.
+    """
+    if table.name == 'WG':
+        return table.c.idWG == wg_id
+    if table.name == 'USERS':
+        user_wg = db.metadata.tables['user_wg']
+        return table.c.idUser.in_(
+            db.select(user_wg.c.user_id).where(user_wg.c.wg_id == wg_id)
+        )
+    if 'wg_id' in table.c:
+        return table.c.wg_id == wg_id
+    fk = _wg_link(table)
+    if fk is None:
+        raise ValueError(f'Table {table.name} cannot be scoped to a WG')
+    parent = fk.column.table
+    return fk.parent.in_(
+        db.select(fk.column).where(wg_scope(parent, wg_id))
+    )
+
+
+def iter_rows(connection, statement, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields result rows in batches of ``batch_size``.
+
+    ``yield_per`` turns on server-side cursors where the driver supports them
+    (psycopg2 named cursors) and keeps SQLite from buffering the whole result,
+    so memory use does not grow with the size of the table.
+    """
+    result = connection.execution_options(yield_per=batch_size).execute(statement)
+    for partition in result.partitions():
+        for row in partition:
+            yield row
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def iter_jsonl(rows, columns, extra=None):
+    """Encodes rows as JSON lines, one object per row."""
+    for row in rows:
+        record = dict(extra) if extra else {}
+        record.update(zip(columns, row))
+        yield json.dumps(record, default=json_default) + '\n'
+
+
+def iter_csv(rows, columns):
+    """Encodes rows as CSV, header first, reusing a single line buffer."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writerow(columns)
+    yield flush()
+    for row in rows:
+        writer.writerow([json_default(v) if isinstance(v, (datetime, date, bytes)) else v for v in row])
+        yield flush()
+
+
+def iter_lines(stream, chunk_size=64 * 1024):
+    """Splits a binary stream into lines while reading it in large chunks.
+
+    Iterating a WSGI input stream directly reads it line by line through
+    ``readline``, which is several times slower for large uploads.
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
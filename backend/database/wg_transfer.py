@@ -0,0 +1,282 @@
+import json
+from datetime import datetime
+
+from extensions import db
+from models.types import new_id
+from database.streaming import DEFAULT_BATCH_SIZE, wg_scope, iter_rows, iter_jsonl
+
+EXPORT_FORMAT = 'wg-export'
+EXPORT_VERSION = 1
+
+# Parents always come before their children, so an import can insert the
+# tables in file order without deferring any foreign key.
+EXPORT_TABLES = [
+    'USERS', 'WG', 'user_wg', 'admin_wg',
+    'TASKLIST', 'user_tasklist', 'TASK', 'user_task',
+    'SHOPPINGLIST', 'user_shoppinglist', 'ITEM', 'user_item',
+    'BUDGETPLANNING', 'user_budgetplanning', 'COST', 'user_cost',
+]
+
+# Members are exported as references only; password hashes and e-mail
+# addresses never leave the database through an export.
+USER_COLUMNS = ('idUser', 'strUser')
+
+IMPORT_BATCH_SIZE = 5000
+
+# Unique constraints of WG -> their columns, as named in SQLite's errors
+WG_UNIQUE_CONSTRAINTS = {'uq_wg_title': ('title',), 'uq_wg_address_etage': ('address', 'etage')}
+
+
+class WGImportError(ValueError):
+    pass
+
+
+def _export_columns(table):
+    if table.name == 'USERS':
+        return [table.c[name] for name in USER_COLUMNS]
+    return list(table.columns)
+
+
+def scoped_select(table, wg_id, columns=None):
+    """Selects the rows of a table that belong to a WG, insertable in this order."""
+    stmt = db.select(*(columns or table.columns)).where(wg_scope(table, wg_id))
+    # Rows referencing another row of the same table (task instances and
+    # their template) come after the rows without such a reference
+    self_refs = [fk.parent for fk in table.foreign_keys if fk.column.table is table]
+    if self_refs:
+        stmt = stmt.order_by(*(column.is_not(None) for column in self_refs))
+    return stmt
+
+
+def iter_wg_export(wg_id, batch_size=DEFAULT_BATCH_SIZE, engine=None):
+    """Yields the whole subtree of a WG as JSON lines.
+
+    The first line is a header; every following line is one row tagged with
+    its ``_table``. Rows are streamed table by table with a single connection,
+    so memory use stays flat however large the WG is. ``engine`` is the
+    database to read from, the WG's shard (shards.py).
+    """
+    yield json.dumps({
+        '_type': 'header',
+        'format': EXPORT_FORMAT,
+        'version': EXPORT_VERSION,
+        'wg_id': wg_id,
+        'exported_at': datetime.utcnow().isoformat(),
+    }) + '\n'
+    with (engine or db.engine).connect() as conn:
+        for name in EXPORT_TABLES:
+            table = db.metadata.tables[name]
+            columns = _export_columns(table)
+            rows = iter_rows(conn, scoped_select(table, wg_id, columns), batch_size)
+            yield from iter_jsonl(rows, [c.name for c in columns], extra={'_table': name})
+
+
+def _parse_datetime(value):
+    if not isinstance(value, str):
+        raise TypeError(value)
+    return datetime.fromisoformat(value)
+
+
+def _column_converter(column):
+    if isinstance(column.type, db.DateTime):
+        return _parse_datetime
+    return None
+
+
+def is_wg_conflict(error):
+    """Whether an IntegrityError is a clash with the title or address of an existing WG."""
+    diag = getattr(error.orig, 'diag', None)
+    if diag is not None:
+        return diag.constraint_name in WG_UNIQUE_CONSTRAINTS
+    return str(error.orig) in {'UNIQUE constraint failed: ' + ', '.join(f'WG.{name}' for name in columns)
+                               for columns in WG_UNIQUE_CONSTRAINTS.values()}
+
+
+class WGImporter:
+    """Bulk-inserts an exported WG, remapping every primary key.
+
+    Rows are buffered per table and written with Core ``executemany`` in
+    batches of ``batch_size``. Foreign keys are rewritten through the id maps
+    of the referenced tables; references to users are resolved against the
+    existing accounts by id first and by username second.
+    """
+
+    def __init__(self, conn, creator_id=None, keep_ids=False, overrides=None,
+                 batch_size=IMPORT_BATCH_SIZE):
+        self.conn = conn
+        self.creator_id = creator_id
+        self.keep_ids = keep_ids
+        self.overrides = {k: v for k, v in (overrides or {}).items() if v is not None}
+        self.batch_size = batch_size
+        self.id_maps = {}
+        self.user_map = {}
+        self.counts = {}
+        self.skipped = 0
+        self.wg_id = None
+        self._table = None
+        self._buffer = []
+        self._pending_users = []
+        self._plans = {}
+        self._seen_header = False
+        self._creator_memberships = set()
+
+    def feed_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise WGImportError(f'Invalid JSON line: {e}')
+        self.feed(record)
+
+    def feed(self, record):
+        if not isinstance(record, dict):
+            raise WGImportError('Every line must be a JSON object')
+        if record.get('_type') == 'header':
+            if record.get('format') != EXPORT_FORMAT or record.get('version') != EXPORT_VERSION:
+                raise WGImportError('Unsupported export format')
+            self._seen_header = True
+            return
+        if not self._seen_header:
+            raise WGImportError('Missing export header')
+
+        name = record.pop('_table', None)
+        if name not in EXPORT_TABLES:
+            raise WGImportError(f'Unknown table: {name}')
+        if name != self._table:
+            if self._table and EXPORT_TABLES.index(name) < EXPORT_TABLES.index(self._table):
+                raise WGImportError(f'Table {name} is out of order')
+            self._flush()
+            self._table = name
+
+        if name == 'USERS':
+            self._pending_users.append(record)
+            return
+        row = self._remap(db.metadata.tables[name], record)
+        if row is None:
+            self.skipped += 1
+            return
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def finish(self):
+        self._flush()
+        if self.wg_id is None:
+            raise WGImportError('Export does not contain a WG')
+        self._ensure_creator_membership()
+        return {'wg_id': self.wg_id, 'rows': self.counts, 'skipped': self.skipped}
+
+    def _plan(self, table):
+        """Works out once per table how each column has to be rewritten."""
+        plan = self._plans.get(table.name)
+        if plan is None:
+            plan = []
+            for column in table.columns:
+                fk = next(iter(column.foreign_keys), None)
+                # Exports from before a column was added lack it; those rows
+                # get its default, e.g. version 1
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                plan.append((
+                    column.name,
+                    column.primary_key and fk is None,
+                    fk.column.table.name if fk is not None else None,
+                    column.nullable,
+                    _column_converter(column),
+                    default,
+                ))
+            self._plans[table.name] = plan
+        return plan
+
+    def _new_id(self, table_name, old_id):
+        value = old_id if self.keep_ids else new_id()
+        self.id_maps.setdefault(table_name, {})[old_id] = value
+        return value
+
+    def _remap(self, table, record):
+        row = {}
+        for name, is_pk, target, nullable, convert, default in self._plan(table):
+            value = record.get(name, default)
+            if is_pk:
+                value = self._new_id(table.name, value)
+            elif target == 'USERS':
+                if table.name == 'WG' and name == 'creator_id' and self.creator_id:
+                    value = self.creator_id
+                elif value is not None:
+                    value = self.user_map.get(value)
+                    if value is None:
+                        if table.name == 'WG':
+                            raise WGImportError('The WG creator does not exist in this database')
+                        # Unknown users are dropped from association rows and
+                        # cleared from optional references such as creator_id
+                        if not nullable or not table.primary_key.columns:
+                            return None
+            elif target is not None and value is not None:
+                value = self.id_maps.get(target, {}).get(value)
+                if value is None:
+                    raise WGImportError(f'{table.name}.{name} references a row outside the export')
+            if convert is not None and value is not None:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError):
+                    raise WGImportError(f'{table.name}.{name}: invalid datetime')
+            row[name] = value
+
+        if table.name == 'WG':
+            if self.wg_id is not None:
+                raise WGImportError('Export contains more than one WG')
+            row.update(self.overrides)
+            self.wg_id = row['idWG']
+        elif table.name in ('user_wg', 'admin_wg') and row['user_id'] == self.creator_id:
+            self._creator_memberships.add(table.name)
+        return row
+
+    def _resolve_users(self):
+        users = db.metadata.tables['USERS']
+        ids = [u.get('idUser') for u in self._pending_users]
+        names = [u.get('strUser') for u in self._pending_users]
+        by_id, by_name = {}, {}
+        for start in range(0, len(ids), 500):
+            stmt = db.select(users.c.idUser, users.c.strUser).where(
+                users.c.idUser.in_(ids[start:start + 500]) |
+                users.c.strUser.in_(names[start:start + 500])
+            )
+            for user_id, username in self.conn.execute(stmt):
+                by_id[user_id] = user_id
+                by_name[username] = user_id
+        for user in self._pending_users:
+            target = by_id.get(user.get('idUser')) or by_name.get(user.get('strUser'))
+            if target:
+                self.user_map[user['idUser']] = target
+        self.counts['USERS'] = len(self.user_map)
+        self._pending_users = []
+
+    def _flush(self):
+        if self._table == 'USERS' and self._pending_users:
+            self._resolve_users()
+        if not self._buffer:
+            return
+        table = db.metadata.tables[self._table]
+        self.conn.execute(table.insert(), self._buffer)
+        self.counts[self._table] = self.counts.get(self._table, 0) + len(self._buffer)
+        self._buffer = []
+
+    def _ensure_creator_membership(self):
+        if not self.creator_id:
+            return
+        for name in ('user_wg', 'admin_wg'):
+            if name not in self._creator_memberships:
+                table = db.metadata.tables[name]
+                self.conn.execute(table.insert(), [{'user_id': self.creator_id, 'wg_id': self.wg_id}])
+                self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def import_wg(lines, creator_id=None, keep_ids=False, overrides=None, batch_size=IMPORT_BATCH_SIZE):
+    """Imports an exported WG from an iterable of JSON lines in one transaction."""
+    with db.engine.begin() as conn:
+        importer = WGImporter(conn, creator_id=creator_id, keep_ids=keep_ids,
+                              overrides=overrides, batch_size=batch_size)
+        for line in lines:
+            importer.feed_line(line)
+        return importer.finish()
@@ -2,26 +2,61 @@
 from functools import wraps
 from flask import request, jsonify, current_app, g
 import jwt
+import time
 from models import User  # ensure you import your User model
+import shards
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            parts = auth_header.split()
-            token = parts[1] if len(parts) == 2 else parts[0]
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 403
-        try:
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            user = User.query.filter_by(idUser=data.get("user_id"), strUser=data.get("username"), strEmail=data.get("email")).first()
-            if not user:
-                return jsonify({'message': 'User not found!'}), 404
-            # Save the authenticated user to g
-            g.current_user = user
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 403
+        started = time.perf_counter()
+        response = authenticate()
+        # Used by the profiler to split Server-Timing into auth and DB time
+        g.auth_window = (started, time.perf_counter())
+        if response is None:
+            response = shards.route_request()
+        if response is not None:
+            return response
         return f(*args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
+
+
+def bearer_token():
+    """The token of the request's Authorization header, or None."""
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        parts = auth_header.split()
+        return parts[1] if len(parts) == 2 else parts[0]
+    return None
+
+
+def token_user_id():
+    """The user id of a validly signed token, without loading the user."""
+    token = bearer_token()
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"]).get("user_id")
+    except jwt.InvalidTokenError:
+        return None
+
+
+def authenticate():
+    """Loads the user of the request's token into g, returns an error response otherwise."""
+    token = bearer_token()
+    if not token:
+        return jsonify({'message': 'Token is missing!'}), 403
+    try:
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        user = User.query.filter_by(idUser=data.get("user_id"), strUser=data.get("username"), strEmail=data.get("email")).first()
+        if not user and g.get('read_replica'):
+            # The replica may not have caught up with a user who just registered
+            g.read_replica = False
+            user = User.query.filter_by(idUser=data.get("user_id"), strUser=data.get("username"), strEmail=data.get("email")).first()
+        if not user:
+            return jsonify({'message': 'User not found!'}), 404
+        # Save the authenticated user to g
+        g.current_user = user
+    except Exception as e:
+        return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 403
+    return None
\ No newline at end of file
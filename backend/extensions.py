@@ -1,9 +1,69 @@
+import sqlite3
+
+from flask import g, has_app_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
-from flasgger import Swagger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
+from openapi import CachedSwagger
+
+# Bind key of the read replica, see replica.py
+REPLICA = 'replica'
+# Bind keys of the WG shards are this prefix and the shard's name, see shards.py
+SHARD_PREFIX = 'shard_'
+# Tables only the main database is authoritative for; the shards keep copies
+# of the first four for their joins
+GLOBAL_TABLES = frozenset({'USERS', 'WG', 'user_wg', 'admin_wg', 'WGSHARD', 'FEEDTOKEN', 'IDEMPOTENCYKEY', 'JOB'})
+
+
+def _global_only(mapper, clause):
+    if clause is not None:
+        names = {table.name for table in find_tables(clause, include_aliases=True, include_joins=True,
+                                                     include_crud=True)}
+    else:
+        names = {table.name for table in mapper.tables} if mapper is not None else set()
+    # Textual SQL, such as the search queries, names no table and follows the shard
+    return bool(names) and names <= GLOBAL_TABLES
+
+
+class RoutingSession(Session):
+    """Sends WG subtree statements to the request's shard (g.shard) and reads
+    to the replica while the request allows it (g.read_replica)."""
 
-db = SQLAlchemy()
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('shard') and (
+                not _global_only(mapper, clause) or self._assignments(mapper, clause)):
+            return self._db.engines[SHARD_PREFIX + g.shard]
+        if bind is None and has_request_context() and g.get('read_replica'):
+            if (self._flushing or isinstance(clause, UpdateBase)
+                    or getattr(clause, '_for_update_arg', None) is not None):
+                # Writes and locks go to the primary, and so do the reads after them
+                g.read_replica = False
+            else:
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _assignments(self, mapper, clause):
+        # A flush writes the association rows of list.users and the like with
+        # the connection of the User mapper; shards.py tells which flushes do
+        return (self._flushing and clause is None and mapper is not None
+                and mapper.local_table.name == 'USERS' and self.info.get('shard_assignments', False))
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 migrate = Migrate()
-swagger = Swagger()
\ No newline at end of file
+swagger = CachedSwagger()
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores foreign keys, and with them ON DELETE CASCADE, unless asked."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
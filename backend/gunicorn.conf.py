@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:7701')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+wsgi_app = 'app:create_app()'
+
+# The workers share their Prometheus samples through files in this directory.
+# prometheus_client reads it on import, so it has to be set before the import.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'wg_app_metrics'))
+
+# The workers share their rate limit buckets and recent writers through this SQLite file
+os.environ.setdefault('SHARED_STORE', os.path.join(tempfile.gettempdir(), 'wg_app_shared.db'))
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Samples of a previous run would be added to the new ones otherwise
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,176 @@
+"""Idempotency keys for endpoints that create rows.
+
+A client sends a unique ``Idempotency-Key`` header with a POST and the same
+key again when it retries. The first request claims the key in the
+IDEMPOTENCYKEY table before its handler runs and stores the response when it
+finishes; a retry of the same request is answered with the stored response
+and does not run the handler again. Keys are scoped per user and expire after
+IDEMPOTENCY_TTL_SECONDS; expired rows are deleted at most every
+IDEMPOTENCY_PURGE_SECONDS per process, like the recurrence check.
+
+A claim is a lease: when its request dies before storing a response (worker
+killed or timed out), a retry more than IDEMPOTENCY_LEASE_SECONDS after the
+claim takes the key over instead of being told it is still in progress.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from extensions import db
+from metrics import IDEMPOTENCY_REQUESTS
+from models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+_lock = threading.Lock()
+_last_purge = float('-inf')
+
+
+def request_hash():
+    """Fingerprint of the method, path, query string and body of the current request."""
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.full_path.encode(), request.get_data(cache=True)):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _claim(user_id, key, fingerprint):
+    """Claims a key for this request; returns None, or the row of an earlier request."""
+    for _ in range(2):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL_SECONDS'])
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, request_hash=fingerprint,
+                                      claimed_at=now, expires_at=expires_at))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+        existing = db.session.get(IdempotencyKey, (user_id, key))
+        if existing is not None and existing.expires_at > now:
+            if existing.request_hash != fingerprint or not _abandoned(existing, now):
+                return existing
+            if _take_over(existing, now):
+                return None
+            # Another retry took it over first
+            continue
+        # Expired but not purged yet, or purged in the meantime: claim it anew
+        if existing is not None:
+            db.session.delete(existing)
+            db.session.commit()
+    raise RuntimeError('Could not claim idempotency key')
+
+
+def _abandoned(row, now):
+    """Whether a claim without a response has outlived the request holding it."""
+    lease = timedelta(seconds=current_app.config['IDEMPOTENCY_LEASE_SECONDS'])
+    return row.status is None and (row.claimed_at is None or row.claimed_at <= now - lease)
+
+
+def _take_over(row, now):
+    """Claims an abandoned key for this request, unless another one changed it in the meantime."""
+    unchanged = IdempotencyKey.claimed_at.is_(None) if row.claimed_at is None \
+        else IdempotencyKey.claimed_at == row.claimed_at
+    result = db.session.execute(
+        db.update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == row.user_id, IdempotencyKey.key == row.key,
+               IdempotencyKey.status.is_(None), unchanged)
+        .values(claimed_at=now))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _release(user_id, key):
+    """Forgets a claim, so the request can be retried with the same key."""
+    db.session.rollback()
+    db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id,
+                                                       IdempotencyKey.key == key))
+    db.session.commit()
+
+
+def _replay(row):
+    response = Response(row.body, status=row.status, content_type=row.content_type)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(f):
+    """Honors the Idempotency-Key header; goes below token_required."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = g.current_user.idUser
+        fingerprint = request_hash()
+        existing = _claim(user_id, key, fingerprint)
+        if existing is not None:
+            if existing.request_hash != fingerprint:
+                IDEMPOTENCY_REQUESTS.labels('mismatch').inc()
+                return jsonify({'message': f'{HEADER} was already used for a different request'}), 422
+            if existing.status is None:
+                IDEMPOTENCY_REQUESTS.labels('in_progress').inc()
+                response = jsonify({'message': 'A request with this key is still being processed'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            IDEMPOTENCY_REQUESTS.labels('replayed').inc()
+            return _replay(existing)
+
+        IDEMPOTENCY_REQUESTS.labels('claimed').inc()
+        try:
+            response = make_response(f(*args, **kwargs))
+        except BaseException:
+            _release(user_id, key)
+            raise
+        if response.status_code >= 500:
+            # Server errors may be transient; a retry runs the handler again
+            _release(user_id, key)
+            return response
+        db.session.rollback()
+        db.session.execute(
+            db.update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status=response.status_code, content_type=response.content_type,
+                    body=response.get_data()))
+        db.session.commit()
+        return response
+    return decorated
+
+
+def purge_expired():
+    """Deletes the keys past their expiry; returns how many."""
+    with db.engine.begin() as conn:
+        result = conn.execute(db.delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    return result.rowcount
+
+
+def _before_request():
+    global _last_purge
+    interval = current_app.config['IDEMPOTENCY_PURGE_SECONDS']
+    if not interval or time.monotonic() - _last_purge < interval:
+        return
+    # Only one thread per process runs it; the others carry on immediately
+    if not _lock.acquire(blocking=False):
+        return
+    try:
+        _last_purge = time.monotonic()
+        purge_expired()
+    except SQLAlchemyError:
+        current_app.logger.exception('Purging expired idempotency keys failed')
+    finally:
+        _lock.release()
+
+
+def init_idempotency(app):
+    app.before_request(_before_request)
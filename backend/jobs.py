@@ -0,0 +1,254 @@
+"""A small durable job queue stored in the app database.
+
+Views enqueue work in their own transaction and answer right away:
+
+    enqueue('delete_wg', wg_id=wg.idWG)
+    db.session.commit()
+
+Handlers are registered by name with ``@job_handler`` and receive the payload
+as keyword arguments. A worker claims a job by moving its ``run_at`` forward
+by the visibility timeout; if the worker dies, the job becomes claimable again
+once that time has passed. Failed jobs are retried with exponential backoff
+until ``max_attempts`` is reached and are then kept with status 'failed'.
+Handlers may therefore run more than once and have to be idempotent.
+
+Workers run as threads in every app process (JOB_WORKER_THREADS) or in a
+separate process started with ``flask worker``. Claims are a compare-and-set
+UPDATE, so any number of them can share the queue without a broker.
+"""
+import itertools
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from metrics import JOBS_PROCESSED, JOB_DURATION, SCRAPE_REGISTRY
+from models import Job
+from models.types import new_id
+
+# Longest wait between two attempts of a job
+MAX_BACKOFF_SECONDS = 3600
+
+# Jobs looked at per claim; the first one whose claim succeeds is run
+CLAIM_CANDIDATES = 10
+
+HANDLERS = {}
+
+# Numbers the workers of this process, so that every one claims under its own name
+_worker_numbers = itertools.count(1)
+
+
+class UnknownJobError(LookupError):
+    pass
+
+
+def job_handler(name):
+    """Registers the decorated function as the handler of ``name``."""
+    def decorator(f):
+        HANDLERS[name] = f
+        return f
+    return decorator
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    """Adds a job to the current session; it is queued when the caller commits.
+
+    The id is assigned right away, so a view can return it with its 202.
+    """
+    if name not in HANDLERS:
+        raise UnknownJobError(name)
+    job = Job(
+        idJob=new_id(),
+        name=name,
+        payload=payload,
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def backoff(attempts, base):
+    """Seconds to wait before the next attempt, doubling with each failure."""
+    delay = min(base * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    # Jitter keeps jobs that failed together from retrying together
+    return delay * random.uniform(0.8, 1.2)
+
+
+class Worker:
+    """Claims and runs jobs until ``stop`` is set."""
+
+    def __init__(self, app, name=None):
+        self.app = app
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{next(_worker_numbers)}'
+        self.poll_interval = app.config['JOB_POLL_SECONDS']
+        self.visibility_timeout = app.config['JOB_VISIBILITY_TIMEOUT']
+        self.backoff_base = app.config['JOB_BACKOFF_SECONDS']
+
+    def claim(self):
+        """Returns a claimed job as a row, or None if nothing is due."""
+        jobs = Job.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            candidates = conn.execute(
+                db.select(jobs.c.idJob, jobs.c.status, jobs.c.run_at, jobs.c.attempts,
+                          jobs.c.max_attempts)
+                .where(jobs.c.status.in_(('queued', 'running')), jobs.c.run_at <= now)
+                .order_by(jobs.c.run_at)
+                .limit(CLAIM_CANDIDATES)
+            ).all()
+            for candidate in candidates:
+                unchanged = ((jobs.c.idJob == candidate.idJob)
+                             & (jobs.c.status == candidate.status)
+                             & (jobs.c.run_at == candidate.run_at))
+                if candidate.status == 'running' and candidate.attempts >= candidate.max_attempts:
+                    # Its last attempt outlived the visibility timeout
+                    conn.execute(jobs.update().where(unchanged).values(
+                        status='failed', locked_by=None, last_error='Visibility timeout expired'))
+                    continue
+                result = conn.execute(jobs.update().where(unchanged).values(
+                    status='running',
+                    locked_by=self.name,
+                    attempts=jobs.c.attempts + 1,
+                    run_at=now + timedelta(seconds=self.visibility_timeout),
+                ))
+                if result.rowcount == 1:
+                    return conn.execute(db.select(jobs).where(jobs.c.idJob == candidate.idJob)).one()
+        return None
+
+    def run_once(self):
+        """Runs one due job; returns False if there was none."""
+        job = self.claim()
+        if job is None:
+            return False
+        handler = HANDLERS.get(job.name)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise UnknownJobError(job.name)
+            handler(**job.payload)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._failed(job, traceback.format_exc())
+        else:
+            self._finished(job)
+        finally:
+            JOB_DURATION.labels(job.name).observe(time.perf_counter() - started)
+            db.session.remove()
+        return True
+
+    def _finished(self, job):
+        jobs = Job.__table__
+        with db.engine.begin() as conn:
+            conn.execute(jobs.delete().where(jobs.c.idJob == job.idJob, jobs.c.locked_by == self.name))
+        JOBS_PROCESSED.labels(job.name, 'done').inc()
+
+    def _failed(self, job, error):
+        jobs = Job.__table__
+        if job.attempts >= job.max_attempts:
+            values = {'status': 'failed', 'locked_by': None}
+            outcome = 'failed'
+            self.app.logger.error('Job %s (%s) failed for good:\n%s', job.idJob, job.name, error)
+        else:
+            retry_at = datetime.utcnow() + timedelta(seconds=backoff(job.attempts, self.backoff_base))
+            values = {'status': 'queued', 'locked_by': None, 'run_at': retry_at}
+            outcome = 'retried'
+            self.app.logger.warning('Job %s (%s) failed, attempt %d of %d',
+                                    job.idJob, job.name, job.attempts, job.max_attempts)
+        with db.engine.begin() as conn:
+            conn.execute(jobs.update()
+                         .where(jobs.c.idJob == job.idJob, jobs.c.locked_by == self.name)
+                         .values(last_error=error, **values))
+        JOBS_PROCESSED.labels(job.name, outcome).inc()
+
+    def run(self, stop):
+        with self.app.app_context():
+            while not stop.is_set():
+                try:
+                    if self.run_once():
+                        continue
+                except SQLAlchemyError:
+                    # The database may be briefly unavailable; poll again later
+                    self.app.logger.exception('Job worker %s could not reach the database', self.name)
+                    db.session.remove()
+                stop.wait(self.poll_interval)
+
+
+def start_workers(app, count, stop=None):
+    """Starts ``count`` daemon worker threads and returns them."""
+    stop = stop or threading.Event()
+    threads = []
+    for n in range(count):
+        thread = threading.Thread(target=Worker(app).run, args=(stop,),
+                                  name=f'job-worker-{n}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+class QueueDepthCollector:
+    """Reports the number of jobs per status and the age of the oldest due job."""
+
+    def collect(self):
+        depth = GaugeMetricFamily('wg_job_queue_depth', 'Jobs in the queue by status.',
+                                  labels=['status'])
+        lag = GaugeMetricFamily('wg_job_queue_lag_seconds',
+                                'How long the oldest due job has been waiting.')
+        jobs = Job.__table__
+        now = datetime.utcnow()
+        try:
+            counts = dict(db.session.execute(
+                db.select(jobs.c.status, db.func.count()).group_by(jobs.c.status)).all())
+            oldest = db.session.execute(
+                db.select(db.func.min(jobs.c.run_at))
+                .where(jobs.c.status == 'queued', jobs.c.run_at <= now)).scalar()
+        except SQLAlchemyError:
+            db.session.rollback()
+            return
+        for status in ('queued', 'running', 'failed'):
+            depth.add_metric([status], counts.get(status, 0))
+        lag.add_metric([], (now - oldest).total_seconds() if oldest else 0)
+        yield depth
+        yield lag
+
+    def describe(self):
+        return []
+
+
+SCRAPE_REGISTRY.register(QueueDepthCollector())
+
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def _start_in_process_workers():
+    """Starts the worker threads of this process on its first request.
+
+    Starting them in create_app would also start them in CLI commands and in
+    the gunicorn master before it forks.
+    """
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        app = current_app._get_current_object()
+        start_workers(app, app.config['JOB_WORKER_THREADS'])
+
+
+def init_jobs(app):
+    if app.config['JOB_WORKER_THREADS'] > 0:
+        app.before_request(_start_in_process_workers)
@@ -0,0 +1,159 @@
+import os
+import time
+from functools import wraps
+
+from flask import Response, request, g, has_app_context, abort, current_app
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from extensions import db
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker writes
+# its samples to memory-mapped files in that directory and /metrics adds them up.
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    'wg_http_requests_total', 'HTTP requests by endpoint, method and status.',
+    ['endpoint', 'method', 'status'])
+REQUEST_LATENCY = Histogram(
+    'wg_http_request_duration_seconds', 'HTTP request latency.',
+    ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge(
+    'wg_http_requests_in_flight', 'HTTP requests currently being handled.',
+    multiprocess_mode='livesum')
+SQL_STATEMENTS = Counter(
+    'wg_sql_statements_total', 'SQL statements executed while handling requests.',
+    ['endpoint'])
+SQL_DURATION = Counter(
+    'wg_sql_duration_seconds_total', 'Time spent executing SQL while handling requests.',
+    ['endpoint'])
+SQL_PER_REQUEST = Histogram(
+    'wg_sql_statements_per_request', 'SQL statements per request.',
+    ['endpoint'], buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233))
+BCRYPT_DURATION = Histogram(
+    'wg_bcrypt_duration_seconds', 'Time spent hashing or checking passwords.',
+    ['operation'], buckets=(.05, .1, .25, .5, .75, 1.0, 2.5))
+POOL_CHECKOUT_WAIT = Histogram(
+    'wg_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1.0, 5.0))
+JOBS_PROCESSED = Counter(
+    'wg_jobs_processed_total', 'Background jobs processed by name and outcome.',
+    ['job', 'outcome'])
+JOB_DURATION = Histogram(
+    'wg_job_duration_seconds', 'Run time of background jobs.',
+    ['job'], buckets=LATENCY_BUCKETS + (30.0, 60.0, 300.0))
+CACHE_LOOKUPS = Counter(
+    'wg_cache_lookups_total', 'Lookups in the in-process caches by cache and result.',
+    ['cache', 'result'])
+RATE_LIMITED = Counter(
+    'wg_rate_limited_total', 'Requests refused by a rate limit.',
+    ['limit'])
+DB_ROUTED = Counter(
+    'wg_db_routed_requests_total', 'GET and HEAD requests by the database their reads went to.',
+    ['target'])
+IDEMPOTENCY_REQUESTS = Counter(
+    'wg_idempotency_requests_total', 'Requests with an Idempotency-Key by outcome.',
+    ['result'])
+
+# Collectors that read their values from the database when /metrics is
+# scraped. They are never written to the multiprocess files, so every worker
+# reports the same value; see jobs.QueueDepthCollector.
+SCRAPE_REGISTRY = CollectorRegistry()
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None or request.endpoint == 'metrics':
+        return response
+    endpoint = _endpoint()
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - start)
+    SQL_STATEMENTS.labels(endpoint).inc(g.sql_count)
+    SQL_DURATION.labels(endpoint).inc(g.sql_time)
+    SQL_PER_REQUEST.labels(endpoint).observe(g.sql_count)
+    return response
+
+
+def _teardown_request(exc):
+    if 'sql_count' in g:
+        IN_FLIGHT.dec()
+
+
+# The start time is kept on the execution context, which is dropped with the
+# statement; a failing statement never reaches after_cursor_execute
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._wg_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_wg_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    if has_app_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+
+
+def _instrument_pool(pool):
+    """Times every pool checkout, including the wait for a free connection."""
+    if getattr(pool, '_wg_timed', False):
+        return
+    connect = pool.connect
+
+    @wraps(connect)
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+    pool._wg_timed = True
+
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    output = generate_latest(registry) + generate_latest(SCRAPE_REGISTRY)
+    return Response(output, mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """Records per-endpoint request and SQL metrics and serves them at /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    # Listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    with app.app_context():
+        _instrument_pool(db.engine.pool)
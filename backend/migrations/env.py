@@ -4,6 +4,10 @@ from logging.config import fileConfig
 from flask import current_app
 
 from alembic import context
+import sqlalchemy as sa
+
+import calendar_feed
+import search
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -90,13 +94,23 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # The search index is maintained by search.py, not by the models
+    def include_name(name, type_, parent_names):
+        return not (type_ == 'table' and name.startswith('search_'))
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault('include_name', include_name)
 
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            # Batch migrations copy a table and drop the old one; with foreign
+            # keys enforced, the DROP would cascade into every child table
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -106,6 +120,16 @@ def run_migrations_online():
         with context.begin_transaction():
             context.run_migrations()
 
+        if connection.dialect.name == 'sqlite':
+            # Batch migrations drop the triggers of the tables they copy
+            inspector = sa.inspect(connection)
+            if inspector.has_table('search_doc'):
+                search.install(connection)
+            if any(column['name'] == 'tasks_version' for column in inspector.get_columns('WG')):
+                calendar_feed.install(connection)
+            connection.commit()
+            connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+
 
 if context.is_offline_mode():
     run_migrations_offline()
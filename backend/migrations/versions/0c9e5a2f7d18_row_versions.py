@@ -0,0 +1,29 @@
+"""Version columns for optimistic concurrency
+
+Revision ID: 0c9e5a2f7d18
+Revises: f3a7c1e95b02
+Create Date: 2026-10-19 06:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c9e5a2f7d18'
+down_revision = 'f3a7c1e95b02'
+branch_labels = None
+depends_on = None
+
+TABLES = ['TASKLIST', 'TASK', 'SHOPPINGLIST', 'ITEM', 'COST']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    # Not batch operations, which would copy the tables and lose their triggers
+    for table in TABLES:
+        op.drop_column(table, 'version')
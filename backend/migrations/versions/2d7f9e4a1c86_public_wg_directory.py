@@ -0,0 +1,30 @@
+"""Indexes for the public WG directory
+
+Revision ID: 2d7f9e4a1c86
+Revises: e5a83c20f6b1
+Create Date: 2026-10-19 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7f9e4a1c86'
+down_revision = 'e5a83c20f6b1'
+branch_labels = None
+depends_on = None
+
+INDEXES = [('ix_wg_public_title', 'title'), ('ix_wg_public_address', 'address')]
+
+
+def upgrade():
+    # Byte order on Postgres as well, see models._lower_indexes
+    collate = ' COLLATE "C"' if op.get_bind().dialect.name == 'postgresql' else ''
+    for name, column in INDEXES:
+        op.create_index(name, 'WG', ['is_public', sa.text(f'lower({column}){collate}')])
+
+
+def downgrade():
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='WG')
@@ -0,0 +1,25 @@
+"""WG data version
+
+Revision ID: 3b9d5f1c7e24
+Revises: 8d4f2b6e1a57
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d5f1c7e24'
+down_revision = '8d4f2b6e1a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('WG', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    # Not a batch operation: copying WG would lose its expression indexes
+    op.drop_column('WG', 'data_version')
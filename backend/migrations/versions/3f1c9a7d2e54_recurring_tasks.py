@@ -0,0 +1,45 @@
+"""Recurrence rules on task templates
+
+Revision ID: 3f1c9a7d2e54
+Revises: 80dc8db86624
+Create Date: 2026-10-18 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2e54'
+down_revision = '80dc8db86624'
+branch_labels = None
+depends_on = None
+
+
+def _key_type():
+    if op.get_bind().dialect.name == 'postgresql':
+        return postgresql.UUID(as_uuid=False)
+    return sa.LargeBinary(16)
+
+
+def upgrade():
+    with op.batch_alter_table('TASK') as batch_op:
+        batch_op.add_column(sa.Column('recurrence', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('recurrence_interval', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('next_occurrence', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('template_id', _key_type(), nullable=True))
+        batch_op.create_index('ix_TASK_next_occurrence', ['next_occurrence'])
+        batch_op.create_foreign_key('fk_TASK_template_id_TASK', 'TASK', ['template_id'], ['idTask'],
+                                    ondelete='SET NULL')
+        batch_op.create_unique_constraint('uq_task_template_start', ['template_id', 'start_date'])
+
+
+def downgrade():
+    # The foreign key and the unique constraint go with the template_id column
+    with op.batch_alter_table('TASK') as batch_op:
+        batch_op.drop_index('ix_TASK_next_occurrence')
+        batch_op.drop_column('template_id')
+        batch_op.drop_column('next_occurrence')
+        batch_op.drop_column('recurrence_interval')
+        batch_op.drop_column('recurrence')
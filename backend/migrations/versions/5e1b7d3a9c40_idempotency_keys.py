@@ -0,0 +1,39 @@
+"""Idempotency keys
+
+Revision ID: 5e1b7d3a9c40
+Revises: 0c9e5a2f7d18
+Create Date: 2026-10-19 07:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1b7d3a9c40'
+down_revision = '0c9e5a2f7d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    key_type = postgresql.UUID(as_uuid=False) if op.get_bind().dialect.name == 'postgresql' \
+        else sa.LargeBinary(16)
+    op.create_table('IDEMPOTENCYKEY',
+    sa.Column('user_id', key_type, nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('request_hash', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=True),
+    sa.Column('content_type', sa.String(length=128), nullable=True),
+    sa.Column('body', sa.LargeBinary(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['USERS.idUser'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'key')
+    )
+    op.create_index(op.f('ix_IDEMPOTENCYKEY_expires_at'), 'IDEMPOTENCYKEY', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_IDEMPOTENCYKEY_expires_at'), table_name='IDEMPOTENCYKEY')
+    op.drop_table('IDEMPOTENCYKEY')
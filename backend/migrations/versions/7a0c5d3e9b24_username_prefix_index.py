@@ -0,0 +1,26 @@
+"""Index for username suggestions
+
+Revision ID: 7a0c5d3e9b24
+Revises: 2d7f9e4a1c86
+Create Date: 2026-10-19 02:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a0c5d3e9b24'
+down_revision = '2d7f9e4a1c86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Byte order on Postgres as well, see models._lower_indexes
+    collate = ' COLLATE "C"' if op.get_bind().dialect.name == 'postgresql' else ''
+    op.create_index('ix_users_strUser_lower', 'USERS', [sa.text(f'lower("strUser"){collate}')])
+
+
+def downgrade():
+    op.drop_index('ix_users_strUser_lower', table_name='USERS')
@@ -0,0 +1,25 @@
+"""Idempotency claim lease
+
+Revision ID: 7c2e4a9d1f36
+Revises: 3b9d5f1c7e24
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e4a9d1f36'
+down_revision = '3b9d5f1c7e24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Claims from before have none and count as abandoned once unfinished
+    op.add_column('IDEMPOTENCYKEY', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('IDEMPOTENCYKEY', 'claimed_at')
@@ -0,0 +1,97 @@
+"""Store primary and foreign keys as compact UUIDs
+
+Revision ID: 80dc8db86624
+Revises: bde0586764ee
+Create Date: 2026-10-18 23:10:00.000000
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '80dc8db86624'
+down_revision = 'bde0586764ee'
+branch_labels = None
+depends_on = None
+
+# Every primary and foreign key column, parents first
+KEY_COLUMNS = {
+    'USERS': ['idUser'],
+    'WG': ['idWG', 'creator_id'],
+    'TASKLIST': ['idTaskList', 'wg_id'],
+    'SHOPPINGLIST': ['idShoppingList', 'creator_id', 'wg_id'],
+    'BUDGETPLANNING': ['idBudgetPlanning', 'creator_id', 'wg_id'],
+    'TASK': ['idTask', 'tasklist_id'],
+    'ITEM': ['idItem', 'shoppinglist_id'],
+    'COST': ['idCost', 'budgetplanning_id'],
+    'user_wg': ['user_id', 'wg_id'],
+    'admin_wg': ['user_id', 'wg_id'],
+    'user_tasklist': ['user_id', 'tasklist_id'],
+    'user_task': ['user_id', 'task_id'],
+    'user_shoppinglist': ['user_id', 'shoppinglist_id'],
+    'user_item': ['user_id', 'item_id'],
+    'user_budgetplanning': ['user_id', 'budgetplanning_id'],
+    'user_cost': ['user_id', 'cost_id'],
+}
+
+
+def _to_bytes(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return uuid.UUID(value).bytes
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return str(uuid.UUID(bytes=value))
+
+
+def _convert_postgres(target_type, cast):
+    inspector = sa.inspect(op.get_bind())
+    # Key columns cannot change type while a foreign key connects them
+    foreign_keys = []
+    for table in KEY_COLUMNS:
+        for fk in inspector.get_foreign_keys(table):
+            foreign_keys.append((table, fk))
+            op.drop_constraint(fk['name'], table, type_='foreignkey')
+    for table, columns in KEY_COLUMNS.items():
+        for column in columns:
+            op.alter_column(table, column, type_=target_type,
+                            postgresql_using=f'"{column}"::{cast}')
+    for table, fk in foreign_keys:
+        op.create_foreign_key(fk['name'], table, fk['referred_table'],
+                              fk['constrained_columns'], fk['referred_columns'],
+                              ondelete=fk['options'].get('ondelete'))
+
+
+def _convert_sqlite(convert, target_type, existing_type):
+    bind = op.get_bind()
+    bind.connection.driver_connection.create_function('convert_key', 1, convert, deterministic=True)
+    # Keys of parents and children are rewritten one table after another, so
+    # foreign keys only have to hold when the transaction commits
+    op.execute('PRAGMA defer_foreign_keys = ON')
+    for table, columns in KEY_COLUMNS.items():
+        assignments = ', '.join(f'"{column}" = convert_key("{column}")' for column in columns)
+        op.execute(f'UPDATE "{table}" SET {assignments}')
+        with op.batch_alter_table(table) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, type_=target_type, existing_type=existing_type)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _convert_postgres(postgresql.UUID(as_uuid=False), 'uuid')
+    else:
+        _convert_sqlite(_to_bytes, sa.LargeBinary(16), sa.String(length=36))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _convert_postgres(sa.String(length=36), 'varchar(36)')
+    else:
+        _convert_sqlite(_to_text, sa.String(length=36), sa.LargeBinary(16))
@@ -0,0 +1,35 @@
+"""WG shard directory
+
+Revision ID: 8d4f2b6e1a57
+Revises: 5e1b7d3a9c40
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f2b6e1a57'
+down_revision = '5e1b7d3a9c40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    key_type = postgresql.UUID(as_uuid=False) if op.get_bind().dialect.name == 'postgresql' \
+        else sa.LargeBinary(16)
+    op.create_table('WGSHARD',
+    sa.Column('wg_id', key_type, nullable=False),
+    sa.Column('shard', sa.String(length=64), nullable=False),
+    sa.Column('moving', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['wg_id'], ['WG.idWG'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('wg_id')
+    )
+    op.create_index(op.f('ix_WGSHARD_shard'), 'WGSHARD', ['shard'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_WGSHARD_shard'), table_name='WGSHARD')
+    op.drop_table('WGSHARD')
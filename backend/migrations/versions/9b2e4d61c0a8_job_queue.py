@@ -0,0 +1,41 @@
+"""Job queue table
+
+Revision ID: 9b2e4d61c0a8
+Revises: 3f1c9a7d2e54
+Create Date: 2026-10-19 00:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e4d61c0a8'
+down_revision = '3f1c9a7d2e54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    key_type = postgresql.UUID(as_uuid=False) if op.get_bind().dialect.name == 'postgresql' \
+        else sa.LargeBinary(16)
+    op.create_table('JOB',
+    sa.Column('idJob', key_type, nullable=False),
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=64), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('idJob')
+    )
+    op.create_index('ix_job_status_run_at', 'JOB', ['status', 'run_at'])
+
+
+def downgrade():
+    op.drop_index('ix_job_status_run_at', table_name='JOB')
+    op.drop_table('JOB')
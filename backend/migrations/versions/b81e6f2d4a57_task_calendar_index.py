@@ -0,0 +1,26 @@
+"""Calendar index on tasks
+
+Revision ID: b81e6f2d4a57
+Revises: 7a0c5d3e9b24
+Create Date: 2026-10-19 03:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e6f2d4a57'
+down_revision = '7a0c5d3e9b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The new index leads with tasklist_id, so it replaces the one on the column
+    op.create_index('ix_task_tasklist_end_start', 'TASK', ['tasklist_id', 'end_date', 'start_date'])
+    op.drop_index('ix_TASK_tasklist_id', table_name='TASK')
+
+
+def downgrade():
+    op.create_index('ix_TASK_tasklist_id', 'TASK', ['tasklist_id'])
+    op.drop_index('ix_task_tasklist_end_start', table_name='TASK')
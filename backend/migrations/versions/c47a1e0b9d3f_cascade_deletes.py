@@ -0,0 +1,99 @@
+"""Cascade deletes in the database and index every foreign key
+
+Revision ID: c47a1e0b9d3f
+Revises: 9b2e4d61c0a8
+Create Date: 2026-10-19 00:40:00.000000
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1e0b9d3f'
+down_revision = '9b2e4d61c0a8'
+branch_labels = None
+depends_on = None
+
+# Gives the unnamed foreign keys of SQLite a name batch mode can drop them by
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+# (table, column, referred table, referred column, new ondelete, old ondelete)
+FOREIGN_KEYS = [
+    ('TASKLIST', 'wg_id', 'WG', 'idWG', 'CASCADE', None),
+    ('SHOPPINGLIST', 'wg_id', 'WG', 'idWG', 'CASCADE', None),
+    ('SHOPPINGLIST', 'creator_id', 'USERS', 'idUser', 'SET NULL', None),
+    ('BUDGETPLANNING', 'wg_id', 'WG', 'idWG', 'CASCADE', None),
+    ('BUDGETPLANNING', 'creator_id', 'USERS', 'idUser', 'SET NULL', None),
+    ('TASK', 'tasklist_id', 'TASKLIST', 'idTaskList', 'CASCADE', None),
+    ('ITEM', 'shoppinglist_id', 'SHOPPINGLIST', 'idShoppingList', 'CASCADE', None),
+    ('COST', 'budgetplanning_id', 'BUDGETPLANNING', 'idBudgetPlanning', 'CASCADE', None),
+] + [
+    (table, 'user_id', 'USERS', 'idUser', 'CASCADE', None)
+    for table in ('user_wg', 'admin_wg', 'user_tasklist', 'user_task', 'user_shoppinglist',
+                  'user_item', 'user_budgetplanning', 'user_cost')
+]
+
+# (table, column) of the new indexes, named like index=True names them
+INDEXES = [
+    ('WG', 'creator_id'),
+    ('TASKLIST', 'wg_id'),
+    ('SHOPPINGLIST', 'wg_id'),
+    ('SHOPPINGLIST', 'creator_id'),
+    ('BUDGETPLANNING', 'wg_id'),
+    ('BUDGETPLANNING', 'creator_id'),
+    ('TASK', 'tasklist_id'),
+    ('ITEM', 'shoppinglist_id'),
+    ('COST', 'budgetplanning_id'),
+    ('user_wg', 'user_id'), ('user_wg', 'wg_id'),
+    ('admin_wg', 'user_id'), ('admin_wg', 'wg_id'),
+    ('user_tasklist', 'user_id'), ('user_tasklist', 'tasklist_id'),
+    ('user_task', 'user_id'), ('user_task', 'task_id'),
+    ('user_shoppinglist', 'user_id'), ('user_shoppinglist', 'shoppinglist_id'),
+    ('user_item', 'user_id'), ('user_item', 'item_id'),
+    ('user_budgetplanning', 'user_id'), ('user_budgetplanning', 'budgetplanning_id'),
+    ('user_cost', 'user_id'), ('user_cost', 'cost_id'),
+]
+
+
+def _fk_name(table, column, referred):
+    return NAMING_CONVENTION['fk'] % {
+        'table_name': table, 'column_0_name': column, 'referred_table_name': referred}
+
+
+def _set_ondelete(new):
+    """Recreates every foreign key in FOREIGN_KEYS with the ondelete at index ``new``."""
+    if op.get_bind().dialect.name == 'sqlite':
+        by_table = defaultdict(list)
+        for fk in FOREIGN_KEYS:
+            by_table[fk[0]].append(fk)
+        for table, fks in by_table.items():
+            with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+                for _, column, referred, referred_column, *ondelete in fks:
+                    name = _fk_name(table, column, referred)
+                    batch_op.drop_constraint(name, type_='foreignkey')
+                    batch_op.create_foreign_key(name, referred, [column], [referred_column],
+                                                ondelete=ondelete[new])
+        return
+
+    inspector = sa.inspect(op.get_bind())
+    for table, column, referred, referred_column, *ondelete in FOREIGN_KEYS:
+        for fk in inspector.get_foreign_keys(table):
+            if fk['constrained_columns'] == [column]:
+                op.drop_constraint(fk['name'], table, type_='foreignkey')
+        op.create_foreign_key(_fk_name(table, column, referred), table, referred,
+                              [column], [referred_column], ondelete=ondelete[new])
+
+
+def upgrade():
+    _set_ondelete(0)
+    for table, column in INDEXES:
+        op.create_index(f'ix_{table}_{column}', table, [column])
+
+
+def downgrade():
+    for table, column in INDEXES:
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
+    _set_ondelete(1)
@@ -0,0 +1,52 @@
+"""Calendar feed tokens and task versions of WGs
+
+Revision ID: d6e2b8f41a93
+Revises: b81e6f2d4a57
+Create Date: 2026-10-19 04:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+import calendar_feed
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6e2b8f41a93'
+down_revision = 'b81e6f2d4a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    key_type = postgresql.UUID(as_uuid=False) if connection.dialect.name == 'postgresql' \
+        else sa.LargeBinary(16)
+    op.add_column('WG', sa.Column('tasks_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('WG', sa.Column('tasks_changed_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "WG" SET tasks_changed_at = CURRENT_TIMESTAMP')
+    op.create_table('FEEDTOKEN',
+    sa.Column('idFeedToken', key_type, nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('user_id', key_type, nullable=False),
+    sa.Column('wg_id', key_type, nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['USERS.idUser'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['wg_id'], ['WG.idWG'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('idFeedToken'),
+    sa.UniqueConstraint('token_hash')
+    )
+    op.create_index(op.f('ix_FEEDTOKEN_user_id'), 'FEEDTOKEN', ['user_id'])
+    op.create_index(op.f('ix_FEEDTOKEN_wg_id'), 'FEEDTOKEN', ['wg_id'])
+    calendar_feed.install(connection)
+
+
+def downgrade():
+    calendar_feed.uninstall(op.get_bind())
+    op.drop_index(op.f('ix_FEEDTOKEN_wg_id'), table_name='FEEDTOKEN')
+    op.drop_index(op.f('ix_FEEDTOKEN_user_id'), table_name='FEEDTOKEN')
+    op.drop_table('FEEDTOKEN')
+    # Not a batch operation: copying WG would lose its expression indexes
+    op.drop_column('WG', 'tasks_changed_at')
+    op.drop_column('WG', 'tasks_version')
@@ -0,0 +1,27 @@
+"""Full-text search index
+
+Revision ID: e5a83c20f6b1
+Revises: c47a1e0b9d3f
+Create Date: 2026-10-19 01:10:00.000000
+
+"""
+from alembic import op
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a83c20f6b1'
+down_revision = 'c47a1e0b9d3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    search.install(connection)
+    search.rebuild(connection)
+
+
+def downgrade():
+    search.uninstall(op.get_bind())
@@ -0,0 +1,26 @@
+"""Covering index of a user's tasks
+
+Revision ID: f3a7c1e95b02
+Revises: d6e2b8f41a93
+Create Date: 2026-10-19 05:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7c1e95b02'
+down_revision = 'd6e2b8f41a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The new index leads with user_id, so it replaces the one on the column
+    op.create_index('ix_user_task_user_task', 'user_task', ['user_id', 'task_id'])
+    op.drop_index('ix_user_task_user_id', table_name='user_task')
+
+
+def downgrade():
+    op.create_index('ix_user_task_user_id', 'user_task', ['user_id'])
+    op.drop_index('ix_user_task_user_task', table_name='user_task')
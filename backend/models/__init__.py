@@ -1,213 +1,332 @@
 from extensions import db
 from datetime import datetime
-import uuid
+from models.types import CompactUUID, new_id
 
 # Association tables for many-to-many relationships
-# Added ondelete='CASCADE' to feature-side foreign keys to ensure cleanup when WG or feature is deleted
+# Both foreign keys cascade, so deleting a user or a feature row removes its
+# links in the database; both are indexed so the cascade is an index lookup
 user_wg = db.Table(
     'user_wg',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('wg_id', db.String(36), db.ForeignKey('WG.idWG', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('wg_id', CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), index=True)
 )
 
 admin_wg = db.Table(
     'admin_wg',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('wg_id', db.String(36), db.ForeignKey('WG.idWG', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('wg_id', CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), index=True)
 )
 
 user_tasklist = db.Table(
     'user_tasklist',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('tasklist_id', db.String(36), db.ForeignKey('TASKLIST.idTaskList', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('tasklist_id', CompactUUID, db.ForeignKey('TASKLIST.idTaskList', ondelete='CASCADE'), index=True)
 )
 
 user_task = db.Table(
     'user_task',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('task_id', db.String(36), db.ForeignKey('TASK.idTask', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE')),
+    db.Column('task_id', CompactUUID, db.ForeignKey('TASK.idTask', ondelete='CASCADE'), index=True),
+    # Covers a user's tasks without reading the table; it also serves the foreign key
+    db.Index('ix_user_task_user_task', 'user_id', 'task_id'),
 )
 
 user_shoppinglist = db.Table(
     'user_shoppinglist',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('shoppinglist_id', db.String(36),
-              db.ForeignKey('SHOPPINGLIST.idShoppingList', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('shoppinglist_id', CompactUUID,
+              db.ForeignKey('SHOPPINGLIST.idShoppingList', ondelete='CASCADE'), index=True)
 )
 
 user_item = db.Table(
     'user_item',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('item_id', db.String(36), db.ForeignKey('ITEM.idItem', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('item_id', CompactUUID, db.ForeignKey('ITEM.idItem', ondelete='CASCADE'), index=True)
 )
 
 user_budgetplanning = db.Table(
     'user_budgetplanning',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('budgetplanning_id', db.String(36),
-              db.ForeignKey('BUDGETPLANNING.idBudgetPlanning', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('budgetplanning_id', CompactUUID,
+              db.ForeignKey('BUDGETPLANNING.idBudgetPlanning', ondelete='CASCADE'), index=True)
 )
 
 user_cost = db.Table(
     'user_cost',
-    db.Column('user_id', db.String(36), db.ForeignKey('USERS.idUser')),
-    db.Column('cost_id', db.String(36), db.ForeignKey('COST.idCost', ondelete='CASCADE'))
+    db.Column('user_id', CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), index=True),
+    db.Column('cost_id', CompactUUID, db.ForeignKey('COST.idCost', ondelete='CASCADE'), index=True)
 )
 
 
+def _lower_indexes(name, column, *leading):
+    """Indexes lower(column), after the ``leading`` columns, for case-insensitive prefix ranges.
+
+    Prefix ranges and the order they return compare bytes, which SQLite does by
+    default; Postgres needs the C collation for it, a name SQLite does not know.
+    """
+    return (
+        db.Index(name, *leading, db.func.lower(column))
+        .ddl_if(callable_=lambda ddl, target, bind, **kw: bind.dialect.name != 'postgresql'),
+        db.Index(name, *leading, db.func.lower(column).collate('C')).ddl_if(dialect='postgresql'),
+    )
+
+
 class User(db.Model):
     __tablename__ = 'USERS'
-    idUser = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idUser = db.Column(CompactUUID, primary_key=True, default=new_id)
     strUser = db.Column(db.String(80), nullable=False)
     strPassword = db.Column(db.String(128), nullable=False)
     strEmail = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     strHomePage = db.Column(db.String(255), nullable=False, default='/') 
     
-    # Added passive_deletes=True to all many-to-many relationships
-    # This tells SQLAlchemy that the DB is handling the cleanup via CASCADE
+    # The database removes the association rows through ON DELETE CASCADE
     wgs = db.relationship('WG', secondary=user_wg, back_populates='users', passive_deletes=True)
     admin_wgs = db.relationship(
         'WG', secondary=admin_wg, back_populates='admins', passive_deletes=True)
+    # Assignments are only ever changed from the list, task, item or cost side,
+    # which also tells a flush the shard the rows go to (shards.py)
     tasklists = db.relationship(
-        'TaskList', secondary=user_tasklist, back_populates='users', passive_deletes=True)
-    tasks = db.relationship('Task', secondary=user_task,
-                            back_populates='users', passive_deletes=True)
+        'TaskList', secondary=user_tasklist, back_populates='users', viewonly=True)
+    tasks = db.relationship('Task', secondary=user_task, back_populates='users', viewonly=True)
     shoppinglists = db.relationship(
-        'ShoppingList', secondary=user_shoppinglist, back_populates='users', passive_deletes=True)
-    items = db.relationship('Item', secondary=user_item,
-                            back_populates='users', passive_deletes=True)
+        'ShoppingList', secondary=user_shoppinglist, back_populates='users', viewonly=True)
+    items = db.relationship('Item', secondary=user_item, back_populates='users', viewonly=True)
     budgetplannings = db.relationship(
-        'BudgetPlanning', secondary=user_budgetplanning, back_populates='users', passive_deletes=True)
-    costs = db.relationship('Cost', secondary=user_cost,
-                            back_populates='users', passive_deletes=True)
+        'BudgetPlanning', secondary=user_budgetplanning, back_populates='users', viewonly=True)
+    costs = db.relationship('Cost', secondary=user_cost, back_populates='users', viewonly=True)
     __table_args__ = (
         db.UniqueConstraint('strUser', name='uq_user_strUser'),
         db.UniqueConstraint('strEmail', name='uq_user_strEmail'),
+        # Username suggestions are a prefix search on the lower-cased name
+        *_lower_indexes('ix_users_strUser_lower', strUser),
     )
 
 
 class WG(db.Model):
     __tablename__ = 'WG'
-    idWG = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idWG = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(255), nullable=False)
     etage = db.Column(db.String(20), nullable=False)
     description = db.Column(db.Text)
     is_public = db.Column(db.Boolean, default=True)
+    # Bumped by database triggers on every change to the WG's tasks or their
+    # assignees (see calendar_feed.py), so a feed can tell it is unchanged
+    tasks_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tasks_changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped in the transaction of every write to the WG, its lists and their
+    # entries (response_cache.py); cached responses of the WG are keyed by it
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
-    # Added ondelete='CASCADE' to the Foreign Key and backref cascade to trigger WG deletion on User (creator) deletion
-    creator_id = db.Column(db.String(36), db.ForeignKey(
-        'USERS.idUser', name='fk_wg_creator', ondelete='CASCADE'), nullable=False)
-    creator = db.relationship('User', foreign_keys=[creator_id], backref=db.backref('created_wgs', cascade='all, delete-orphan'))
-    
-    # Cascade is already set up on these relationships for WG deletion (Requirement 2)
-    users = db.relationship('User', secondary=user_wg, back_populates='wgs')
+    # Deleting the creator deletes the WG, in the database (ondelete) as well as
+    # in the session (backref cascade)
+    creator_id = db.Column(CompactUUID, db.ForeignKey(
+        'USERS.idUser', name='fk_wg_creator', ondelete='CASCADE'), nullable=False, index=True)
+    creator = db.relationship('User', foreign_keys=[creator_id], backref=db.backref(
+        'created_wgs', cascade='all, delete-orphan', passive_deletes=True))
+
+    # Children are removed by the ON DELETE CASCADE foreign keys; passive_deletes
+    # keeps the session from loading them just to delete them one by one
+    users = db.relationship('User', secondary=user_wg, back_populates='wgs', passive_deletes=True)
     admins = db.relationship('User', secondary=admin_wg,
-                             back_populates='admin_wgs')
+                             back_populates='admin_wgs', passive_deletes=True)
     shoppinglists = db.relationship(
-        'ShoppingList', back_populates='wg', cascade="all, delete-orphan")
+        'ShoppingList', back_populates='wg', cascade="all, delete-orphan", passive_deletes=True)
     tasklists = db.relationship(
-        'TaskList', back_populates='wg', cascade="all, delete-orphan")
+        'TaskList', back_populates='wg', cascade="all, delete-orphan", passive_deletes=True)
     budgetplannings = db.relationship(
-        'BudgetPlanning', back_populates='wg', cascade="all, delete-orphan")
+        'BudgetPlanning', back_populates='wg', cascade="all, delete-orphan", passive_deletes=True)
     __table_args__ = (
         db.UniqueConstraint('title', name='uq_wg_title'),
         db.UniqueConstraint('address', 'etage', name='uq_wg_address_etage'),
+        # The public directory is ordered and prefix-searched by these
+        *_lower_indexes('ix_wg_public_title', title, 'is_public'),
+        *_lower_indexes('ix_wg_public_address', address, 'is_public'),
     )
 
 
 class TaskList(db.Model):
     __tablename__ = 'TASKLIST'
-    idTaskList = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idTaskList = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     is_checked = db.Column(db.Boolean, default=False)
-    wg_id = db.Column(db.String(36), db.ForeignKey('WG.idWG'))
+    # Optimistic concurrency: ORM updates are conditional on it (concurrency.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+    wg_id = db.Column(CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), index=True)
     wg = db.relationship('WG', back_populates='tasklists')
     users = db.relationship(
-        'User', secondary=user_tasklist, back_populates='tasklists'
+        'User', secondary=user_tasklist, back_populates='tasklists', passive_deletes=True
     )
     tasks = db.relationship(
-        'Task', back_populates='tasklist', cascade="all, delete-orphan"
+        'Task', back_populates='tasklist', cascade="all, delete-orphan", passive_deletes=True
     )
 
 
 class Task(db.Model):
     __tablename__ = 'TASK'
-    idTask = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idTask = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text)
     start_date = db.Column(db.DateTime)
     end_date = db.Column(db.DateTime)
     is_done = db.Column(db.Boolean, default=False)
     is_template = db.Column(db.Boolean, default=False)
-    tasklist_id = db.Column(db.String(36), db.ForeignKey('TASKLIST.idTaskList'))
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+    # Recurrence of a template: 'daily', 'weekly' or 'monthly' every
+    # recurrence_interval units. next_occurrence is the start of the first
+    # instance that has not been materialized yet (see recurrence.py).
+    recurrence = db.Column(db.String(16))
+    recurrence_interval = db.Column(db.Integer, default=1)
+    next_occurrence = db.Column(db.DateTime, index=True)
+    # The template an instance was materialized from
+    template_id = db.Column(CompactUUID, db.ForeignKey('TASK.idTask', ondelete='SET NULL'))
+    # Indexed by ix_task_tasklist_end_start below
+    tasklist_id = db.Column(CompactUUID, db.ForeignKey('TASKLIST.idTaskList', ondelete='CASCADE'))
     tasklist = db.relationship('TaskList', back_populates='tasks')
     users = db.relationship(
-        'User', secondary=user_task, back_populates='tasks'
+        'User', secondary=user_task, back_populates='tasks', passive_deletes=True
+    )
+
+    __table_args__ = (
+        # An occurrence is materialized at most once, even by concurrent runs
+        db.UniqueConstraint('template_id', 'start_date', name='uq_task_template_start'),
+        # Calendar windows of a list are a range on end_date, or on start_date for
+        # tasks without an end; it also serves the foreign key
+        db.Index('ix_task_tasklist_end_start', 'tasklist_id', 'end_date', 'start_date'),
     )
 
 
 class ShoppingList(db.Model):
     __tablename__ = 'SHOPPINGLIST'
-    idShoppingList = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idShoppingList = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     is_checked = db.Column(db.Boolean, default=False)
-    creator_id = db.Column(db.String(36), db.ForeignKey('USERS.idUser'))
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+    # Lists outlive their creator
+    creator_id = db.Column(CompactUUID, db.ForeignKey('USERS.idUser', ondelete='SET NULL'), index=True)
     creator = db.relationship('User', foreign_keys=[creator_id])
-    wg_id = db.Column(db.String(36), db.ForeignKey('WG.idWG'))
+    wg_id = db.Column(CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), index=True)
     wg = db.relationship('WG', back_populates='shoppinglists')
     users = db.relationship(
-        'User', secondary=user_shoppinglist, back_populates='shoppinglists')
+        'User', secondary=user_shoppinglist, back_populates='shoppinglists', passive_deletes=True)
     items = db.relationship(
-        'Item', back_populates='shoppinglist', cascade="all, delete-orphan")
+        'Item', back_populates='shoppinglist', cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Item(db.Model):
     __tablename__ = 'ITEM'
-    idItem = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idItem = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text)
     is_checked = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
     shoppinglist_id = db.Column(
-        db.String(36), db.ForeignKey('SHOPPINGLIST.idShoppingList'))
+        CompactUUID, db.ForeignKey('SHOPPINGLIST.idShoppingList', ondelete='CASCADE'), index=True)
     shoppinglist = db.relationship('ShoppingList', back_populates='items')
     users = db.relationship(
-        'User', secondary=user_item, back_populates='items'
+        'User', secondary=user_item, back_populates='items', passive_deletes=True
     )
 
 
 class BudgetPlanning(db.Model):
     __tablename__ = 'BUDGETPLANNING'
-    idBudgetPlanning = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idBudgetPlanning = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text)
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     goal = db.Column(db.Float)
     deadline = db.Column(db.DateTime)
-    creator_id = db.Column(db.String(36), db.ForeignKey('USERS.idUser'))
+    creator_id = db.Column(CompactUUID, db.ForeignKey('USERS.idUser', ondelete='SET NULL'), index=True)
     creator = db.relationship('User', foreign_keys=[creator_id])
-    wg_id = db.Column(db.String(36), db.ForeignKey('WG.idWG'))
+    wg_id = db.Column(CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), index=True)
     wg = db.relationship('WG', back_populates='budgetplannings')
     users = db.relationship(
-        'User', secondary=user_budgetplanning, back_populates='budgetplannings')
+        'User', secondary=user_budgetplanning, back_populates='budgetplannings', passive_deletes=True)
     costs = db.relationship(
-        'Cost', back_populates='budgetplanning', cascade="all, delete-orphan")
+        'Cost', back_populates='budgetplanning', cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Cost(db.Model):
     __tablename__ = 'COST'
-    idCost = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    idCost = db.Column(CompactUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text)
     goal = db.Column(db.Float)
     paid = db.Column(db.Float, default=0.0)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
     budgetplanning_id = db.Column(
-        db.String(36), db.ForeignKey('BUDGETPLANNING.idBudgetPlanning'))
+        CompactUUID, db.ForeignKey('BUDGETPLANNING.idBudgetPlanning', ondelete='CASCADE'), index=True)
     budgetplanning = db.relationship('BudgetPlanning', back_populates='costs')
     users = db.relationship('User', secondary=user_cost,
-                            back_populates='costs')
+                            back_populates='costs', passive_deletes=True)
+
+
+class FeedToken(db.Model):
+    """A calendar feed of a user's tasks, or of a whole WG when wg_id is set.
+
+    Only a hash of the token is stored; deleting the row revokes the feed.
+    """
+    __tablename__ = 'FEEDTOKEN'
+    idFeedToken = db.Column(CompactUUID, primary_key=True, default=new_id)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    user_id = db.Column(CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'),
+                        nullable=False, index=True)
+    wg_id = db.Column(CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class IdempotencyKey(db.Model):
+    """The stored response to a request made with an Idempotency-Key (idempotency.py)."""
+    __tablename__ = 'IDEMPOTENCYKEY'
+    user_id = db.Column(CompactUUID, db.ForeignKey('USERS.idUser', ondelete='CASCADE'), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    # NULL while the first request with the key is still running
+    status = db.Column(db.Integer)
+    # When that request started; a retry takes over a claim this much older
+    # than IDEMPOTENCY_LEASE_SECONDS, as its request died
+    claimed_at = db.Column(db.DateTime)
+    content_type = db.Column(db.String(128))
+    body = db.Column(db.LargeBinary)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class WGShard(db.Model):
+    """The shard a WG's subtree lives in (shards.py); WGs without a row are in the main database."""
+    __tablename__ = 'WGSHARD'
+    wg_id = db.Column(CompactUUID, db.ForeignKey('WG.idWG', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.String(64), nullable=False, index=True)
+    # Set while 'flask shards move' copies the WG; writes to it are refused meanwhile
+    moving = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class Job(db.Model):
+    """A unit of background work, processed by jobs.Worker."""
+    __tablename__ = 'JOB'
+    idJob = db.Column(CompactUUID, primary_key=True, default=new_id)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # 'queued', 'running' or 'failed'; finished jobs are deleted
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    # When the job may be claimed next: the enqueue time, the end of a retry
+    # backoff, or for a running job the end of its visibility timeout
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
@@ -0,0 +1,76 @@
+import os
+import time
+import uuid
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+
+def uuid7():
+    """Returns a time-ordered UUID (version 7, RFC 9562).
+
+    The first 48 bits are the Unix time in milliseconds, so new keys are
+    appended at the right edge of the primary key index instead of being
+    scattered across it like random UUID4 keys.
+    """
+    nanos = time.time_ns()
+    millis, remainder = divmod(nanos, 1_000_000)
+    # The 12 bits after the version hold the sub-millisecond fraction, so keys
+    # generated within the same millisecond still sort in creation order
+    fraction = remainder * 4096 // 1_000_000
+    rand = int.from_bytes(os.urandom(8), 'big')
+    value = (millis & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                          # version
+    value |= fraction << 64
+    value |= 0b10 << 62                         # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF       # 62 random bits
+    return uuid.UUID(int=value)
+
+
+def new_id():
+    """Default for every primary key column; the API keeps using strings."""
+    return str(uuid7())
+
+
+class CompactUUID(TypeDecorator):
+    """A UUID that is a canonical string in Python but stored compactly.
+
+    Postgres stores the native 16-byte ``uuid`` type, every other database a
+    16-byte binary instead of 36 characters of text. Strings that are not a
+    UUID bind as NULL, so looking up a malformed id simply finds nothing.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(str(value))
+            except ValueError:
+                return None
+        if dialect.name == 'postgresql':
+            return str(value)
+        return value.bytes
+
+    def process_literal_param(self, value, dialect):
+        value = self.process_bind_param(value, dialect)
+        if value is None:
+            return 'NULL'
+        if isinstance(value, bytes):
+            return f"X'{value.hex()}'"
+        return f"'{value}'"
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            return str(uuid.UUID(bytes=value))
+        return str(value)
@@ -0,0 +1,46 @@
+import json
+import os
+
+from flask import send_file
+from flasgger import Swagger
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_SPEC_FILE = os.path.join(basedir, 'static', 'openapi.json')
+
+
+class CachedSwagger(Swagger):
+    """Flasgger that serves a pre-built OpenAPI spec when one is available.
+
+    Building the spec means parsing the YAML docstring of every view, which
+    every worker would otherwise repeat on its first request to the docs.
+    ``flask openapi build`` writes the spec once at build time; if that file
+    exists the spec routes just send it, and the docstrings are never parsed.
+    """
+
+    def init_app(self, app, decorators=None):
+        self.spec_file = app.config.get('OPENAPI_SPEC_FILE') or DEFAULT_SPEC_FILE
+        super().init_app(app, decorators=decorators)
+
+    def register_views(self, app):
+        super().register_views(app)
+        if not os.path.exists(self.spec_file):
+            return
+        for endpoint in self.endpoints:
+            app.view_functions[f'flasgger.{endpoint}'] = self._send_spec
+
+    def _send_spec(self):
+        return send_file(self.spec_file, mimetype='application/json', conditional=True)
+
+    def build_spec(self, endpoint=Swagger.DEFAULT_ENDPOINT):
+        """Builds the spec from the view docstrings, ignoring any cached file."""
+        self.apispecs.pop(endpoint, None)
+        return self.get_apispecs(endpoint)
+
+    def write_spec(self, endpoint=Swagger.DEFAULT_ENDPOINT):
+        spec = self.build_spec(endpoint)
+        os.makedirs(os.path.dirname(self.spec_file), exist_ok=True)
+        tmp_file = self.spec_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(spec, f, separators=(',', ':'), default=str)
+        os.replace(tmp_file, self.spec_file)
+        return self.spec_file
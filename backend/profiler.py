@@ -0,0 +1,162 @@
+import os
+import re
+import time
+import traceback
+from collections import defaultdict
+
+from flask import request, g, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames from these modules are skipped when looking for the caller of a statement
+SKIPPED_FILES = {os.path.join(BACKEND_DIR, name) for name in ('profiler.py', 'metrics.py')}
+
+_IN_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_statement(statement):
+    """Reduces a statement to its shape so that executions differing only in
+    parameters, literals or the length of an IN list compare equal."""
+    statement = _WHITESPACE.sub(' ', statement.strip())
+    statement = _LITERALS.sub('?', statement)
+    return _IN_LIST.sub('(?)', statement)
+
+
+def _call_site():
+    """Returns ``file:line (function)`` of the innermost frame in the app's own code."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = frame.filename
+        if (filename.startswith(BACKEND_DIR) and filename not in SKIPPED_FILES
+                and 'site-packages' not in filename):
+            return f'{os.path.relpath(filename, BACKEND_DIR)}:{frame.lineno} ({frame.name})'
+    return '?'
+
+
+def profiling_requested(app):
+    if app.config['SQL_PROFILING']:
+        return True
+    token = app.config['PROFILE_TOKEN']
+    return bool(token) and request.headers.get(PROFILE_HEADER) == token
+
+
+# Like metrics.py, the start time is kept on the statement's execution context
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and g.get('sql_profile') is not None:
+        context._wg_profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_wg_profile_start', None)
+    if started is None or not has_request_context() or g.get('sql_profile') is None:
+        return
+    g.sql_profile.append({
+        'statement': statement,
+        'parameters': parameters,
+        'executemany': executemany,
+        'started': started,
+        'duration': time.perf_counter() - started,
+        'call_site': _call_site(),
+        'dialect': conn.dialect.name,
+        # The replica or a shard, for statements that did not run on the primary
+        'engine': conn.engine,
+    })
+
+
+def find_repeated(statements, threshold):
+    """Groups statements by shape and returns the groups executed at least
+    ``threshold`` times, the typical sign of an N+1 query."""
+    groups = defaultdict(list)
+    for entry in statements:
+        groups[normalize_statement(entry['statement'])].append(entry)
+    return {shape: entries for shape, entries in groups.items() if len(entries) >= threshold}
+
+
+def explain(entry):
+    """Returns the query plan of a captured SELECT, on the database it ran on, as a list of lines."""
+    prefix = 'EXPLAIN QUERY PLAN ' if entry['dialect'] == 'sqlite' else 'EXPLAIN '
+    with entry['engine'].connect() as conn:
+        rows = conn.exec_driver_sql(prefix + entry['statement'], entry['parameters'] or ())
+        return [' '.join(str(value) for value in row) for row in rows]
+
+
+def server_timing(statements, total, auth_window):
+    """Splits the request time into auth, DB and app (view and serialization) time."""
+    auth_start, auth_end = auth_window or (0, 0)
+    auth = auth_end - auth_start
+    db_time = sum(
+        s['duration'] for s in statements
+        if not auth_start <= s['started'] < auth_end
+    )
+    app_time = max(total - auth - db_time, 0)
+    return ', '.join([
+        f'auth;dur={auth * 1000:.2f}',
+        f'db;dur={db_time * 1000:.2f};desc="{len(statements)} statements"',
+        f'app;dur={app_time * 1000:.2f}',
+        f'total;dur={total * 1000:.2f}',
+    ])
+
+
+def _before_request():
+    if profiling_requested(current_app):
+        g.sql_profile = []
+        g.profile_start = time.perf_counter()
+
+
+def _after_request(response):
+    statements = g.get('sql_profile')
+    if statements is None:
+        return response
+    total = time.perf_counter() - g.profile_start
+    # Stop capturing so the EXPLAIN statements below are not profiled themselves
+    g.sql_profile = None
+
+    config = current_app.config
+    logger = current_app.logger
+    response.headers['Server-Timing'] = server_timing(statements, total, g.get('auth_window'))
+
+    lines = [f'{request.method} {request.path}: {len(statements)} statements in {total * 1000:.1f} ms']
+    for entry in statements:
+        lines.append(f"  {entry['duration'] * 1000:7.2f} ms  {entry['call_site']}  "
+                     f"{_WHITESPACE.sub(' ', entry['statement'])[:200]}")
+    logger.info('\n'.join(lines))
+
+    repeated = find_repeated(statements, config['N_PLUS_ONE_THRESHOLD'])
+    for shape, entries in repeated.items():
+        sites = sorted({e['call_site'] for e in entries})
+        logger.warning('Possible N+1 on %s %s: %d x %s\n  from %s',
+                       request.method, request.path, len(entries), shape[:200], ', '.join(sites))
+    if repeated:
+        response.headers['X-Profile-N-Plus-One'] = str(len(repeated))
+
+    slow_ms = config['SLOW_QUERY_MS']
+    for entry in statements:
+        if entry['duration'] * 1000 < slow_ms or entry['executemany']:
+            continue
+        if not entry['statement'].lstrip().upper().startswith('SELECT'):
+            continue
+        try:
+            plan = explain(entry)
+        except Exception as e:
+            plan = [f'EXPLAIN failed: {e}']
+        logger.warning('Slow statement (%.1f ms) at %s\n  %s\n  plan:\n    %s',
+                       entry['duration'] * 1000, entry['call_site'],
+                       _WHITESPACE.sub(' ', entry['statement']), '\n    '.join(plan))
+    return response
+
+
+def init_profiler(app):
+    """Captures the SQL of each request when profiling is on or requested.
+
+    Profiling is enabled for every request with ``SQL_PROFILING=1`` or for a
+    single request by sending the ``PROFILE_TOKEN`` in the ``X-Profile`` header.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
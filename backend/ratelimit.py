@@ -0,0 +1,168 @@
+"""Per-caller rate limits.
+
+Every request falls into a route class with its own token bucket per caller:
+``auth`` (login and registration, keyed by the client IP as there is no user
+yet), ``write`` and ``read`` (keyed by the user of a valid token, otherwise by
+the client IP). A bucket refills at RATE tokens a second up to BURST; a request
+takes one token or is refused with 429 and a Retry-After.
+
+Endpoints that are cheap but called very often get a limit of their own::
+
+    @bp.route('/users/suggest')
+    @token_required
+    @rate_limit('user_suggest', 'USER_SUGGEST_RATE', 'USER_SUGGEST_BURST')
+    def suggest_users(): ...
+
+With a shared store (shared_store.py) the buckets are shared by all worker
+processes on the host. Otherwise they live in the process, so with N workers a
+caller gets up to N times the rate.
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from decorators import token_user_id
+from metrics import RATE_LIMITED
+from shared_store import shared_store
+
+# Buckets kept per process; the least recently used callers are forgotten
+# first, which costs them nothing as an idle bucket is full again anyway
+MAX_BUCKETS = 10000
+
+ROUTE_CLASSES = ('auth', 'write', 'read')
+AUTH_ENDPOINTS = {'auth_bp.login', 'auth_bp.register'}
+EXEMPT_ENDPOINTS = {'static', 'metrics'}
+
+
+def _take(tokens, last, now, rate, burst):
+    """Refills a bucket and takes a token; returns (tokens, seconds to wait)."""
+    tokens = min(burst, tokens + max(0.0, now - last) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class RateLimiter:
+    """Buckets in the memory of this process."""
+
+    def __init__(self, maxsize=MAX_BUCKETS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, rate, burst):
+        """Takes a token for ``key``; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens, wait = _take(tokens, last, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedRateLimiter:
+    """Buckets in the shared store, seen by every process on the host."""
+
+    def __init__(self, store):
+        self.store = store
+        self.store.connect().execute(
+            'CREATE TABLE IF NOT EXISTS rate_bucket ('
+            ' key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)')
+
+    def hit(self, key, rate, burst):
+        """Takes a token for ``key``; returns 0, or the seconds until one is available."""
+        now = self.store.now()
+        with self.store.transaction() as conn:
+            row = conn.execute('SELECT tokens, updated FROM rate_bucket WHERE key = ?', (key,)).fetchone()
+            tokens, last = row if row else (burst, now)
+            tokens, wait = _take(tokens, last, now, rate, burst)
+            conn.execute(
+                'INSERT INTO rate_bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET'
+                ' tokens = excluded.tokens, updated = excluded.updated, full_at = excluded.full_at',
+                (key, tokens, now, now + (burst - tokens) / rate))
+        # Buckets that have filled up again are the same as no bucket
+        self.store.maybe_prune('rate_bucket', 'full_at', now)
+        return wait
+
+    def clear(self):
+        self.store.connect().execute('DELETE FROM rate_bucket')
+
+
+def limiter():
+    """The app's rate limiter."""
+    return current_app.extensions['rate_limiter']
+
+
+def check_limit(name, key, rate, burst):
+    """The 429 response when ``key`` is over the limit ``name``, else None."""
+    try:
+        wait = limiter().hit(f'{name}:{key}', rate, burst)
+    except sqlite3.Error:
+        # A busy or broken store must not take the API down with it
+        current_app.logger.exception('Rate limit store failed, letting the request through')
+        return None
+    if not wait:
+        return None
+    RATE_LIMITED.labels(name).inc()
+    return jsonify({'message': 'Too many requests'}), 429, {'Retry-After': str(math.ceil(wait))}
+
+
+def route_class():
+    """The route class of the current request, or None for exempt requests."""
+    if request.method == 'OPTIONS' or request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if request.endpoint in AUTH_ENDPOINTS:
+        return 'auth'
+    return 'read' if request.method in ('GET', 'HEAD') else 'write'
+
+
+def caller_key(name):
+    """The user id of a valid token, or the client IP for auth and anonymous requests."""
+    user_id = token_user_id() if name != 'auth' else None
+    return f'user:{user_id}' if user_id else f'ip:{request.remote_addr}'
+
+
+def rate_limit(name, rate_setting, burst_setting):
+    """Limits the requests of each user; goes below token_required."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            config = current_app.config
+            response = check_limit(name, g.current_user.idUser, config[rate_setting], config[burst_setting])
+            if response is not None:
+                return response
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def _before_request():
+    name = route_class()
+    if name is None or not current_app.config['RATE_LIMITS']:
+        return None
+    prefix = f'RATE_LIMIT_{name.upper()}'
+    config = current_app.config
+    return check_limit(name, caller_key(name), config[f'{prefix}_RATE'], config[f'{prefix}_BURST'])
+
+
+def init_rate_limits(app):
+    """Applies the route class limits to every request."""
+    if app.config['TRUSTED_PROXIES']:
+        # The client IP is taken from X-Forwarded-For set by that many proxies
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    store = shared_store(app)
+    app.extensions['rate_limiter'] = SharedRateLimiter(store) if store else RateLimiter()
+    app.before_request(_before_request)
@@ -0,0 +1,172 @@
+"""Materializes the instances of recurring task templates.
+
+A template is a task with ``is_template`` set and a recurrence rule. Its
+instances are ordinary tasks that are only created for a rolling window of
+``RECURRENCE_WINDOW_DAYS`` ahead, never for the whole future. Finding the
+templates that are due is a range scan on the ``next_occurrence`` index, and
+every run writes all new instances with one batched insert.
+
+Runs are triggered lazily by requests, at most once every
+``RECURRENCE_CHECK_SECONDS`` per process, and by ``flask tasks materialize``.
+"""
+import calendar
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models import Task, TaskList, user_task
+from models.types import new_id
+from shards import shard_engine, shard_names
+
+UNITS = ('daily', 'weekly', 'monthly')
+
+# Upper bound of templates handled in one run, so a run stays a bounded batch;
+# the rest are picked up by the next run
+MAX_TEMPLATES_PER_RUN = 1000
+
+_lock = threading.Lock()
+_last_run = 0.0
+
+
+def add_months(value, months, day):
+    """Adds months to a datetime, clamping ``day`` to the length of the month."""
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+
+def following_occurrence(occurrence, unit, interval, anchor_day):
+    """Returns the occurrence after ``occurrence``.
+
+    Monthly rules keep the day of the month of the first occurrence
+    (``anchor_day``), so the 31st falls on the last day of shorter months
+    without drifting to the 28th afterwards.
+    """
+    interval = interval or 1
+    if unit == 'daily':
+        return occurrence + timedelta(days=interval)
+    if unit == 'weekly':
+        return occurrence + timedelta(weeks=interval)
+    if unit == 'monthly':
+        return add_months(occurrence, interval, anchor_day)
+    raise ValueError(f'Unknown recurrence unit: {unit}')
+
+
+def materialize_due(now=None, window_days=None, template_ids=None, engine=None):
+    """Creates the instances of every template due within the window.
+
+    Returns the number of tasks created. ``template_ids`` restricts the run to
+    some templates, e.g. right after one was created. ``engine`` is the
+    database to run on, with shards (shards.py) each of them in turn.
+    """
+    now = now or datetime.utcnow()
+    if window_days is None:
+        window_days = current_app.config['RECURRENCE_WINDOW_DAYS']
+    horizon = now + timedelta(days=window_days)
+    tasks = Task.__table__
+
+    stmt = (
+        db.select(tasks.c.idTask, tasks.c.title, tasks.c.description, tasks.c.start_date,
+                  tasks.c.end_date, tasks.c.tasklist_id, tasks.c.recurrence,
+                  tasks.c.recurrence_interval, tasks.c.next_occurrence)
+        .where(tasks.c.next_occurrence < horizon,
+               tasks.c.is_template == True,  # noqa: E712
+               tasks.c.recurrence.is_not(None))
+        .order_by(tasks.c.next_occurrence)
+        .limit(MAX_TEMPLATES_PER_RUN)
+        # Concurrent runs on Postgres skip the templates another run holds;
+        # SQLite serializes writers anyway
+        .with_for_update(skip_locked=True)
+    )
+    if template_ids is not None:
+        stmt = stmt.where(tasks.c.idTask.in_(template_ids))
+
+    with (engine or db.engine).begin() as conn:
+        templates = conn.execute(stmt).all()
+        if not templates:
+            return 0
+        assignees = {}
+        for task_id, user_id in conn.execute(
+                db.select(user_task.c.task_id, user_task.c.user_id)
+                .where(user_task.c.task_id.in_([t.idTask for t in templates]))):
+            assignees.setdefault(task_id, []).append(user_id)
+
+        task_rows, link_rows, advanced, tasklist_ids = [], [], [], set()
+        for template in templates:
+            duration = (template.end_date - template.start_date
+                        if template.end_date and template.start_date else None)
+            anchor_day = (template.start_date or template.next_occurrence).day
+            occurrence = template.next_occurrence
+            # After a long pause only the current occurrence is created, not
+            # every one that was missed in between
+            while True:
+                following = following_occurrence(occurrence, template.recurrence,
+                                                 template.recurrence_interval, anchor_day)
+                if following > now:
+                    break
+                occurrence = following
+            while occurrence < horizon:
+                task_id = new_id()
+                task_rows.append({
+                    'idTask': task_id,
+                    'title': template.title,
+                    'description': template.description,
+                    'start_date': occurrence,
+                    'end_date': occurrence + duration if duration is not None else None,
+                    'is_done': False,
+                    'is_template': False,
+                    'template_id': template.idTask,
+                    'tasklist_id': template.tasklist_id,
+                })
+                link_rows.extend({'user_id': user_id, 'task_id': task_id}
+                                 for user_id in assignees.get(template.idTask, ()))
+                occurrence = following_occurrence(occurrence, template.recurrence,
+                                                  template.recurrence_interval, anchor_day)
+            advanced.append({'b_id': template.idTask, 'b_next': occurrence})
+            tasklist_ids.add(template.tasklist_id)
+
+        if task_rows:
+            conn.execute(tasks.insert(), task_rows)
+        if link_rows:
+            conn.execute(user_task.insert(), link_rows)
+        conn.execute(
+            tasks.update().where(tasks.c.idTask == bindparam('b_id'))
+            .values(next_occurrence=bindparam('b_next')),
+            advanced,
+        )
+        # New open tasks reopen their lists
+        conn.execute(
+            TaskList.__table__.update()
+            .where(TaskList.__table__.c.idTaskList.in_(tasklist_ids))
+            .values(is_checked=False)
+        )
+    return len(task_rows)
+
+
+def _before_request():
+    global _last_run
+    interval = current_app.config['RECURRENCE_CHECK_SECONDS']
+    if not interval or time.monotonic() - _last_run < interval:
+        return
+    # Only one thread per process runs it; the others carry on immediately
+    if not _lock.acquire(blocking=False):
+        return
+    try:
+        _last_run = time.monotonic()
+        created = sum(materialize_due(engine=shard_engine(name)) for name in shard_names())
+        if created:
+            current_app.logger.info('Materialized %d recurring tasks', created)
+    except SQLAlchemyError:
+        current_app.logger.exception('Materializing recurring tasks failed')
+    finally:
+        _lock.release()
+
+
+def init_recurrence(app):
+    app.before_request(_before_request)
@@ -0,0 +1,98 @@
+"""Sends the reads of GET requests to a read replica.
+
+With REPLICA_DATABASE_URL set, the ``replica`` bind is a second engine on a
+read-only copy of the database. db.session (extensions.RoutingSession) sends
+the statements of GET and HEAD requests there; writes, every other request and
+everything outside of requests (CLI commands, jobs) use the primary. A GET
+that writes after all reads from the primary from then on.
+
+A replica lags behind the primary, so a user who changed something reads from
+the primary for REPLICA_STICKY_SECONDS afterwards and sees their own change.
+The recent writers are kept in the shared store, which makes this hold
+whichever worker their next request reaches.
+"""
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, request
+
+from decorators import token_user_id
+from extensions import REPLICA
+from metrics import DB_ROUTED
+from shared_store import shared_store
+
+SAFE_METHODS = ('GET', 'HEAD')
+# Recent writers kept per process without a shared store; expired ones are
+# dropped when there are more
+MAX_WRITERS = 10000
+
+
+class RecentWriters:
+    """Users who wrote in the last few seconds, in the shared store or in the process."""
+
+    def __init__(self, store=None):
+        self.store = store
+        self._until = {}
+        self._lock = threading.Lock()
+        if store:
+            store.connect().execute(
+                'CREATE TABLE IF NOT EXISTS recent_writer (user_id TEXT PRIMARY KEY, until REAL NOT NULL)')
+
+    def add(self, user_id, seconds):
+        if self.store is None:
+            now = time.monotonic()
+            with self._lock:
+                self._until[user_id] = now + seconds
+                if len(self._until) > MAX_WRITERS:
+                    self._until = {key: until for key, until in self._until.items() if until > now}
+            return
+        now = self.store.now()
+        with self.store.transaction() as conn:
+            conn.execute('INSERT INTO recent_writer (user_id, until) VALUES (?, ?)'
+                         ' ON CONFLICT (user_id) DO UPDATE SET until = excluded.until', (user_id, now + seconds))
+        self.store.maybe_prune('recent_writer', 'until', now)
+
+    def __contains__(self, user_id):
+        if self.store is None:
+            return self._until.get(user_id, 0) > time.monotonic()
+        row = self.store.connect().execute('SELECT until FROM recent_writer WHERE user_id = ?',
+                                           (user_id,)).fetchone()
+        return row is not None and row[0] > self.store.now()
+
+    def clear(self):
+        with self._lock:
+            self._until.clear()
+        if self.store:
+            self.store.connect().execute('DELETE FROM recent_writer')
+
+
+def _before_request():
+    if request.method not in SAFE_METHODS:
+        return
+    user_id = token_user_id()
+    try:
+        g.read_replica = not (user_id and user_id in current_app.extensions['recent_writers'])
+    except sqlite3.Error:
+        current_app.logger.exception('Shared store failed, reading from the primary')
+        g.read_replica = False
+    DB_ROUTED.labels(REPLICA if g.read_replica else 'primary').inc()
+
+
+def _after_request(response):
+    if request.method not in SAFE_METHODS and response.status_code < 400 and 'current_user' in g:
+        try:
+            current_app.extensions['recent_writers'].add(g.current_user.idUser,
+                                                         current_app.config['REPLICA_STICKY_SECONDS'])
+        except sqlite3.Error:
+            current_app.logger.exception('Shared store failed, the write is not sticky')
+    return response
+
+
+def init_replica(app):
+    """Routes the reads of GET requests to the replica bind, if there is one."""
+    if REPLICA not in app.config['SQLALCHEMY_BINDS']:
+        return
+    app.extensions['recent_writers'] = RecentWriters(shared_store(app))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
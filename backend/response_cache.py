@@ -0,0 +1,197 @@
+"""Cached responses of the WG read endpoints, keyed by the WG's version.
+
+GET /wg/<id>, the task lists, shopping lists and budget plans of a WG and GET
+/tasklist/<id>, /shoppinglist/<id> and /budgetplanning/<id> serialize large
+parts of a WG, which its housemates read many times a minute. Their response
+bodies are cached under the WG's ``data_version`` and ``tasks_version`` and
+the caller's roles in it, so a single statement tells whether a cached
+response still holds and whether the caller may see it.
+
+``data_version`` is bumped in the transaction of every ORM write to a WG, its
+lists and their entries, and to the names and memberships of its users;
+``tasks_version`` also covers the tasks written with plain SQL (recurrence.py,
+calendar_feed.py). Entries are never deleted on writes: a bump makes them
+unreachable and they fall out of the caches. Other SQL that changes what these
+responses show calls bump_wgs.
+
+Every process keeps RESPONSE_CACHE_SIZE responses; with SHARED_STORE the
+workers of a host also share them for RESPONSE_CACHE_SECONDS. The cache is
+off with WG shards.
+"""
+import sqlite3
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from sqlalchemy import event, inspect
+
+import shards
+from cache import LRUCache
+from extensions import RoutingSession, db
+from metrics import CACHE_LOOKUPS
+from models import WG, BudgetPlanning, Cost, Item, ShoppingList, Task, TaskList, User, admin_wg, user_wg
+from shared_store import shared_store
+
+# Part of every key; bump it when the output of a cached view changes
+RESPONSE_FORMAT = 1
+
+# Entry model -> (relationship, model and column of the list it is in)
+PARENTS = {
+    Task: ('tasklist', TaskList, 'tasklist_id'),
+    Item: ('shoppinglist', ShoppingList, 'shoppinglist_id'),
+    Cost: ('budgetplanning', BudgetPlanning, 'budgetplanning_id'),
+}
+
+
+class ResponseCache:
+    """Response bodies in a per-process LRU, in front of the shared store if there is one."""
+
+    def __init__(self, maxsize, ttl, store=None):
+        self.local = LRUCache('responses', maxsize)
+        self.ttl = ttl
+        self.store = store
+        if store:
+            store.connect().execute('CREATE TABLE IF NOT EXISTS response_cache'
+                                    ' (key TEXT PRIMARY KEY, body BLOB NOT NULL, until REAL NOT NULL)')
+
+    def get(self, key):
+        body = self.local.get(key)
+        if body is not None or self.store is None:
+            return body
+        row = self.store.connect().execute('SELECT body FROM response_cache WHERE key = ? AND until > ?',
+                                           (key, self.store.now())).fetchone()
+        CACHE_LOOKUPS.labels('responses_shared', 'miss' if row is None else 'hit').inc()
+        if row is None:
+            return None
+        self.local.set(key, row[0])
+        return row[0]
+
+    def set(self, key, body):
+        self.local.set(key, body)
+        if self.store is None:
+            return
+        now = self.store.now()
+        self.store.connect().execute('INSERT OR REPLACE INTO response_cache (key, body, until)'
+                                     ' VALUES (?, ?, ?)', (key, body, now + self.ttl))
+        self.store.maybe_prune('response_cache', 'until', now)
+
+    def clear(self):
+        self.local.clear()
+        if self.store:
+            self.store.connect().execute('DELETE FROM response_cache')
+
+
+def _key(model, ident):
+    """The cache key of the current request's response about a ``model`` row, or None.
+
+    None when the row does not exist or the user has no role in its WG; the
+    view answers those itself.
+    """
+    user_id = g.current_user.idUser
+    query = db.select(
+        WG.data_version, WG.tasks_version, WG.creator_id == user_id,
+        db.exists().where(admin_wg.c.wg_id == WG.idWG, admin_wg.c.user_id == user_id),
+        db.exists().where(user_wg.c.wg_id == WG.idWG, user_wg.c.user_id == user_id))
+    if model is WG:
+        query = query.where(WG.idWG == ident)
+    else:
+        query = query.join_from(model, WG).where(inspect(model).primary_key[0] == ident)
+    row = db.session.execute(query).first()
+    if row is None:
+        return None
+    data_version, tasks_version, *flags = row
+    roles = '+'.join(role for role, flag in zip(('creator', 'admin', 'member'), flags) if flag)
+    if not roles:
+        return None
+    return f'{RESPONSE_FORMAT}:{request.endpoint}:{ident}:{data_version}:{tasks_version}:{roles}'
+
+
+def cached_response(model):
+    """Serves a GET view about a ``model`` row from the cache; goes below token_required."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(**kwargs):
+            cache = current_app.extensions.get('response_cache')
+            key = cache and _key(model, *kwargs.values())
+            if key is None:
+                return f(**kwargs)
+            try:
+                body = cache.get(key)
+            except sqlite3.Error:
+                current_app.logger.exception('Shared store failed, not using cached responses')
+                body = None
+            if body is not None:
+                return current_app.response_class(body, mimetype='application/json')
+
+            response = make_response(f(**kwargs))
+            if response.status_code == 200:
+                try:
+                    cache.set(key, response.get_data())
+                except sqlite3.Error:
+                    current_app.logger.exception('Shared store failed, the response is not cached')
+            return response
+        return decorated
+    return decorator
+
+
+def user_wgs(user_id):
+    """A select of the WGs whose responses show the user: their own and those of lists they created."""
+    return db.union(
+        db.select(user_wg.c.wg_id).where(user_wg.c.user_id == user_id),
+        db.select(admin_wg.c.wg_id).where(admin_wg.c.user_id == user_id),
+        db.select(ShoppingList.wg_id).where(ShoppingList.creator_id == user_id),
+        db.select(BudgetPlanning.wg_id).where(BudgetPlanning.creator_id == user_id),
+    )
+
+
+def bump_wgs(wg_ids, session=None):
+    """Bumps the data_version of the WGs, which makes their cached responses unreachable."""
+    wg_ids = set(wg_ids) - {None}
+    if not wg_ids:
+        return
+    wg = WG.__table__
+    (session or db.session).execute(
+        wg.update().where(wg.c.idWG.in_(wg_ids)).values(data_version=wg.c.data_version + 1))
+
+
+def _wg_id(session, obj):
+    if type(obj) in PARENTS:
+        name, model, column = PARENTS[type(obj)]
+        # Pending entries do not load their list through the relationship
+        obj = getattr(obj, name) or (getattr(obj, column) and session.get(model, getattr(obj, column)))
+        if not obj:
+            return None
+    if obj.wg_id is not None:
+        return obj.wg_id
+    return obj.wg.idWG if obj.wg is not None else None
+
+
+def _before_flush(session, flush_context, instances):
+    wg_ids, renamed = set(), []
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, WG):
+            # A new WG has nothing cached yet
+            if obj not in session.new and session.is_modified(obj):
+                wg_ids.add(obj.idWG)
+        elif isinstance(obj, (TaskList, ShoppingList, BudgetPlanning, *PARENTS)):
+            wg_ids.add(_wg_id(session, obj))
+        elif isinstance(obj, User) and obj in session.dirty:
+            state = inspect(obj)
+            for name in ('wgs', 'admin_wgs'):
+                history = state.attrs[name].history
+                wg_ids.update(wg.idWG for wg in (*history.added, *history.deleted))
+            if state.attrs.strUser.history.has_changes():
+                renamed.append(obj.idUser)
+    for user_id in renamed:
+        wg_ids.update(session.scalars(user_wgs(user_id)))
+    bump_wgs(wg_ids, session)
+
+
+def init_response_cache(app):
+    """Caches the responses of the views under cached_response, unless switched off or sharded."""
+    if not app.config['RESPONSE_CACHE_SIZE'] or shards.enabled(app):
+        return
+    app.extensions['response_cache'] = ResponseCache(
+        app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_SECONDS'], shared_store(app))
+
+
+event.listen(RoutingSession, 'before_flush', _before_flush)
@@ -0,0 +1,256 @@
+"""Full-text search over the titles and descriptions of a WG's content.
+
+Every task list, task, shopping list, item, budget plan and cost has a row in
+``search_doc``, kept in sync by database triggers, so bulk imports and cascade
+deletes update the index as well as the ORM does.
+
+SQLite indexes the text in the FTS5 table ``search_fts`` (rowid = docid of
+``search_doc``). The WG id is an indexed column of its own, so restricting a
+query to one WG intersects two posting lists instead of filtering every match.
+Postgres keeps a weighted ``tsvector`` in ``search_doc`` with a GIN index.
+
+Queries are matched as they are typed: every word has to match, the last one
+as a prefix ("descale boi" finds "Descale the boiler"). Results are ranked
+with title matches first. SQLite does not use bm25() for this: every result
+contains every word, so its global term statistics barely change the order,
+yet collecting them reads the whole posting list of each word in the database.
+"""
+import re
+import uuid
+from collections import namedtuple
+
+from sqlalchemy import bindparam, event, text
+
+from extensions import db
+from models.types import CompactUUID
+
+# Largest page a client may ask for
+MAX_PER_PAGE = 50
+
+# Words that are matched at most; the rest of a query is ignored
+MAX_WORDS = 16
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+SearchSource = namedtuple('SearchSource', 'kind table pk parent_column parent_table parent_pk')
+
+SOURCES = [
+    SearchSource('tasklist', 'TASKLIST', 'idTaskList', None, None, None),
+    SearchSource('shoppinglist', 'SHOPPINGLIST', 'idShoppingList', None, None, None),
+    SearchSource('budgetplanning', 'BUDGETPLANNING', 'idBudgetPlanning', None, None, None),
+    SearchSource('task', 'TASK', 'idTask', 'tasklist_id', 'TASKLIST', 'idTaskList'),
+    SearchSource('item', 'ITEM', 'idItem', 'shoppinglist_id', 'SHOPPINGLIST', 'idShoppingList'),
+    SearchSource('cost', 'COST', 'idCost', 'budgetplanning_id', 'BUDGETPLANNING', 'idBudgetPlanning'),
+]
+
+
+def _sqlite_wg(source, row):
+    if source.parent_column is None:
+        return f'{row}.wg_id'
+    return (f'(SELECT wg_id FROM "{source.parent_table}" '
+            f'WHERE "{source.parent_pk}" = {row}."{source.parent_column}")')
+
+
+def _sqlite_ddl():
+    statements = [
+        'CREATE TABLE IF NOT EXISTS search_doc ('
+        ' docid INTEGER PRIMARY KEY,'
+        ' kind VARCHAR(16) NOT NULL,'
+        ' row_id BLOB NOT NULL UNIQUE,'
+        ' parent_id BLOB,'
+        ' wg_id BLOB)',
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+        # Prefix queries up to six characters read a prefix index instead of
+        # merging the posting lists of every word they match
+        " wg, title, description, prefix='2 3 4 5 6', tokenize='unicode61 remove_diacritics 2')",
+    ]
+    for source in SOURCES:
+        parent = f'NEW."{source.parent_column}"' if source.parent_column else 'NULL'
+        wg = _sqlite_wg(source, 'NEW')
+        docid = f'(SELECT docid FROM search_doc WHERE row_id = {{row}}."{source.pk}")'
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS search_{source.kind}_insert AFTER INSERT ON "{source.table}" BEGIN'
+            f' INSERT INTO search_doc (kind, row_id, parent_id, wg_id)'
+            f' VALUES (\'{source.kind}\', NEW."{source.pk}", {parent}, {wg});'
+            f' INSERT INTO search_fts (rowid, wg, title, description)'
+            f' VALUES (last_insert_rowid(), hex({wg}), NEW.title, NEW.description);'
+            f' END',
+            f'CREATE TRIGGER IF NOT EXISTS search_{source.kind}_update'
+            f' AFTER UPDATE OF title, description ON "{source.table}" BEGIN'
+            f' UPDATE search_fts SET title = NEW.title, description = NEW.description'
+            f' WHERE rowid = {docid.format(row="NEW")};'
+            f' END',
+            f'CREATE TRIGGER IF NOT EXISTS search_{source.kind}_delete AFTER DELETE ON "{source.table}" BEGIN'
+            f' DELETE FROM search_fts WHERE rowid = {docid.format(row="OLD")};'
+            f' DELETE FROM search_doc WHERE row_id = OLD."{source.pk}";'
+            f' END',
+        ]
+    return statements
+
+
+# One trigger function for every table: its arguments say which column is the
+# key and how the WG is found, either directly or through the parent list
+POSTGRES_SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION search_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    source jsonb;
+    parent uuid;
+    wg uuid;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_doc WHERE row_id = (to_jsonb(OLD) ->> TG_ARGV[1])::uuid;
+        RETURN NULL;
+    END IF;
+    source := to_jsonb(NEW);
+    IF TG_ARGV[2] = 'wg_id' THEN
+        wg := (source ->> 'wg_id')::uuid;
+    ELSE
+        parent := (source ->> TG_ARGV[2])::uuid;
+        EXECUTE format('SELECT wg_id FROM %I WHERE %I = $1', TG_ARGV[3], TG_ARGV[4])
+            INTO wg USING parent;
+    END IF;
+    INSERT INTO search_doc (row_id, kind, parent_id, wg_id, title, description)
+    VALUES ((source ->> TG_ARGV[1])::uuid, TG_ARGV[0], parent, wg,
+            source ->> 'title', source ->> 'description')
+    ON CONFLICT (row_id) DO UPDATE
+        SET title = EXCLUDED.title, description = EXCLUDED.description;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _postgres_ddl():
+    statements = [
+        'CREATE TABLE IF NOT EXISTS search_doc ('
+        ' row_id uuid PRIMARY KEY,'
+        ' kind varchar(16) NOT NULL,'
+        ' parent_id uuid,'
+        ' wg_id uuid,'
+        ' title text,'
+        ' description text,'
+        " document tsvector GENERATED ALWAYS AS ("
+        "  setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||"
+        "  setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED)",
+        'CREATE INDEX IF NOT EXISTS ix_search_doc_document ON search_doc USING gin (document)',
+        'CREATE INDEX IF NOT EXISTS ix_search_doc_wg_id ON search_doc (wg_id)',
+        POSTGRES_SYNC_FUNCTION,
+    ]
+    for source in SOURCES:
+        args = [source.kind, source.pk, source.parent_column or 'wg_id',
+                source.parent_table or '', source.parent_pk or '']
+        statements += [
+            f'DROP TRIGGER IF EXISTS search_sync ON "{source.table}"',
+            f'CREATE TRIGGER search_sync AFTER INSERT OR UPDATE OF title, description OR DELETE'
+            f' ON "{source.table}" FOR EACH ROW EXECUTE FUNCTION search_sync('
+            + ', '.join(f"'{arg}'" for arg in args) + ')',
+        ]
+    return statements
+
+
+def install(connection):
+    """Creates the search tables and triggers; safe to run repeatedly."""
+    ddl = _postgres_ddl() if connection.dialect.name == 'postgresql' else _sqlite_ddl()
+    for statement in ddl:
+        connection.exec_driver_sql(statement)
+
+
+def uninstall(connection):
+    if connection.dialect.name == 'postgresql':
+        for source in SOURCES:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS search_sync ON "{source.table}"')
+        connection.exec_driver_sql('DROP FUNCTION IF EXISTS search_sync()')
+    else:
+        for source in SOURCES:
+            for operation in ('insert', 'update', 'delete'):
+                connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS search_{source.kind}_{operation}')
+        connection.exec_driver_sql('DROP TABLE IF EXISTS search_fts')
+    connection.exec_driver_sql('DROP TABLE IF EXISTS search_doc')
+
+
+def rebuild(connection):
+    """Re-indexes every row, e.g. after data was written with the triggers missing."""
+    postgres = connection.dialect.name == 'postgresql'
+    if not postgres:
+        connection.exec_driver_sql('DELETE FROM search_fts')
+    connection.exec_driver_sql('DELETE FROM search_doc')
+    for source in SOURCES:
+        parent = f'"{source.parent_column}"' if source.parent_column else 'NULL'
+        wg = _sqlite_wg(source, 'src').replace('src.', f'"{source.table}".')
+        if postgres:
+            connection.exec_driver_sql(
+                f'INSERT INTO search_doc (row_id, kind, parent_id, wg_id, title, description)'
+                f' SELECT "{source.pk}", \'{source.kind}\', {parent}, {wg}, title, description'
+                f' FROM "{source.table}"')
+            continue
+        connection.exec_driver_sql(
+            f'INSERT INTO search_doc (kind, row_id, parent_id, wg_id)'
+            f' SELECT \'{source.kind}\', "{source.pk}", {parent}, {wg} FROM "{source.table}"')
+        connection.exec_driver_sql(
+            f'INSERT INTO search_fts (rowid, wg, title, description)'
+            f' SELECT d.docid, hex(d.wg_id), s.title, s.description'
+            f' FROM search_doc d JOIN "{source.table}" s ON s."{source.pk}" = d.row_id'
+            f" WHERE d.kind = '{source.kind}'")
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _install_after_create(target, connection, **kw):
+    install(connection)
+
+
+def query_words(q):
+    """Splits user input into the words that are matched, dropping any syntax."""
+    return [word.lower() for word in _WORD.findall(q or '')][:MAX_WORDS]
+
+
+def _is_prefix(words, i):
+    # Only the word being typed is a prefix; one letter would match half the index
+    return i == len(words) - 1 and len(words[i]) > 1
+
+
+SQLITE_SEARCH = text("""
+    SELECT d.kind, d.row_id, d.parent_id, f.title, f.description
+    FROM search_fts f JOIN search_doc d ON d.docid = f.rowid
+    WHERE search_fts MATCH :match
+    ORDER BY f.rowid IN (SELECT rowid FROM search_fts WHERE search_fts MATCH :title_match) DESC,
+             length(f.title), f.rowid
+    LIMIT :limit OFFSET :offset
+""").columns(row_id=CompactUUID, parent_id=CompactUUID)
+
+POSTGRES_SEARCH = text("""
+    SELECT kind, row_id, parent_id, title, description
+    FROM search_doc, to_tsquery('simple', :match) query
+    WHERE wg_id = :wg_id AND document @@ query
+    ORDER BY ts_rank_cd(document, query) DESC, length(title), row_id
+    LIMIT :limit OFFSET :offset
+""").bindparams(bindparam('wg_id', type_=CompactUUID)).columns(row_id=CompactUUID, parent_id=CompactUUID)
+
+
+def search_wg(wg_id, q, page=1, per_page=20):
+    """Returns (results, has_more) for one page of ranked matches in a WG."""
+    words = query_words(q)
+    if not words:
+        return [], False
+    if db.engine.dialect.name == 'postgresql':
+        statement = POSTGRES_SEARCH
+        terms = ' & '.join(word + (':*' if _is_prefix(words, i) else '') for i, word in enumerate(words))
+        params = {'match': terms, 'wg_id': wg_id}
+    else:
+        statement = SQLITE_SEARCH
+        terms = ' AND '.join(f'"{word}"' + ('*' if _is_prefix(words, i) else '')
+                             for i, word in enumerate(words))
+        # The WG is a token of its own column; the words only match the text columns
+        wg = f'wg : "{uuid.UUID(wg_id).hex}"'
+        params = {'match': f'{wg} AND {{title description}} : ({terms})',
+                  'title_match': f'{wg} AND title : ({terms})'}
+    # One row more than the page tells whether there is a next page without a COUNT
+    params.update(limit=per_page + 1, offset=(page - 1) * per_page)
+    rows = db.session.execute(statement, params).all()
+    results = [{
+        'kind': row.kind,
+        'id': row.row_id,
+        'parent_id': row.parent_id,
+        'title': row.title,
+        'description': row.description,
+    } for row in rows[:per_page]]
+    return results, len(rows) > per_page
@@ -0,0 +1,438 @@
+"""Places the subtrees of WGs in several databases.
+
+SHARD_DATABASE_URLS names further databases, the shards, next to the main
+one. Users, WGs, memberships and the other tables of GLOBAL_TABLES stay in the
+main database. The lists, tasks, items and costs of a WG, its subtree, live in
+the shard the WGSHARD directory names for it; WGs without an entry live in the
+main database, which is the shard called ``main``.
+
+A request about one WG runs on that WG's shard. Once token_required has
+authenticated it (and validate_json checked its body), the WG is found through
+the WG, list, task, item or cost id in its URL or, for the endpoints that create
+lists and items, in its JSON body. db.session (extensions.RoutingSession)
+then sends every statement touching a subtree table there and the others to
+the main database. Each shard keeps copies of the rows of WG, user_wg,
+admin_wg and USERS that its subtrees reference, so the joins of those
+statements work. The copies are refreshed after every commit that changed the
+originals through the ORM. The few reads across WGs (/wg/my, /tasks/undone/me,
+calendar feeds, recurring tasks) run once per shard.
+
+``flask shards move`` moves a WG to another shard while the app keeps serving
+it. Writes to the WG are refused with 503 while it is copied. Reads continue
+from the old shard until the directory points at the new one.
+
+A commit spanning the main database and a shard is not atomic across the two,
+as neither database takes part in the other's transaction.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, jsonify, request
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import LRUCache
+from database.streaming import iter_rows, wg_scope
+from database.wg_transfer import EXPORT_TABLES, scoped_select
+from extensions import GLOBAL_TABLES, SHARD_PREFIX, RoutingSession, db
+from models import WG, BudgetPlanning, Cost, Item, ShoppingList, Task, TaskList, User, WGShard
+
+MAIN = 'main'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# The tables of a WG's subtree, parents first
+SUBTREE_TABLES = [name for name in EXPORT_TABLES if name not in GLOBAL_TABLES]
+# WG columns the feed triggers keep current in the copy on the WG's shard
+SHARD_OWNED_COLUMNS = ('tasks_version', 'tasks_changed_at')
+COPY_BATCH_SIZE = 1000
+# Subtree models whose users are assigned through an association table
+ASSIGNABLE = (TaskList, Task, ShoppingList, Item, BudgetPlanning, Cost)
+
+
+# Request arguments that name something of a WG -> the statement finding the WG
+WG_OF = {
+    'tasklist_id': lambda value: db.select(TaskList.wg_id).where(TaskList.idTaskList == value),
+    'shoppinglist_id': lambda value: db.select(ShoppingList.wg_id).where(ShoppingList.idShoppingList == value),
+    'budgetplanning_id': lambda value: db.select(BudgetPlanning.wg_id)
+    .where(BudgetPlanning.idBudgetPlanning == value),
+    'task_id': lambda value: db.select(TaskList.wg_id)
+    .join(Task, Task.tasklist_id == TaskList.idTaskList).where(Task.idTask == value),
+    'item_id': lambda value: db.select(ShoppingList.wg_id)
+    .join(Item, Item.shoppinglist_id == ShoppingList.idShoppingList).where(Item.idItem == value),
+    'cost_id': lambda value: db.select(BudgetPlanning.wg_id)
+    .join(Cost, Cost.budgetplanning_id == BudgetPlanning.idBudgetPlanning).where(Cost.idCost == value),
+}
+# The JSON body keys of the endpoints creating lists, items and costs
+BODY_KEYS = ('wg_id', 'tasklist_id', 'shoppinglist_id', 'budgetplanning_id')
+
+
+def enabled(app=None):
+    return bool((app or current_app).config['SHARD_DATABASE_URLS'])
+
+
+def shard_names():
+    return [MAIN, *current_app.config['SHARD_DATABASE_URLS']]
+
+
+def shard_engine(name=None):
+    """The engine of a shard, by default of the one the current request runs on."""
+    name = name or g.get('shard') or MAIN
+    return db.engine if name == MAIN else db.engines[SHARD_PREFIX + name]
+
+
+@contextmanager
+def on_shard(name):
+    """Runs the subtree statements of db.session in the block on a shard."""
+    previous = g.get('shard')
+    g.shard = None if name == MAIN else name
+    try:
+        yield
+    finally:
+        g.shard = previous
+
+
+def placement(wg_id):
+    """(shard, moving) of a WG, cached for SHARD_CACHE_SECONDS."""
+    if not enabled():
+        return MAIN, False
+
+    def lookup():
+        # From the main database itself, never the replica, which may lag
+        # behind a move
+        with db.engine.connect() as conn:
+            row = conn.execute(db.select(WGShard.shard, WGShard.moving).where(WGShard.wg_id == wg_id)).first()
+        return tuple(row) if row else (MAIN, False)
+    return current_app.extensions['shard_directory'].get_or_set(wg_id, lookup)
+
+
+def shard_of(wg_id):
+    return placement(wg_id)[0]
+
+
+def group_by_shard(wg_ids):
+    """{shard: [wg_id, ...]} of some WGs, in the order of their first WG."""
+    groups = {}
+    for wg_id in wg_ids:
+        groups.setdefault(shard_of(wg_id), []).append(wg_id)
+    return groups
+
+
+def each_shard(wg_ids):
+    """Yields the ids of some WGs per shard, each group while db.session runs on its shard."""
+    for name, ids in group_by_shard(wg_ids).items():
+        with on_shard(name):
+            yield ids
+
+
+def wg_of(key, value):
+    """The WG of the list, task, item or cost ``key`` names, looked up in every shard."""
+    cache = current_app.extensions['shard_wg_of']
+    wg_id = cache.get((key, value))
+    if wg_id is None:
+        statement = WG_OF[key](value)
+        for name in shard_names():
+            with shard_engine(name).connect() as conn:
+                wg_id = conn.scalar(statement)
+            if wg_id is not None:
+                # Nothing ever moves to another WG, so this never goes stale
+                cache.set((key, value), wg_id)
+                break
+    return wg_id
+
+
+def wg_counts():
+    """{shard: number of WGs} of the shards holding any."""
+    counts = dict(db.session.execute(
+        db.select(WGShard.shard, db.func.count()).where(WGShard.shard != MAIN).group_by(WGShard.shard)).all())
+    counts[MAIN] = db.session.scalar(db.select(db.func.count()).select_from(WG)) - sum(counts.values())
+    return counts
+
+
+def place_wg(wg_id):
+    """Picks the shard of a new WG and adds it to the directory; returns the shard."""
+    if not enabled():
+        return MAIN
+    name = current_app.config['NEW_WG_SHARD']
+    if name == 'auto':
+        counts = wg_counts()
+        name = min(shard_names(), key=lambda shard: counts.get(shard, 0))
+    if name != MAIN:
+        db.session.add(WGShard(wg_id=wg_id, shard=name))
+    return name
+
+
+def _upsert(conn, table, rows, keep=()):
+    """Updates the rows of ``table`` by primary key, inserting the missing ones.
+
+    Unlike a delete and insert this does not cascade to the rows referencing them.
+    """
+    key = table.primary_key.columns[0]
+    for row in rows:
+        values = {name: value for name, value in row.items() if name not in keep}
+        if not conn.execute(table.update().where(key == row[key.name]).values(values)).rowcount:
+            conn.execute(table.insert().values(dict(row)))
+
+
+def copy_users(conn, user_ids):
+    """Copies users from the main database to the shard of ``conn``."""
+    users = User.__table__
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    with db.engine.connect() as main:
+        rows = [row._mapping for start in range(0, len(user_ids), 500)
+                for row in main.execute(db.select(users).where(users.c.idUser.in_(user_ids[start:start + 500])))]
+    _upsert(conn, users, rows)
+
+
+def sync_wg(wg_id, name):
+    """Refreshes the copies of a WG, its memberships and members on a shard."""
+    tables = db.metadata.tables
+    wg, memberships = tables['WG'], [tables['user_wg'], tables['admin_wg']]
+    with db.engine.connect() as main:
+        row = main.execute(db.select(wg).where(wg.c.idWG == wg_id)).first()
+        members = {table.name: [dict(r._mapping) for r in main.execute(
+            db.select(table).where(table.c.wg_id == wg_id))] for table in memberships}
+    with shard_engine(name).begin() as conn:
+        if row is None:
+            # Deleted; the foreign keys take its subtree along
+            conn.execute(wg.delete().where(wg.c.idWG == wg_id))
+            return
+        copy_users(conn, {row.creator_id, *(m['user_id'] for rows in members.values() for m in rows)})
+        _upsert(conn, wg, [row._mapping], keep=SHARD_OWNED_COLUMNS)
+        for table in memberships:
+            conn.execute(table.delete().where(table.c.wg_id == wg_id))
+            if members[table.name]:
+                conn.execute(table.insert(), members[table.name])
+
+
+def sync_users(user_ids):
+    """Refreshes the copies of some users on every shard that has one."""
+    users = User.__table__
+    with db.engine.connect() as main:
+        rows = [row._mapping for row in main.execute(db.select(users).where(users.c.idUser.in_(list(user_ids))))]
+    for name in shard_names()[1:]:
+        with shard_engine(name).begin() as conn:
+            for row in rows:
+                conn.execute(users.update().where(users.c.idUser == row['idUser']).values(dict(row)))
+
+
+def forget_wg(wg_id):
+    """Deletes a WG's subtree from its shard; the main database's foreign keys handle the rest."""
+    name = shard_of(wg_id) if enabled() else MAIN
+    if name != MAIN:
+        with shard_engine(name).begin() as conn:
+            conn.execute(WG.__table__.delete().where(WG.__table__.c.idWG == wg_id))
+
+
+def forget_user(user_id):
+    """Deletes a user's copies and the subtrees of the WGs they created from the shards."""
+    if not enabled():
+        return
+    created = db.session.execute(db.select(WG.idWG).where(WG.creator_id == user_id)).scalars().all()
+    for wg_id in created:
+        forget_wg(wg_id)
+    users = User.__table__
+    for name in shard_names()[1:]:
+        with shard_engine(name).begin() as conn:
+            conn.execute(users.delete().where(users.c.idUser == user_id))
+
+
+def _set_directory(wg_id, name, moving):
+    table = WGShard.__table__
+    with db.engine.begin() as conn:
+        _upsert(conn, table, [{'wg_id': wg_id, 'shard': name, 'moving': moving}])
+    current_app.extensions['shard_directory'].set(wg_id, (name, moving))
+
+
+def _subtree_counts(conn, wg_id):
+    return {name: conn.scalar(db.select(db.func.count()).select_from(db.metadata.tables[name])
+                              .where(wg_scope(db.metadata.tables[name], wg_id)))
+            for name in SUBTREE_TABLES}
+
+
+def _drop_subtree(wg_id, name):
+    with shard_engine(name).begin() as conn:
+        if name == MAIN:
+            # The WG and its memberships stay; the lists take everything else along
+            for model in (TaskList, ShoppingList, BudgetPlanning):
+                conn.execute(model.__table__.delete().where(model.__table__.c.wg_id == wg_id))
+        else:
+            conn.execute(WG.__table__.delete().where(WG.__table__.c.idWG == wg_id))
+
+
+def _copy_subtree(wg_id, source, target):
+    tables = db.metadata.tables
+    with shard_engine(source).connect() as src, shard_engine(target).begin() as dst:
+        user_ids = set()
+        for name in SUBTREE_TABLES:
+            for fk in tables[name].foreign_keys:
+                if fk.column.table.name == 'USERS':
+                    user_ids.update(src.scalars(db.select(fk.parent).distinct().where(wg_scope(tables[name], wg_id))))
+        if target != MAIN:
+            # Creators of lists and assignees who have left the WG since
+            copy_users(dst, user_ids)
+        for name in SUBTREE_TABLES:
+            batch = []
+            for row in iter_rows(src, scoped_select(tables[name], wg_id), COPY_BATCH_SIZE):
+                batch.append(dict(row._mapping))
+                if len(batch) >= COPY_BATCH_SIZE:
+                    dst.execute(tables[name].insert(), batch)
+                    batch = []
+            if batch:
+                dst.execute(tables[name].insert(), batch)
+        # The copy has bumped the feed version on the target; it must also be
+        # past the version clients saw from the source
+        wg = tables['WG']
+        versions = [conn.scalar(db.select(wg.c.tasks_version).where(wg.c.idWG == wg_id)) or 0 for conn in (src, dst)]
+        dst.execute(wg.update().where(wg.c.idWG == wg_id).values(tasks_version=max(versions) + 1))
+        return _subtree_counts(dst, wg_id)
+
+
+def move_wg(wg_id, target, log=None):
+    """Moves the subtree of a WG to another shard while the app keeps serving it.
+
+    Writes to the WG are refused from the moment every process has seen the
+    directory entry marked as moving until every process reads from the
+    target; reads carry on throughout. Returns the rows moved per table.
+    """
+    log = log or (lambda message: None)
+    if target not in shard_names():
+        raise ValueError(f'Unknown shard: {target}')
+    if db.session.get(WG, wg_id) is None:
+        raise ValueError(f'WG {wg_id} not found')
+    current_app.extensions['shard_directory'].clear()
+    source, moving = placement(wg_id)
+    if moving:
+        raise ValueError(f'WG {wg_id} is already being moved')
+    if source == target:
+        raise ValueError(f'WG {wg_id} is already in {target}')
+    # Processes cache the directory this long, and a little more for requests in flight
+    settle = current_app.config['SHARD_CACHE_SECONDS'] + (1 if current_app.config['SHARD_CACHE_SECONDS'] else 0)
+
+    _set_directory(wg_id, source, True)
+    log(f'Writes to WG {wg_id} are paused, waiting {settle:g}s for every process to notice')
+    time.sleep(settle)
+    try:
+        _drop_subtree(wg_id, target)
+        if target != MAIN:
+            sync_wg(wg_id, target)
+        log(f'Copying from {source} to {target}')
+        copied = _copy_subtree(wg_id, source, target)
+        with shard_engine(source).connect() as conn:
+            expected = _subtree_counts(conn, wg_id)
+        if copied != expected:
+            raise RuntimeError(f'Copy of WG {wg_id} is incomplete: {copied} rows instead of {expected}')
+        _set_directory(wg_id, target, True)
+        time.sleep(settle)
+    except BaseException:
+        _drop_subtree(wg_id, target)
+        _set_directory(wg_id, source, False)
+        raise
+    _set_directory(wg_id, target, False)
+    log(f'WG {wg_id} is served from {target}; deleting it from {source}')
+    _drop_subtree(wg_id, source)
+    return copied
+
+
+def _before_flush(session, flush_context, instances):
+    if not (has_app_context() and g.get('shard')):
+        session.info['shard_assignments'] = False
+        return
+    changed = [obj for obj in (*session.new, *session.dirty)
+               if isinstance(obj, ASSIGNABLE) and inspect(obj).attrs.users.history.has_changes()]
+    if changed and any(isinstance(obj, User) and session.is_modified(obj, include_collections=False)
+                       for obj in session.dirty):
+        # Both would be written through the connection of the User mapper
+        raise RuntimeError('Assignments and changes to users cannot be flushed together on a shard')
+    session.info['shard_assignments'] = bool(changed)
+
+
+def _after_flush(session, flush_context):
+    if not (has_app_context() and enabled()):
+        return
+    pending = session.info.setdefault('shard_sync', {'wgs': set(), 'users': set()})
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, WG):
+            pending['wgs'].add(obj.idWG)
+        elif isinstance(obj, User):
+            state = inspect(obj)
+            for name in ('wgs', 'admin_wgs'):
+                history = state.attrs[name].history
+                pending['wgs'].update(wg.idWG for wg in (*history.added, *history.deleted))
+            if obj in session.dirty and session.is_modified(obj, include_collections=False):
+                pending['users'].add(obj.idUser)
+
+
+def _after_commit(session):
+    pending = session.info.pop('shard_sync', None)
+    if not pending:
+        return
+    try:
+        for wg_id in pending['wgs']:
+            name = shard_of(wg_id)
+            if name != MAIN:
+                sync_wg(wg_id, name)
+        if pending['users']:
+            sync_users(pending['users'])
+    except SQLAlchemyError:
+        # The copies catch up with the next change, or with 'flask shards sync'
+        current_app.logger.exception('Refreshing the shard copies failed')
+
+
+def _after_rollback(session):
+    session.info.pop('shard_sync', None)
+
+
+def _request_scope():
+    """(key, value) of the WG or WG child the request is about, if any."""
+    args = request.view_args or {}
+    for key in ('wg_id', *WG_OF):
+        if isinstance(args.get(key), str):
+            return key, args[key]
+    if request.method not in SAFE_METHODS and request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            for key in BODY_KEYS:
+                if isinstance(body.get(key), str):
+                    return key, body[key]
+    return None
+
+
+def route_request():
+    """Runs the rest of the request on the shard of its WG, or returns a 503 while the WG moves.
+
+    Called by token_required for authenticated requests only, so anonymous and
+    malformed ones cause no lookups.
+    """
+    if not enabled():
+        return None
+    scope = _request_scope()
+    if scope is None:
+        return None
+    key, value = scope
+    wg_id = value if key == 'wg_id' else wg_of(key, value)
+    if wg_id is None:
+        return None
+    name, moving = placement(wg_id)
+    if moving and request.method not in SAFE_METHODS:
+        response = jsonify({'message': 'This WG is being moved to another database, try again shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(current_app.config['SHARD_CACHE_SECONDS']) + 1)
+        return response
+    if name != MAIN:
+        g.shard = name
+    return None
+
+
+def init_shards(app):
+    """Creates the caches of the shard directory, if there are shards."""
+    if not enabled(app):
+        return
+    ttl = app.config['SHARD_CACHE_SECONDS']
+    app.extensions['shard_directory'] = LRUCache('shard_directory', maxsize=65536, ttl=ttl)
+    app.extensions['shard_wg_of'] = LRUCache('shard_wg_of', maxsize=65536)
+
+
+# Session events fire for every app; the listeners skip sessions of apps without shards
+event.listen(RoutingSession, 'before_flush', _before_flush)
+event.listen(RoutingSession, 'after_flush', _after_flush)
+event.listen(RoutingSession, 'after_commit', _after_commit)
+event.listen(RoutingSession, 'after_rollback', _after_rollback)
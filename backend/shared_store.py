@@ -0,0 +1,67 @@
+"""A SQLite file through which the worker processes of a host share small state.
+
+gunicorn.conf.py points SHARED_STORE at a file in the temp directory; the rate
+limit buckets, the recent writers of the read replica routing and cached
+responses live there.
+Its contents are worth nothing after a crash, so nothing is synced to disk.
+Without SHARED_STORE (``flask run``, tests) every process keeps them itself.
+"""
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Expired rows of a table are deleted every this many writes of a process
+PRUNE_EVERY = 1000
+
+
+class SharedStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = Counter()
+
+    def connect(self):
+        """This thread's connection, in autocommit mode."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def now():
+        """Wall clock time, as monotonic clocks are not comparable across processes."""
+        return time.time()
+
+    def maybe_prune(self, table, column, now):
+        """Counts a write to ``table``; every PRUNE_EVERY of them deletes the
+        rows whose ``column`` (a time from now()) is not after ``now``."""
+        self._writes[table] += 1
+        if self._writes[table] % PRUNE_EVERY == 0:
+            self.connect().execute(f'DELETE FROM {table} WHERE {column} <= ?', (now,))
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction, which other processes wait for up to a second."""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+def shared_store(app):
+    """The app's shared store, or None when every process keeps its own state."""
+    return app.extensions.get('shared_store')
+
+
+def init_shared_store(app):
+    path = app.config['SHARED_STORE']
+    app.extensions['shared_store'] = SharedStore(path) if path else None
@@ -0,0 +1,216 @@
+import os
+import time
+from collections import defaultdict
+
+import jwt
+import pytest
+from sqlalchemy import event
+
+# Config reads the environment when it is imported, so this has to come first.
+# Never run the suite against the development or production database.
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+os.environ['DB_STARTUP_MODE'] = 'create_all'
+# Recurring tasks are materialized explicitly, never as a side effect of a request
+os.environ['RECURRENCE_CHECK_SECONDS'] = '0'
+# Jobs are run by the tests themselves, not by background threads
+os.environ['JOB_WORKER_THREADS'] = '0'
+# Expired idempotency keys are purged by the tests that need it
+os.environ['IDEMPOTENCY_PURGE_SECONDS'] = '0'
+# The route class limits are switched on by the tests of them
+os.environ['RATE_LIMITS'] = '0'
+# So are cached responses, which would hide the statements of the hot path
+os.environ['RESPONSE_CACHE_SIZE'] = '0'
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models.types import new_id  # noqa: E402
+
+# Timings collected by the tests, printed at the end of the run
+TIMINGS = defaultdict(dict)
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class StatementCounter:
+    """Counts the SQL statements executed on the app's engine inside a ``with`` block."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_statements(app):
+    def factory():
+        with app.app_context():
+            return StatementCounter(db.engine)
+    return factory
+
+
+def make_file_app(path, **config):
+    """An app on the SQLite database file ``path``, which a second engine can open too.
+
+    ``config`` overrides settings that are read when the app is created.
+    """
+    from config import Config
+
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', **config}
+    saved = {key: getattr(Config, key) for key in config}
+    for key, value in config.items():
+        setattr(Config, key, value)
+    try:
+        return create_app()
+    finally:
+        for key, value in saved.items():
+            setattr(Config, key, value)
+
+
+def make_token(app, user):
+    return jwt.encode({
+        'user_id': user['idUser'],
+        'username': user['strUser'],
+        'email': user['strEmail'],
+        'exp': int(time.time()) + 3600,
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+
+
+def token_for(app, user):
+    """A token of ``user``, a User or a user dict of seed_size."""
+    if not isinstance(user, dict):
+        user = {'idUser': user.idUser, 'strUser': user.strUser, 'strEmail': user.strEmail}
+    return make_token(app, user)
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture(scope='session')
+def file_app(tmp_path_factory):
+    """Builds an app on a new database file, seeded with seed_size(n); returns (app, data).
+
+    The file is ``wg_app.db`` in ``directory`` (a new one if not given), where
+    ``config`` may put other files such as the shared store. ``data`` has the
+    tokens of the member and of their housemate.
+    """
+    def build(directory=None, n=3, **config):
+        directory = directory or tmp_path_factory.mktemp('file_app')
+        app = make_file_app(directory / 'wg_app.db', **config)
+        with app.app_context():
+            data = seed_size(n)
+        data['token'] = token_for(app, data['user'])
+        data['housemate_token'] = token_for(app, data['housemate'])
+        return app, data
+    return build
+
+
+def seed_size(n):
+    """Inserts a WG whose collections each hold ``n`` children.
+
+    The member has ``n`` WGs, the main WG has ``n`` task lists, shopping lists
+    and budget plans, and the first of each holds ``n`` tasks, items or costs.
+    """
+    tables = db.metadata.tables
+    rows = defaultdict(list)
+    user = {'idUser': new_id(), 'strUser': f'member_{n}', 'strEmail': f'member_{n}@example.com',
+            'strPassword': 'x', 'strHomePage': '/'}
+    other = {'idUser': new_id(), 'strUser': f'other_{n}', 'strEmail': f'other_{n}@example.com',
+             'strPassword': 'x', 'strHomePage': '/'}
+    rows['USERS'] += [user, other]
+
+    wg_ids = [new_id() for _ in range(n)]
+    for i, wg_id in enumerate(wg_ids):
+        rows['WG'].append({'idWG': wg_id, 'title': f'WG {n}-{i}', 'address': f'Street {n}-{i}',
+                           'etage': '0', 'creator_id': user['idUser'], 'is_public': True})
+        rows['user_wg'].append({'user_id': user['idUser'], 'wg_id': wg_id})
+        rows['admin_wg'].append({'user_id': user['idUser'], 'wg_id': wg_id})
+    wg_id = wg_ids[0]
+    rows['user_wg'].append({'user_id': other['idUser'], 'wg_id': wg_id})
+
+    tasklist_ids = [new_id() for _ in range(n)]
+    shoppinglist_ids = [new_id() for _ in range(n)]
+    budget_ids = [new_id() for _ in range(n)]
+    for i in range(n):
+        rows['TASKLIST'].append({'idTaskList': tasklist_ids[i], 'title': f'List {i}', 'wg_id': wg_id})
+        rows['user_tasklist'].append({'user_id': user['idUser'], 'tasklist_id': tasklist_ids[i]})
+        rows['SHOPPINGLIST'].append({'idShoppingList': shoppinglist_ids[i], 'title': f'List {i}',
+                                     'wg_id': wg_id, 'creator_id': user['idUser']})
+        rows['BUDGETPLANNING'].append({'idBudgetPlanning': budget_ids[i], 'title': f'Budget {i}',
+                                       'wg_id': wg_id, 'creator_id': user['idUser'], 'goal': 0.0})
+
+    task_ids = [new_id() for _ in range(n)]
+    for i, task_id in enumerate(task_ids):
+        rows['TASK'].append({'idTask': task_id, 'title': f'Task {i}', 'is_done': False,
+                             'is_template': False, 'tasklist_id': tasklist_ids[0]})
+        rows['user_task'].append({'user_id': user['idUser'], 'task_id': task_id})
+        rows['ITEM'].append({'idItem': new_id(), 'title': f'Item {i}', 'is_checked': False,
+                             'shoppinglist_id': shoppinglist_ids[0]})
+        cost_id = new_id()
+        rows['COST'].append({'idCost': cost_id, 'title': f'Cost {i}', 'goal': 1.0, 'paid': 0.0,
+                             'budgetplanning_id': budget_ids[0]})
+        rows['user_cost'].append({'user_id': user['idUser'], 'cost_id': cost_id})
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if rows.get(table.name):
+                conn.execute(tables[table.name].insert(), rows[table.name])
+
+    return {
+        'user': user,
+        'housemate': other,
+        'wg_id': wg_id,
+        'tasklist_id': tasklist_ids[0],
+        'shoppinglist_id': shoppinglist_ids[0],
+        'budgetplanning_id': budget_ids[0],
+        'task_id': task_ids[0],
+    }
+
+
+@pytest.fixture(scope='session')
+def seeded(app):
+    """Returns the ids of the data set for a size, seeding it on first use."""
+    cache = {}
+
+    def get(n):
+        if n not in cache:
+            with app.app_context():
+                data = seed_size(n)
+            data['token'] = make_token(app, data['user'])
+            cache[n] = data
+        return cache[n]
+    return get
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not TIMINGS:
+        return
+    sizes = sorted({n for values in TIMINGS.values() for n in values})
+    terminalreporter.section('hot path timings (ms)')
+    terminalreporter.write_line(f"{'':<30}" + ''.join(f'{n:>12}' for n in sizes))
+    for name, values in sorted(TIMINGS.items()):
+        cells = ''.join(f'{values[n]:>12.3f}' if n in values else f"{'':>12}" for n in sizes)
+        terminalreporter.write_line(f'{name:<30}{cells}')
@@ -0,0 +1,134 @@
+"""The async read path of the ASGI app, against the sync views it replaces."""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from conftest import bearer, seed_size, token_for  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def seeded_app(file_app):
+    """The app and data of the member, and a WG they are not in."""
+    app, data = file_app()
+    with app.app_context():
+        other = seed_size(1)
+    return app, data, other
+
+
+@pytest.fixture(scope='module')
+def asgi_app(seeded_app):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from asgi import AsyncReadApp, async_database_url
+
+    app = seeded_app[0]
+    # Every test runs its own event loop, which pooled connections would outlive
+    engine = create_async_engine(async_database_url(app.config['SQLALCHEMY_DATABASE_URI']), poolclass=NullPool)
+    return AsyncReadApp(app, engine)
+
+
+def asgi_get(asgi_app, path, headers):
+    async def run():
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                 'query_string': b'', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+                 'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi_app(scope, receive, send)
+        return messages
+
+    start, *bodies = asyncio.run(run())
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in bodies)
+
+
+def test_async_views_answer_like_the_sync_ones(seeded_app, asgi_app):
+    app, data, other = seeded_app
+    headers = {**bearer(data['token']), 'Origin': 'http://localhost:3000'}
+    wg_id = data['wg_id']
+    paths = ['/wg/my', f'/wg/{wg_id}', f'/wg/{wg_id}/tasklists', f'/wg/{wg_id}/shoppinglists',
+             f'/wg/{wg_id}/budgetplanning', '/tasks/undone/me', f"/wg/{other['wg_id']}",
+             f"/wg/{other['wg_id']}/tasklists", '/wg/not-a-wg']
+    client = app.test_client()
+    for path in paths:
+        expected = client.get(path, headers=headers)
+        status, response_headers, body = asgi_get(asgi_app, path, headers)
+        assert (status, body) == (expected.status_code, expected.data), path
+        assert response_headers[b'access-control-allow-origin'] == b'http://localhost:3000'
+
+    status, _, body = asgi_get(asgi_app, '/wg/my', {})
+    assert status == 403 and json.loads(body) == {'message': 'Token is missing!'}
+
+
+def test_other_requests_go_to_flask(seeded_app, asgi_app):
+    app, data, _ = seeded_app
+    status, _, body = asgi_get(asgi_app, '/user', bearer(data['token']))
+    assert status == 200 and json.loads(body) == app.test_client().get(
+        '/user', headers=bearer(data['token'])).get_json()
+
+
+def test_new_users_are_found_on_the_primary(tmp_path, file_app):
+    import shutil
+
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from asgi import AsyncReadApp, async_database_url
+    from extensions import db
+    from models import User
+
+    path, replica = tmp_path / 'wg_app.db', tmp_path / 'replica.db'
+    app, _ = file_app(tmp_path, n=1, SQLALCHEMY_BINDS={'replica': f'sqlite:///{replica}'})
+    with app.app_context():
+        db.engine.dispose()
+        # A replica that has not seen the user registered next
+        shutil.copy(path, replica)
+        user = User(strUser='newcomer', strEmail='newcomer@example.com', strPassword='x')
+        db.session.add(user)
+        db.session.commit()
+        token = token_for(app, user)
+
+    engines = [create_async_engine(async_database_url(f'sqlite:///{file}'), poolclass=NullPool)
+               for file in (path, replica)]
+    status, _, body = asgi_get(AsyncReadApp(app, *engines), '/wg/my', bearer(token))
+    assert status == 200 and json.loads(body) == []
+
+
+def test_shared_store_is_read_off_the_event_loop(tmp_path, file_app, monkeypatch):
+    import threading
+
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from asgi import AsyncReadApp, async_database_url
+    from replica import RecentWriters
+
+    path = tmp_path / 'wg_app.db'
+    app, data = file_app(tmp_path, n=1, RATE_LIMITS=True, SHARED_STORE=str(tmp_path / 'shared.db'),
+                         SQLALCHEMY_BINDS={'replica': f'sqlite:///{path}'})
+    threads = []
+
+    def recorded(f):
+        def call(*args):
+            threads.append(threading.current_thread())
+            return f(*args)
+        return call
+
+    limiter = app.extensions['rate_limiter']
+    monkeypatch.setattr(limiter, 'hit', recorded(limiter.hit))
+    monkeypatch.setattr(RecentWriters, '__contains__', recorded(RecentWriters.__contains__))
+    engine = create_async_engine(async_database_url(f'sqlite:///{path}'), poolclass=NullPool)
+    status, _, _ = asgi_get(AsyncReadApp(app, engine, engine), '/wg/my', bearer(data['token']))
+    assert status == 200
+    assert len(threads) == 2 and threading.main_thread() not in threads
@@ -0,0 +1,95 @@
+"""The calendar window over a WG's tasks."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models.types import new_id
+
+DAY = datetime(2031, 3, 10, 12)
+
+
+@pytest.fixture(scope='module')
+def calendar(app, seeded):
+    """A list in the seeded(1) WG with tasks around DAY, some of them open-ended."""
+    from models import TaskList, Task, user_task
+
+    data = seeded(1)
+    tasklist_id = new_id()
+    tasks = {
+        'before': (DAY - timedelta(days=3), DAY - timedelta(days=2)),
+        'overlaps start': (DAY - timedelta(days=1), DAY + timedelta(hours=1)),
+        'inside': (DAY + timedelta(days=1), DAY + timedelta(days=1, hours=2)),
+        'spans window': (DAY - timedelta(days=30), DAY + timedelta(days=30)),
+        'no end': (DAY + timedelta(days=2), None),
+        'no start': (None, DAY + timedelta(days=3)),
+        'no start, after': (None, DAY + timedelta(days=10)),
+        'no end, before': (DAY - timedelta(days=1), None),
+        'after': (DAY + timedelta(days=7), DAY + timedelta(days=8)),
+        'undated': (None, None),
+    }
+    rows = [{'idTask': new_id(), 'title': title, 'start_date': start, 'end_date': end,
+             'is_done': title == 'inside', 'is_template': False, 'tasklist_id': tasklist_id}
+            for title, (start, end) in tasks.items()]
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(TaskList.__table__.insert(), [{'idTaskList': tasklist_id, 'title': 'Calendar',
+                                                        'wg_id': data['wg_id']}])
+            conn.execute(Task.__table__.insert(), rows)
+            conn.execute(user_task.insert(), [{'user_id': data['user']['idUser'], 'task_id': rows[2]['idTask']}])
+    yield
+    with app.app_context():
+        db.session.execute(db.delete(TaskList).where(TaskList.idTaskList == tasklist_id))
+        db.session.commit()
+
+
+def _get(client, seeded, **params):
+    data = seeded(1)
+    return client.get(f"/wg/{data['wg_id']}/tasks", headers={'Authorization': f"Bearer {data['token']}"},
+                      query_string=params)
+
+
+def _titles(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [task['title'] for task in response.get_json()['tasks']]
+
+
+def test_tasks_overlapping_the_window(client, seeded, calendar):
+    window = {'from': DAY.isoformat(), 'to': (DAY + timedelta(days=7)).isoformat()}
+    assert _titles(_get(client, seeded, **window)) == [
+        'spans window', 'overlaps start', 'inside', 'no end', 'no start']
+    assert _titles(_get(client, seeded, done='true', **window)) == ['inside']
+    assert _titles(_get(client, seeded, assignee='me', **window)) == ['inside']
+    task = _get(client, seeded, assignee='me', **window).get_json()['tasks'][0]
+    assert task['users'] == [seeded(1)['user']['idUser']]
+
+
+def test_invalid_windows(client, seeded, calendar):
+    assert _get(client, seeded, **{'from': DAY.isoformat()}).status_code == 400
+    assert _get(client, seeded, **{'from': 'monday', 'to': DAY.isoformat()}).status_code == 400
+    assert _get(client, seeded, **{'from': DAY.isoformat(), 'to': DAY.isoformat()}).status_code == 400
+    too_long = {'from': DAY.isoformat(), 'to': (DAY + timedelta(days=101)).isoformat()}
+    assert _get(client, seeded, **too_long).status_code == 400
+
+
+def test_month_view_is_an_index_range_per_list(app, client, seeded, calendar):
+    from sqlalchemy import event
+
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'coalesce' in statement:
+            executed.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            _get(client, seeded, **{'from': DAY.isoformat(), 'to': (DAY + timedelta(days=31)).isoformat()})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        statement, parameters = executed[0]
+        with db.engine.connect() as conn:
+            plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    task_steps = [step for step in plan if ' TASK ' in f' {step} ']
+    assert task_steps and all('ix_task_tasklist_end_start (tasklist_id=? AND end_date' in step
+                              for step in task_steps), plan
@@ -0,0 +1,100 @@
+"""iCalendar feeds: tokens, rendering and conditional GET."""
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import pytest
+
+from calendar_feed import escape, fold
+from extensions import db
+from models.types import new_id
+
+
+@pytest.fixture(scope='module')
+def feed_tasks(app, seeded):
+    """Dated tasks in the seeded(3) WG; only the first is assigned to its member."""
+    from models import Task, user_task
+
+    data = seeded(3)
+    soon = datetime.utcnow().replace(microsecond=0) + timedelta(days=1)
+    rows = [{'idTask': new_id(), 'title': title, 'description': description, 'start_date': start,
+             'end_date': end, 'is_done': False, 'is_template': False, 'tasklist_id': data['tasklist_id']}
+            for title, description, start, end in [
+                ('Clean the kitchen', 'Sink, stove; floor', soon, soon + timedelta(hours=2)),
+                ('Take out the bins', None, soon + timedelta(days=1), None),
+                ('Last year', None, soon - timedelta(days=400), soon - timedelta(days=399)),
+            ]]
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(Task.__table__.insert(), rows)
+            conn.execute(user_task.insert(), [{'user_id': data['user']['idUser'], 'task_id': rows[0]['idTask']}])
+    return rows
+
+
+def _create_feed(client, data, **body):
+    response = client.post('/calendar/feeds', json=body,
+                           headers={'Authorization': f"Bearer {data['token']}"})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()['feed']['id'], urlsplit(response.get_json()['url']).path
+
+
+def test_wg_feed_is_answered_from_the_version(app, client, seeded, feed_tasks, count_statements):
+    data = seeded(3)
+    _, path = _create_feed(client, data, wg_id=data['wg_id'])
+
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/calendar'
+    body = response.get_data(as_text=True)
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert 'X-WR-CALNAME:WG 3-0\r\n' in body
+    assert f"UID:{feed_tasks[0]['idTask']}@wg-app\r\n" in body
+    assert 'DESCRIPTION:Sink\\, stove\\; floor\r\n' in body
+    assert 'SUMMARY:Take out the bins' in body and 'Last year' not in body
+    etag, _ = response.get_etag()
+    assert not response.get_etag()[1]
+
+    counter = count_statements()
+    assert client.get(path, headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    assert client.get(path, headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+    assert not [s for s in counter.statements if 'TASK' in s]
+
+    # Any change to the WG's tasks, even one made in SQL, changes the ETag
+    from models import Task
+    with app.app_context():
+        db.session.execute(db.update(Task).where(Task.idTask == feed_tasks[1]['idTask']).values(is_done=True))
+        db.session.commit()
+    response = client.get(path, headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert 'SUMMARY:✓ Take out the bins' in response.get_data(as_text=True)
+    assert response.get_etag()[0] != etag
+
+
+def test_user_feed_holds_the_users_tasks(client, seeded, feed_tasks):
+    _, path = _create_feed(client, seeded(3))
+
+    body = client.get(path).get_data(as_text=True)
+    assert 'SUMMARY:Clean the kitchen' in body and 'CATEGORIES:WG 3-0' in body
+    assert 'Take out the bins' not in body
+
+
+def test_feed_stops_working_when_deleted(client, seeded):
+    data = seeded(3)
+    feed_id, path = _create_feed(client, data)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+    assert feed_id in [feed['id'] for feed in client.get('/calendar/feeds', headers=headers).get_json()['feeds']]
+
+    assert client.delete(f'/calendar/feeds/{feed_id}', headers=headers).status_code == 200
+    assert client.get(path).status_code == 404
+    assert client.get('/calendar/not-a-token.ics').status_code == 404
+    # Only members get a feed of a WG
+    response = client.post('/calendar/feeds', json={'wg_id': seeded(1)['wg_id']}, headers=headers)
+    assert response.status_code == 403
+
+
+def test_lines_are_escaped_and_folded():
+    assert escape('a,b;c\\d\ne') == 'a\\,b\\;c\\\\d\\ne'
+    folded = fold('SUMMARY:' + 'ä' * 60)
+    lines = folded.split('\r\n')
+    assert all(len(line.encode()) <= 75 for line in lines)
+    assert all(line.startswith(' ') for line in lines[1:-1]) and lines[-1] == ''
+    assert ''.join(line[1:] if i else line for i, line in enumerate(lines)) == 'SUMMARY:' + 'ä' * 60
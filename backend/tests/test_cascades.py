@@ -0,0 +1,21 @@
+"""Deletes that leave the association rows to ON DELETE CASCADE."""
+from conftest import StatementCounter, bearer
+from extensions import db
+
+
+def test_deleting_an_item_leaves_its_users_to_the_database(file_app):
+    from models import Item, user_item
+
+    app, data = file_app(n=1)
+    with app.app_context():
+        item_id = db.session.scalar(db.select(Item.idItem).filter_by(shoppinglist_id=data['shoppinglist_id']))
+        with db.engine.begin() as conn:
+            conn.execute(user_item.insert().values(user_id=data['user']['idUser'], item_id=item_id))
+        counter = StatementCounter(db.engine)
+
+    with counter:
+        response = app.test_client().delete(f'/item/{item_id}', headers=bearer(data['token']))
+    assert response.status_code == 204
+    assert not [s for s in counter.statements if 'user_item' in s], counter.statements
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(user_item)) == 0
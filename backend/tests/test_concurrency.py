@@ -0,0 +1,80 @@
+"""Version columns: conditional writes, If-Match and set-state endpoints."""
+from extensions import db
+
+
+def _headers(data, **extra):
+    return {'Authorization': f"Bearer {data['token']}", **extra}
+
+
+def _item_ids(app, data):
+    from models import Item
+    with app.app_context():
+        return db.session.execute(db.select(Item.idItem).where(Item.shoppinglist_id == data['shoppinglist_id'])
+                                  .order_by(Item.idItem)).scalars().all()
+
+
+def test_set_state_is_idempotent(app, client, seeded):
+    from models import TaskList
+
+    data = seeded(3)
+    path = f"/task/{data['task_id']}/done"
+    first = client.put(path, json={'is_done': True}, headers=_headers(data))
+    assert first.status_code == 200 and first.get_json()['is_done'] is True
+    # A retry, or a housemate tapping at the same time, leaves it done
+    again = client.put(path, json={'is_done': True}, headers=_headers(data))
+    assert again.status_code == 200 and again.get_json()['version'] == first.get_json()['version']
+    assert again.headers['ETag'] == f"\"{first.get_json()['version']}\""
+
+    client.put(path, json={'is_done': False}, headers=_headers(data))
+    with app.app_context():
+        assert not db.session.get(TaskList, data['tasklist_id']).is_checked
+
+
+def test_if_match_guards_updates(client, seeded):
+    data = seeded(3)
+    path = f"/task/{data['task_id']}"
+    version = client.get(path, headers=_headers(data)).get_json()['version']
+
+    response = client.put(path, json={'title': 'Renamed'}, headers=_headers(data, **{'If-Match': f'"{version}"'}))
+    assert response.status_code == 200 and response.get_json()['version'] == version + 1
+    # The same precondition again is now stale
+    response = client.put(path, json={'title': 'Lost'}, headers=_headers(data, **{'If-Match': f'"{version}"'}))
+    assert response.status_code == 412
+    assert client.get(path, headers=_headers(data)).get_json()['title'] == 'Renamed'
+
+
+def test_checking_an_item_and_the_list(app, client, seeded):
+    from models import ShoppingList
+
+    data = seeded(3)
+    first, *rest = _item_ids(app, data)
+    for item_id in [first, *rest]:
+        response = client.put(f'/item/{item_id}/checked', json={'is_checked': True}, headers=_headers(data))
+        assert response.status_code == 200
+    with app.app_context():
+        assert db.session.get(ShoppingList, data['shoppinglist_id']).is_checked
+
+    client.put(f'/item/{first}/checked', json={'is_checked': False}, headers=_headers(data))
+    response = client.put(f"/shoppinglist/{data['shoppinglist_id']}/checked", json={'is_checked': True},
+                          headers=_headers(data))
+    assert response.status_code == 200
+    assert all(item['is_checked'] for item in response.get_json()['items'])
+
+
+def test_lost_race_is_a_conflict(app, client, seeded, monkeypatch):
+    import blueprints.item
+    from models import Item
+
+    data = seeded(3)
+    item_id = _item_ids(app, data)[0]
+
+    def concurrent_write(item):
+        # Another request commits between this one's read and its write
+        items = Item.__table__
+        db.session.execute(items.update().where(items.c.idItem == item.idItem)
+                           .values(version=items.c.version + 1))
+        return None
+
+    monkeypatch.setattr(blueprints.item, 'version_mismatch', concurrent_write)
+    response = client.put(f'/item/{item_id}/check', headers=_headers(data))
+    assert response.status_code == 409
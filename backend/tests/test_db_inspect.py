@@ -0,0 +1,27 @@
+"""The db-inspect commands, scoped to a WG."""
+import json
+
+
+def test_tables_without_a_path_to_a_wg_are_skipped(app, seeded):
+    wg_id = seeded(1)['wg_id']
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['db-inspect', 'tables', '--wg', wg_id])
+    assert result.exit_code == 0, result.output
+    names = {line.split()[0] for line in result.output.splitlines()}
+    assert {'WG', 'TASK', 'user_tasklist'} <= names
+    assert not names & {'JOB', 'IDEMPOTENCYKEY'}
+
+    result = runner.invoke(args=['db-inspect', 'dump', '--wg', wg_id])
+    assert result.exit_code == 0, result.output
+    tables = {json.loads(line)['_table'] for line in result.output.splitlines()}
+    assert 'WG' in tables and 'JOB' not in tables
+
+
+def test_naming_a_table_without_a_path_to_a_wg_is_an_error(app, seeded):
+    wg_id = seeded(1)['wg_id']
+    runner = app.test_cli_runner()
+    for args in (['dump', 'JOB'], ['show', '--no-pager', 'IDEMPOTENCYKEY']):
+        result = runner.invoke(args=['db-inspect', *args, '--wg', wg_id])
+        assert result.exit_code == 2
+        assert 'cannot be scoped to a WG' in result.output
@@ -0,0 +1,117 @@
+"""Statement budgets and timings for the serializers and token_required.
+
+Every endpoint that returns a serialized collection has a budget of SQL
+statements that must not grow with the number of children. selectinload
+fetches children in batches of 500 parents, so budgets grow by one
+statement per batch and not per child; an N+1 query fails the suite at
+the smallest size already.
+"""
+import math
+import time
+
+import pytest
+
+from extensions import db
+from conftest import TIMINGS
+
+SIZES = [10, 100, 1000, 10000]
+
+# Parents per IN (...) statement emitted by selectinload
+SELECTIN_BATCH = 500
+
+# endpoint: (path, fixed statements, eager-loaded relationships that scale with the size)
+BUDGETS = {
+    'wg_my': ('/wg/my', 2, 5),
+    'wg_detail': ('/wg/{wg_id}', 7, 0),
+    'wg_tasklists': ('/wg/{wg_id}/tasklists', 4, 3),
+    'wg_shoppinglists': ('/wg/{wg_id}/shoppinglists', 4, 1),
+    'wg_budgetplannings': ('/wg/{wg_id}/budgetplanning', 4, 3),
+    'tasklist_detail': ('/tasklist/{tasklist_id}', 6, 1),
+    'shoppinglist_detail': ('/shoppinglist/{shoppinglist_id}', 5, 0),
+    'budgetplanning_detail': ('/budgetplanning/{budgetplanning_id}', 6, 1),
+    'undone_tasks': ('/tasks/undone/wg/{wg_id}', 4, 1),
+    'undone_tasks_me': ('/tasks/undone/me', 2, 1),
+    'task_detail': ('/task/{task_id}', 6, 0),
+}
+
+
+def budget(name, n):
+    _, fixed, scaling = BUDGETS[name]
+    return fixed + scaling * math.ceil(n / SELECTIN_BATCH)
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('name', sorted(BUDGETS))
+def test_statement_budget(client, seeded, count_statements, name, n):
+    data = seeded(n)
+    path = BUDGETS[name][0].format(**data)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+
+    with count_statements() as counter:
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        TIMINGS[f'GET {name}'][n] = (time.perf_counter() - started) * 1000
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert counter.count <= budget(name, n), '\n'.join(counter.statements)
+
+
+def _load(model, options, ident):
+    return model.query.options(*options).get(ident)
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('kind', ['wg', 'tasklist', 'shoppinglist', 'budgetplanning', 'task'])
+def test_serializer_runs_without_queries(app, seeded, count_statements, kind, n):
+    from models import WG, TaskList, ShoppingList, BudgetPlanning, Task
+    from blueprints.wg import serialize_wg, WG_LOAD_OPTIONS
+    from blueprints.task_list import serialize_tasklist, TASKLIST_LOAD_OPTIONS
+    from blueprints.shopping_list import serialize_shoppinglist, SHOPPINGLIST_LOAD_OPTIONS
+    from blueprints.budget_planning import serialize_budgetplanning, BUDGETPLANNING_LOAD_OPTIONS
+    from blueprints.task import serialize_task, TASK_LOAD_OPTIONS
+
+    cases = {
+        'wg': (WG, WG_LOAD_OPTIONS, 'wg_id', serialize_wg),
+        'tasklist': (TaskList, TASKLIST_LOAD_OPTIONS, 'tasklist_id', serialize_tasklist),
+        'shoppinglist': (ShoppingList, SHOPPINGLIST_LOAD_OPTIONS, 'shoppinglist_id', serialize_shoppinglist),
+        'budgetplanning': (BudgetPlanning, BUDGETPLANNING_LOAD_OPTIONS, 'budgetplanning_id',
+                           serialize_budgetplanning),
+        'task': (Task, TASK_LOAD_OPTIONS, 'task_id', serialize_task),
+    }
+    model, options, key, serialize = cases[kind]
+    data = seeded(n)
+
+    with app.app_context():
+        obj = _load(model, options, data[key])
+        with count_statements() as counter:
+            best = min(_timed(serialize, obj) for _ in range(3))
+        db.session.remove()
+
+    TIMINGS[f'serialize_{kind}'][n] = best * 1000
+    assert counter.count == 0, '\n'.join(counter.statements)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def test_token_required(app, seeded, count_statements):
+    from decorators import token_required
+
+    data = seeded(SIZES[0])
+    view = token_required(lambda: 'ok')
+    headers = {'Authorization': f"Bearer {data['token']}"}
+    rounds = 200
+
+    with count_statements() as counter:
+        with app.test_request_context('/', headers=headers):
+            assert view() == 'ok'
+    assert counter.count == 1, '\n'.join(counter.statements)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        with app.test_request_context('/', headers=headers):
+            view()
+    TIMINGS['token_required'][SIZES[0]] = (time.perf_counter() - started) / rounds * 1000
@@ -0,0 +1,86 @@
+"""Idempotency-Key on endpoints that create rows."""
+from datetime import datetime, timedelta
+
+from extensions import db
+
+
+def _post_item(client, data, title, key):
+    return client.post('/item', json={'shoppinglist_id': data['shoppinglist_id'], 'title': title},
+                       headers={'Authorization': f"Bearer {data['token']}", 'Idempotency-Key': key})
+
+
+def _count_items(app, title):
+    from models import Item
+    with app.app_context():
+        return db.session.execute(db.select(db.func.count()).where(Item.title == title)).scalar()
+
+
+def test_retry_replays_the_response(app, client, seeded):
+    data = seeded(3)
+    first = _post_item(client, data, 'Milk', 'retry-1')
+    assert first.status_code == 201 and 'Idempotent-Replayed' not in first.headers
+
+    retry = _post_item(client, data, 'Milk', 'retry-1')
+    assert retry.status_code == 201 and retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert _count_items(app, 'Milk') == 1
+
+    # The same key with another body is a client error, not a replay
+    assert _post_item(client, data, 'Eggs', 'retry-1').status_code == 422
+    assert _count_items(app, 'Eggs') == 0
+
+
+def test_request_in_progress_is_a_conflict(app, client, seeded):
+    from models import IdempotencyKey
+
+    data = seeded(3)
+    _post_item(client, data, 'Bread', 'pending-1')
+    # As if the first request had not finished yet
+    with app.app_context():
+        db.session.execute(db.update(IdempotencyKey).where(IdempotencyKey.key == 'pending-1')
+                           .values(status=None, body=None))
+        db.session.commit()
+
+    response = _post_item(client, data, 'Bread', 'pending-1')
+    assert response.status_code == 409 and response.headers['Retry-After'] == '1'
+
+
+def test_expired_keys_are_claimed_again_and_purged(app, client, seeded):
+    from idempotency import purge_expired
+    from models import IdempotencyKey
+
+    data = seeded(3)
+    _post_item(client, data, 'Butter', 'expired-1')
+    with app.app_context():
+        db.session.execute(db.update(IdempotencyKey).where(IdempotencyKey.key == 'expired-1')
+                           .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+    response = _post_item(client, data, 'Butter', 'expired-1')
+    assert response.status_code == 201 and 'Idempotent-Replayed' not in response.headers
+    assert _count_items(app, 'Butter') == 2
+
+    with app.app_context():
+        db.session.execute(db.update(IdempotencyKey).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        assert purge_expired() >= 1
+        assert db.session.execute(db.select(db.func.count()).select_from(IdempotencyKey)).scalar() == 0
+
+
+def test_abandoned_claims_are_taken_over(app, client, seeded):
+    from models import IdempotencyKey
+
+    data = seeded(3)
+    _post_item(client, data, 'Cheese', 'abandoned-1')
+    # As if the first request had died long ago without storing its response
+    lease = timedelta(seconds=app.config['IDEMPOTENCY_LEASE_SECONDS'])
+    with app.app_context():
+        db.session.execute(db.update(IdempotencyKey).where(IdempotencyKey.key == 'abandoned-1')
+                           .values(status=None, body=None, claimed_at=datetime.utcnow() - 2 * lease))
+        db.session.commit()
+
+    response = _post_item(client, data, 'Cheese', 'abandoned-1')
+    assert response.status_code == 201 and 'Idempotent-Replayed' not in response.headers
+    retry = _post_item(client, data, 'Cheese', 'abandoned-1')
+    assert retry.status_code == 201 and retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == response.get_json()
@@ -0,0 +1,98 @@
+"""The database-backed job queue: retries, backoff and visibility timeouts."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from jobs import HANDLERS, Worker, enqueue, job_handler
+
+CALLS = []
+
+
+@job_handler('test_flaky')
+def flaky_job(fail_times):
+    CALLS.append(fail_times)
+    if len(CALLS) <= fail_times:
+        raise RuntimeError('flaky')
+
+
+@pytest.fixture
+def worker(app):
+    CALLS.clear()
+    with app.app_context():
+        yield Worker(app, name='test-worker')
+        db.session.remove()
+
+
+def _job(job_id):
+    from models import Job
+    db.session.expire_all()
+    return Job.query.get(job_id)
+
+
+def test_failed_job_is_retried_with_backoff(app, worker):
+    job_id = enqueue('test_flaky', fail_times=1).idJob
+    db.session.commit()
+
+    assert worker.run_once()
+    job = _job(job_id)
+    assert job.status == 'queued' and job.attempts == 1
+    assert 'RuntimeError' in job.last_error
+    assert job.run_at > datetime.utcnow()
+    # Not due until the backoff has passed
+    assert not worker.run_once()
+
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    assert worker.run_once()
+    assert _job(job_id) is None
+    assert CALLS == [1, 1]
+
+
+def test_job_fails_for_good_after_max_attempts(app, worker):
+    job_id = enqueue('test_flaky', fail_times=5, max_attempts=1).idJob
+    db.session.commit()
+
+    assert worker.run_once()
+    assert _job(job_id).status == 'failed'
+    assert not worker.run_once()
+
+
+def test_job_of_a_dead_worker_is_claimed_again(app, worker):
+    job_id = enqueue('test_flaky', fail_times=0).idJob
+    db.session.commit()
+    dead = Worker(app, name='dead-worker')
+    assert dead.claim().idJob == job_id
+    assert not worker.run_once()
+
+    # The claim of the dead worker expires with its visibility timeout
+    job = _job(job_id)
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert worker.run_once()
+    assert _job(job_id) is None
+
+
+def test_delete_wg_is_queued(app, client, seeded):
+    from models import WG, Task, user_task
+
+    data = seeded(2)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+    response = client.delete(f"/wg/{data['wg_id']}", headers=headers)
+    assert response.status_code == 202
+
+    with app.app_context():
+        assert WG.query.get(data['wg_id']) is not None
+        worker = Worker(app)
+        while worker.run_once():
+            pass
+        assert WG.query.get(data['wg_id']) is None
+        # Everything below the WG went with it through ON DELETE CASCADE
+        assert Task.query.get(data['task_id']) is None
+        links = db.select(db.func.count()).select_from(user_task).where(user_task.c.task_id == data['task_id'])
+        assert db.session.execute(links).scalar() == 0
+        db.session.remove()
+
+
+def test_handlers_are_registered():
+    assert {'delete_wg', 'delete_user'} <= set(HANDLERS)
@@ -0,0 +1,34 @@
+"""Prometheus metrics served at /metrics."""
+import pytest
+
+
+def test_metrics_require_the_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-secret')
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+
+def test_requests_are_counted_and_timed(client, seeded):
+    data = seeded(1)
+    response = client.get(f"/wg/{data['wg_id']}", headers={'Authorization': f"Bearer {data['token']}"})
+    assert response.status_code == 200
+
+    body = client.get('/metrics').get_data(as_text=True)
+    labels = 'endpoint="wg_bp.get_wg_info",method="GET"'
+    assert f'wg_http_requests_total{{{labels},status="200"}}' in body
+    assert f'wg_http_request_duration_seconds_count{{{labels}}}' in body
+    assert 'wg_sql_statements_per_request_count{endpoint="wg_bp.get_wg_info"}' in body
+
+
+def test_failing_statements_leave_nothing_on_the_connection(app):
+    from sqlalchemy.exc import OperationalError
+
+    from extensions import db
+
+    with app.app_context(), db.engine.connect() as conn:
+        conn.exec_driver_sql('SELECT 1')
+        info = repr(conn.info)
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql('SELECT * FROM no_such_table')
+        assert repr(conn.info) == info
@@ -0,0 +1,67 @@
+"""SQL profiling of single requests with the X-Profile header."""
+import logging
+
+import pytest
+
+from conftest import bearer
+from extensions import db
+
+N = 5
+
+
+@pytest.fixture(scope='module')
+def profiled_app(file_app):
+    """An app with a profile token and a view that looks up N users one by one."""
+    from models import User
+
+    app, _ = file_app(n=1, PROFILE_TOKEN='profile-secret')
+
+    @app.route('/_one_by_one')
+    def one_by_one():
+        for i in range(N):
+            db.session.execute(db.select(User.idUser).filter_by(strUser=f'user_{i}')).first()
+        return {'looked_up': N}
+
+    return app
+
+
+def test_profiled_requests_get_server_timing(profiled_app):
+    client = profiled_app.test_client()
+    assert 'Server-Timing' not in client.get('/_one_by_one').headers
+
+    response = client.get('/_one_by_one', headers={'X-Profile': 'profile-secret'})
+    timings = dict(part.split(';', 1) for part in response.headers['Server-Timing'].split(', '))
+    assert set(timings) == {'auth', 'db', 'app', 'total'}
+    assert f'desc="{N} statements"' in timings['db']
+
+
+def test_repeated_statements_are_reported_as_n_plus_one(profiled_app, caplog):
+    with caplog.at_level(logging.WARNING, logger=profiled_app.logger.name):
+        response = profiled_app.test_client().get('/_one_by_one', headers={'X-Profile': 'profile-secret'})
+    assert response.headers['X-Profile-N-Plus-One'] == '1'
+    warnings = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Possible N+1')]
+    assert len(warnings) == 1
+    assert f'GET /_one_by_one: {N} x SELECT' in warnings[0]
+    assert 'tests/test_profiler.py' in warnings[0]
+
+
+def test_slow_statements_are_explained_where_they_ran(tmp_path, file_app, caplog):
+    import shutil
+
+    path, replica = tmp_path / 'wg_app.db', tmp_path / 'replica.db'
+    app, data = file_app(tmp_path, n=1, PROFILE_TOKEN='profile-secret', SLOW_QUERY_MS=0,
+                         SQLALCHEMY_BINDS={'replica': f'sqlite:///{replica}'})
+    with app.app_context():
+        db.engine.dispose()
+        shutil.copy(path, replica)
+        # Only the replica can still plan the reads of the request
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ALTER TABLE "WG" RENAME TO "WG_moved"')
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = app.test_client().get(f"/wg/{data['wg_id']}",
+                                         headers={**bearer(data['token']), 'X-Profile': 'profile-secret'})
+    assert response.status_code == 200
+    plans = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Slow statement')]
+    assert any('"WG"' in plan for plan in plans)
+    assert not [plan for plan in plans if 'EXPLAIN failed' in plan]
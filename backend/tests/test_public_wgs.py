@@ -0,0 +1,82 @@
+"""The public WG directory: prefix search, cursor pages and member counts."""
+import pytest
+
+from extensions import db
+from models.types import new_id
+
+
+@pytest.fixture(scope='module')
+def directory(app, seeded):
+    """Five public WGs titled 'Directory N' and a private one, with N members each."""
+    from models import WG, user_wg
+
+    data = seeded(1)
+    creator = data['user']['idUser']
+    wgs = [{'idWG': new_id(), 'title': f'Directory {n}', 'address': f'Lindenallee {n}', 'etage': '1',
+            'creator_id': creator, 'is_public': True} for n in range(5)]
+    wgs.append({'idWG': new_id(), 'title': 'Directory private', 'address': 'Lindenallee 9', 'etage': '1',
+                'creator_id': creator, 'is_public': False})
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(WG.__table__.insert(), wgs)
+            conn.execute(user_wg.insert(), [{'user_id': creator, 'wg_id': wg['idWG']}
+                                            for n, wg in enumerate(wgs) for _ in range(n)])
+    return [wg['idWG'] for wg in wgs]
+
+
+def _get(client, seeded, **params):
+    headers = {'Authorization': f"Bearer {seeded(1)['token']}"}
+    response = client.get('/wg/public', headers=headers, query_string=params)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def test_prefix_of_title_or_address_case_insensitive(client, seeded, directory):
+    body = _get(client, seeded, q='directory')
+    assert [wg['title'] for wg in body['wgs']] == [f'Directory {n}' for n in range(5)]
+    assert [wg['member_count'] for wg in body['wgs']] == list(range(5))
+    assert body['next_cursor'] is None
+
+    assert [wg['address'] for wg in _get(client, seeded, q='LINDENALLEE 3')['wgs']] == ['Lindenallee 3']
+    assert _get(client, seeded, q='irectory')['wgs'] == []
+
+
+def test_cursor_pages_through_every_match_once(client, seeded, directory):
+    titles, cursor = [], None
+    while True:
+        params = {'q': 'Direc', 'per_page': 2}
+        if cursor:
+            params['cursor'] = cursor
+        body = _get(client, seeded, **params)
+        titles += [wg['title'] for wg in body['wgs']]
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert titles == [f'Directory {n}' for n in range(5)]
+
+
+def test_invalid_cursor(client, seeded):
+    headers = {'Authorization': f"Bearer {seeded(1)['token']}"}
+    assert client.get('/wg/public?cursor=nope', headers=headers).status_code == 400
+
+
+def test_prefix_search_seeks_in_the_index(app, client, seeded, directory):
+    from sqlalchemy import event
+
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'member_count' in statement:
+            executed.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            _get(client, seeded, q='dir')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        statement, parameters = executed[0]
+        with db.engine.connect() as conn:
+            plan = ' '.join(row[-1] for row in conn.exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + statement, parameters))
+    assert 'ix_wg_public_title' in plan and 'ix_wg_public_address' in plan, plan
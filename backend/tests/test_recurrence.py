@@ -0,0 +1,54 @@
+"""Recurring task templates and the rolling window of their instances."""
+from datetime import datetime, timedelta
+
+from extensions import db
+from recurrence import add_months, following_occurrence, materialize_due
+
+
+def test_monthly_rule_keeps_the_day_of_the_month():
+    jan = datetime(2026, 1, 31, 9)
+    feb = following_occurrence(jan, 'monthly', 1, 31)
+    assert feb == datetime(2026, 2, 28, 9)
+    assert following_occurrence(feb, 'monthly', 1, 31) == datetime(2026, 3, 31, 9)
+    assert add_months(datetime(2026, 11, 15), 3, 15) == datetime(2027, 2, 15)
+
+
+def test_instances_are_materialized_within_the_window(app, client, seeded, count_statements):
+    from models import Task
+
+    data = seeded(1)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(hours=1)
+    response = client.post(f"/tasklist/{data['tasklist_id']}/create_template", headers=headers, json={
+        'title': 'Take out the bins',
+        'start_date': start.isoformat(),
+        'end_date': (start + timedelta(hours=2)).isoformat(),
+        'recurrence': {'unit': 'weekly', 'interval': 1},
+        'user_ids': [data['user']['idUser']],
+    })
+    assert response.status_code == 201, response.get_data(as_text=True)
+    template_id = response.get_json()['id']
+
+    with app.app_context():
+        instances = Task.query.filter_by(template_id=template_id).order_by(Task.start_date).all()
+        window = app.config['RECURRENCE_WINDOW_DAYS']
+        assert len(instances) == len(range(0, window, 7))
+        assert instances[0].start_date == start
+        assert instances[0].end_date == start + timedelta(hours=2)
+        assert [u.idUser for u in instances[0].users] == [data['user']['idUser']]
+
+        # Running again inside the same window creates nothing
+        assert materialize_due() == 0
+
+        # A later run only tops up the window, with one insert for all tasks
+        later = start + timedelta(days=14)
+        with count_statements() as counter:
+            created = materialize_due(now=later)
+        inserts = [s for s in counter.statements if s.startswith('INSERT INTO "TASK"')]
+        assert created == 2
+        assert len(inserts) == 1
+        db.session.remove()
+
+    listing = client.get(f"/tasklist/{data['tasklist_id']}", headers=headers).get_json()
+    assert [t['id'] for t in listing['templates']] == [template_id]
+    assert template_id not in [t['id'] for t in listing['tasks']]
@@ -0,0 +1,56 @@
+"""Reads of GET requests from a read-only replica, with read-your-writes."""
+import pytest
+
+from conftest import StatementCounter, bearer
+from extensions import db
+from replica import RecentWriters
+from shared_store import SharedStore
+
+
+@pytest.fixture(scope='module')
+def replica_app(tmp_path_factory, file_app):
+    """An app whose replica is a read-only connection to its own database file."""
+    path = tmp_path_factory.mktemp('replica')
+    return file_app(path, SQLALCHEMY_BINDS={'replica': f"sqlite:///file:{path / 'wg_app.db'}?mode=ro&uri=true"})
+
+
+def _get(app, path, token):
+    """Status of GET ``path`` and the number of statements sent to (primary, replica)."""
+    with app.app_context():
+        primary, replica = StatementCounter(db.engine), StatementCounter(db.engines['replica'])
+    with primary, replica:
+        response = app.test_client().get(path, headers=bearer(token))
+    return response.status_code, primary.count, replica.count
+
+
+def test_reads_go_to_the_replica(replica_app):
+    app, data = replica_app
+    status, primary, replica = _get(app, f"/wg/{data['wg_id']}", data['token'])
+    assert status == 200 and primary == 0 and replica > 0
+
+
+def test_writers_read_their_writes_from_the_primary(replica_app):
+    app, data = replica_app
+    app.extensions['recent_writers'].clear()
+    response = app.test_client().put(f"/task/{data['task_id']}/done", json={'is_done': True},
+                                     headers=bearer(data['token']))
+    assert response.status_code == 200
+
+    status, primary, replica = _get(app, f"/task/{data['task_id']}", data['token'])
+    assert status == 200 and primary > 0 and replica == 0
+    # Housemates keep reading from the replica
+    status, primary, replica = _get(app, f"/wg/{data['wg_id']}", data['housemate_token'])
+    assert status == 200 and primary == 0 and replica > 0
+
+    app.extensions['recent_writers'].clear()
+    status, primary, replica = _get(app, f"/task/{data['task_id']}", data['token'])
+    assert primary == 0 and replica > 0
+
+
+def test_recent_writers_are_shared_by_processes(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    worker_a, worker_b = RecentWriters(SharedStore(path)), RecentWriters(SharedStore(path))
+    worker_a.add('user-1', 5)
+    assert 'user-1' in worker_b and 'user-2' not in worker_b
+    worker_b.add('user-2', -1)
+    assert 'user-2' not in worker_a
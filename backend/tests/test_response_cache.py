@@ -0,0 +1,95 @@
+"""Cached responses of the WG read endpoints, invalidated by the WG's version."""
+import pytest
+
+from conftest import StatementCounter, bearer, make_file_app, token_for
+from extensions import db
+
+
+@pytest.fixture(scope='module')
+def cache_app(tmp_path_factory, file_app):
+    """An app with the response cache on, sharing it through a store file."""
+    from models import User
+
+    path = tmp_path_factory.mktemp('response_cache')
+    app, data = file_app(path, RESPONSE_CACHE_SIZE=64, SHARED_STORE=str(path / 'shared.db'))
+    with app.app_context():
+        stranger = User(strUser='stranger', strEmail='stranger@example.com', strPassword='x')
+        db.session.add(stranger)
+        db.session.commit()
+        data['stranger_token'] = token_for(app, stranger)
+    return app, data, path
+
+
+def _get(app, path, token):
+    """The response to GET ``path`` and the number of statements it took."""
+    with app.app_context():
+        counter = StatementCounter(db.engine)
+    with counter:
+        response = app.test_client().get(path, headers=bearer(token))
+    return response, counter.count
+
+
+@pytest.mark.parametrize('path', ['/wg/{wg_id}', '/wg/{wg_id}/tasklists', '/tasklist/{tasklist_id}',
+                                  '/shoppinglist/{shoppinglist_id}', '/budgetplanning/{budgetplanning_id}'])
+def test_repeated_reads_are_served_from_the_cache(cache_app, path):
+    app, data, _ = cache_app
+    path = path.format(**data)
+    first, uncached = _get(app, path, data['token'])
+    second, cached = _get(app, path, data['token'])
+    assert first.status_code == second.status_code == 200
+    assert second.get_json() == first.get_json()
+    # The user of the token and the versions of the WG
+    assert cached == 2 < uncached
+
+
+def test_writes_invalidate_the_cached_responses(cache_app):
+    app, data, _ = cache_app
+    headers = bearer(data['token'])
+    client = app.test_client()
+    path = f"/tasklist/{data['tasklist_id']}"
+    _get(app, path, data['token'])
+
+    response = client.put(path, json={'title': 'Renamed'}, headers=headers)
+    assert response.status_code == 200
+    assert _get(app, path, data['token'])[0].get_json()['title'] == 'Renamed'
+
+    response = client.put(f"/task/{data['task_id']}/done", json={'is_done': True}, headers=headers)
+    assert response.status_code == 200
+    tasks = {task['id']: task for task in _get(app, path, data['token'])[0].get_json()['tasks']}
+    assert tasks[data['task_id']]['is_done'] is True
+
+    # Renaming a member changes every WG they are in
+    response = client.put('/user', json={'username': 'renamed_user'},
+                          headers=bearer(data['housemate_token']))
+    assert response.status_code == 200
+    names = [user['name'] for user in _get(app, f"/wg/{data['wg_id']}", data['token'])[0].get_json()['users']]
+    assert 'renamed_user' in names
+
+
+def test_unassigning_users_invalidates_the_cached_responses(cache_app):
+    app, data, _ = cache_app
+    headers = bearer(data['token'])
+    client = app.test_client()
+    path = f"/tasklist/{data['tasklist_id']}"
+    user_ids = [data['user']['idUser']]
+    assert client.post(f'{path}/assign_users', json={'user_ids': user_ids}, headers=headers).status_code == 200
+    assert [user['id'] for user in _get(app, path, data['token'])[0].get_json()['users']] == user_ids
+
+    response = client.post(f'{path}/remove_users', json={'user_ids': user_ids}, headers=headers)
+    assert response.status_code == 200
+    assert _get(app, path, data['token'])[0].get_json()['users'] == []
+
+
+def test_cached_responses_are_not_served_to_outsiders(cache_app):
+    app, data, _ = cache_app
+    path = f"/wg/{data['wg_id']}"
+    assert _get(app, path, data['token'])[0].status_code == 200
+    assert _get(app, path, data['stranger_token'])[0].status_code == 403
+
+
+def test_workers_share_the_cached_responses(cache_app):
+    app, data, path = cache_app
+    worker = make_file_app(path / 'wg_app.db', RESPONSE_CACHE_SIZE=64, SHARED_STORE=str(path / 'shared.db'))
+    response, _ = _get(app, f"/wg/{data['wg_id']}/shoppinglists", data['token'])
+    shared, count = _get(worker, f"/wg/{data['wg_id']}/shoppinglists", data['token'])
+    assert shared.get_json() == response.get_json() and count == 2
@@ -0,0 +1,101 @@
+"""Full-text search: the index follows writes and answers within one WG."""
+import pytest
+
+import search
+from extensions import db
+from models.types import new_id
+
+
+@pytest.fixture
+def search_in(client, seeded):
+    data = seeded(1)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+
+    def get(q, wg_id=None, **params):
+        return client.get(f"/wg/{wg_id or data['wg_id']}/search", headers=headers,
+                          query_string=dict(params, q=q))
+    return get
+
+
+def _kinds_and_titles(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [(r['kind'], r['title']) for r in response.get_json()['results']]
+
+
+def test_index_follows_inserts_updates_and_deletes(app, seeded, search_in):
+    from models import TaskList, Task
+
+    data = seeded(1)
+    with app.app_context():
+        tasklist = TaskList(idTaskList=new_id(), title='Bathroom', wg_id=data['wg_id'])
+        task = Task(idTask=new_id(), title='Descale the boiler', description='Vinegar works best',
+                    tasklist=tasklist)
+        db.session.add_all([tasklist, task])
+        db.session.commit()
+        tasklist_id, task_id = tasklist.idTaskList, task.idTask
+
+    results = search_in('boil').get_json()['results']
+    assert [(r['kind'], r['id'], r['parent_id']) for r in results] == [('task', task_id, tasklist_id)]
+    assert _kinds_and_titles(search_in('VINEGAR')) == [('task', 'Descale the boiler')]
+    assert _kinds_and_titles(search_in('bathroom')) == [('tasklist', 'Bathroom')]
+    # Every word has to match, only the last one as a prefix
+    assert _kinds_and_titles(search_in('descale boi')) == [('task', 'Descale the boiler')]
+    assert _kinds_and_titles(search_in('boil descale')) == []
+    assert _kinds_and_titles(search_in('boiler kettle')) == []
+
+    with app.app_context():
+        db.session.get(Task, task_id).title = 'Descale the kettle'
+        db.session.commit()
+    assert _kinds_and_titles(search_in('boiler')) == []
+    assert _kinds_and_titles(search_in('kettle')) == [('task', 'Descale the kettle')]
+
+    # Deleting the list cascades to its tasks in the database, and to the index
+    with app.app_context():
+        db.session.execute(db.delete(TaskList).where(TaskList.idTaskList == tasklist_id))
+        db.session.commit()
+        assert db.session.execute(db.text('SELECT count(*) FROM search_doc WHERE kind = :kind'),
+                                  {'kind': 'task'}).scalar() == \
+            db.session.execute(db.select(db.func.count()).select_from(Task)).scalar()
+    assert _kinds_and_titles(search_in('kettle')) == []
+
+
+def test_search_is_scoped_to_the_wg_and_ranks_titles_first(app, seeded, search_in):
+    from models import ShoppingList, Item
+
+    data, other = seeded(1), seeded(10)
+    with app.app_context():
+        shoppinglist = ShoppingList(idShoppingList=new_id(), title='Groceries', wg_id=data['wg_id'])
+        items = [Item(idItem=new_id(), title='Oat milk', shoppinglist=shoppinglist),
+                 Item(idItem=new_id(), title='Bread', description='Not the milk bread', shoppinglist=shoppinglist),
+                 Item(idItem=new_id(), title='Milk', shoppinglist_id=other['shoppinglist_id'])]
+        db.session.add_all([shoppinglist, *items])
+        db.session.commit()
+
+    titles = [title for _, title in _kinds_and_titles(search_in('milk'))]
+    assert titles == ['Oat milk', 'Bread']
+
+    first = search_in('milk', per_page=1).get_json()
+    assert [r['title'] for r in first['results']] == ['Oat milk'] and first['has_more']
+    second = search_in('milk', per_page=1, page=2).get_json()
+    assert [r['title'] for r in second['results']] == ['Bread'] and not second['has_more']
+
+
+def test_search_checks_the_query_and_membership(client, seeded, search_in):
+    assert search_in('  "*"  ').status_code == 400
+    assert search_in('task', wg_id=new_id()).status_code == 404
+    other = seeded(10)
+    assert search_in('task', wg_id=other['wg_id']).status_code == 403
+
+
+def test_rebuild_restores_the_index(app, seeded, search_in):
+    seeded(1)
+    before = _kinds_and_titles(search_in('task'))
+    assert before
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DELETE FROM search_fts')
+            conn.exec_driver_sql('DELETE FROM search_doc')
+        assert _kinds_and_titles(search_in('task')) == []
+        with db.engine.begin() as conn:
+            search.rebuild(conn)
+    assert sorted(_kinds_and_titles(search_in('task'))) == sorted(before)
@@ -0,0 +1,132 @@
+"""WG subtrees placed in several databases, and moving a WG between them."""
+import pytest
+
+from conftest import StatementCounter, bearer
+from extensions import db
+
+
+@pytest.fixture(scope='module')
+def shard_app(tmp_path_factory, file_app):
+    """An app on a main database and the shards ``a`` and ``b``, with no caching of the directory."""
+    import shards
+
+    path = tmp_path_factory.mktemp('shards')
+    urls = {name: f'sqlite:///{path / name}.db' for name in ('a', 'b')}
+    app, data = file_app(path, SHARD_DATABASE_URLS=urls, NEW_WG_SHARD='a', SHARD_CACHE_SECONDS=0,
+                        SQLALCHEMY_BINDS={f'shard_{name}': url for name, url in urls.items()})
+    with app.app_context():
+        for name in urls:
+            db.metadata.create_all(shards.shard_engine(name))
+    return app, data
+
+
+def _count(app, shard, table, **where):
+    import shards
+    with app.app_context():
+        table = db.metadata.tables[table]
+        with shards.shard_engine(shard).connect() as conn:
+            return conn.scalar(db.select(db.func.count()).select_from(table).where(
+                *(table.c[key] == value for key, value in where.items())))
+
+
+def test_new_wgs_keep_their_lists_in_a_shard(shard_app):
+    app, data = shard_app
+    client = app.test_client()
+    wg_id = client.post('/wg', json={'title': 'Sharded', 'address': 'Shard Street 1', 'etage': '1'},
+                        headers=bearer(data['token'])).get_json()['id']
+    tasklist = client.post('/tasklist', json={'wg_id': wg_id, 'title': 'Chores'}, headers=bearer(data['token']))
+    assert tasklist.status_code == 201
+    tasklist_id = tasklist.get_json()['id']
+    response = client.post(f'/tasklist/{tasklist_id}/add_task', json={'title': 'Sweep'}, headers=bearer(data['token']))
+    assert response.status_code == 201
+    task_id = response.get_json()['id']
+    response = client.post(f'/task/{task_id}/assign_users', json={'user_ids': [data['user']['idUser']]},
+                           headers=bearer(data['token']))
+    assert response.status_code == 200
+
+    # The WG and its memberships are in the main database, its lists only in the shard
+    assert _count(app, 'main', 'WG', idWG=wg_id) == 1
+    assert _count(app, 'main', 'TASKLIST', wg_id=wg_id) == 0
+    assert _count(app, 'a', 'TASKLIST', wg_id=wg_id) == 1
+    assert _count(app, 'a', 'user_task', task_id=task_id) == 1
+
+    mine = {wg['id']: wg for wg in client.get('/wg/my', headers=bearer(data['token'])).get_json()}
+    assert [tasklist['title'] for tasklist in mine[wg_id]['tasklists']] == ['Chores']
+    assert mine[data['wg_id']]['tasklists']
+    undone = client.get('/tasks/undone/me', headers=bearer(data['token'])).get_json()['wgs']
+    assert [task['title'] for wg in undone if wg['id'] == wg_id for task in wg['tasks']] == ['Sweep']
+    assert client.get(f'/task/{task_id}', headers=bearer(data['token'])).get_json()['title'] == 'Sweep'
+
+    # A new member is copied to the shard, so they can be assigned there
+    response = client.post(f'/wg/{wg_id}/invite_by_username', json={'username': 'other_3'},
+                           headers=bearer(data['token']))
+    assert response.status_code == 200
+    assert _count(app, 'a', 'user_wg', wg_id=wg_id) == 2
+
+
+def test_moving_a_wg_keeps_serving_it(shard_app):
+    import shards
+
+    app, data = shard_app
+    client = app.test_client()
+    path = f"/wg/{data['wg_id']}"
+    before = client.get(path, headers=bearer(data['token'])).get_json()
+    lists = _count(app, 'main', 'TASKLIST', wg_id=data['wg_id'])
+
+    with app.app_context():
+        moved = shards.move_wg(data['wg_id'], 'b')
+    assert moved['TASKLIST'] == lists and moved['TASK'] == 3
+    assert _count(app, 'main', 'TASKLIST', wg_id=data['wg_id']) == 0
+    assert _count(app, 'b', 'TASKLIST', wg_id=data['wg_id']) == lists
+
+    with app.app_context():
+        main, shard = StatementCounter(db.engine), StatementCounter(db.engines['shard_b'])
+    with main, shard:
+        assert client.get(path, headers=bearer(data['token'])).get_json() == before
+    assert main.count and shard.count
+    response = client.put(f"/task/{data['task_id']}/done", json={'is_done': True}, headers=bearer(data['token']))
+    assert response.status_code == 200
+
+    # And back again
+    with app.app_context():
+        shards.move_wg(data['wg_id'], 'main')
+    assert _count(app, 'b', 'WG', idWG=data['wg_id']) == 0
+    assert client.get(f"/task/{data['task_id']}", headers=bearer(data['token'])).get_json()['is_done'] is True
+
+
+def test_writes_wait_while_a_wg_moves(shard_app):
+    from models import WGShard
+
+    app, data = shard_app
+    with app.app_context():
+        db.session.merge(WGShard(wg_id=data['wg_id'], shard='main', moving=True))
+        db.session.commit()
+    client = app.test_client()
+    try:
+        response = client.put(f"/task/{data['task_id']}", json={'title': 'Renamed'}, headers=bearer(data['token']))
+        assert response.status_code == 503 and 'Retry-After' in response.headers
+        assert client.get(f"/task/{data['task_id']}", headers=bearer(data['token'])).status_code == 200
+    finally:
+        with app.app_context():
+            db.session.execute(db.update(WGShard).where(WGShard.wg_id == data['wg_id']).values(moving=False))
+            db.session.commit()
+
+
+def test_anonymous_requests_cause_no_lookups(shard_app):
+    from models.types import new_id
+
+    app, _ = shard_app
+    with app.app_context():
+        counters = [StatementCounter(engine) for engine in (db.engine, db.engines['shard_a'], db.engines['shard_b'])]
+    for counter in counters:
+        counter.__enter__()
+    try:
+        client = app.test_client()
+        assert client.put(f'/task/{new_id()}', json={'title': 'Nope'}).status_code == 403
+        assert client.post('/item', json={'shoppinglist_id': new_id(), 'title': 'Nope'}).status_code == 403
+        assert client.put(f'/task/{new_id()}', json={'title': 'Nope'},
+                          headers={'Authorization': 'Bearer forged'}).status_code == 403
+    finally:
+        for counter in counters:
+            counter.__exit__()
+    assert [counter.count for counter in counters] == [0, 0, 0]
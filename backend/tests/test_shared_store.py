@@ -0,0 +1,21 @@
+"""Expiry of the rows the workers share through the shared store."""
+import shared_store
+from shared_store import SharedStore
+
+
+def test_expired_rows_are_pruned_every_few_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_store, 'PRUNE_EVERY', 3)
+    store = SharedStore(str(tmp_path / 'shared.db'))
+    conn = store.connect()
+    conn.execute('CREATE TABLE entry (key TEXT PRIMARY KEY, until REAL NOT NULL)')
+    now = store.now()
+    conn.executemany('INSERT INTO entry VALUES (?, ?)', [('old', now - 1), ('new', now + 60)])
+
+    def keys():
+        return sorted(key for key, in conn.execute('SELECT key FROM entry'))
+
+    store.maybe_prune('entry', 'until', now)
+    store.maybe_prune('entry', 'until', now)
+    assert keys() == ['new', 'old']
+    store.maybe_prune('entry', 'until', now)
+    assert keys() == ['new']
@@ -0,0 +1,63 @@
+"""The caller's undone tasks across all of their WGs."""
+import pytest
+
+from extensions import db
+from models.types import new_id
+
+
+@pytest.fixture
+def other_tasks(app, seeded):
+    """Tasks of member_10 in a second WG of theirs and in a WG they are not in."""
+    from models import WG, TaskList, Task, user_task
+
+    data = seeded(10)
+    with app.app_context():
+        second_wg = db.session.execute(db.select(WG.idWG).where(WG.title == 'WG 10-1')).scalar()
+        lists = [{'idTaskList': new_id(), 'title': 'Other', 'wg_id': wg_id}
+                 for wg_id in (second_wg, seeded(1)['wg_id'])]
+        tasks = [{'idTask': new_id(), 'title': title, 'is_done': done, 'is_template': False,
+                  'tasklist_id': tasklist['idTaskList']}
+                 for tasklist, title, done in [(lists[0], 'Open', False), (lists[0], 'Done', True),
+                                               (lists[1], 'Not my WG', False)]]
+        with db.engine.begin() as conn:
+            conn.execute(TaskList.__table__.insert(), lists)
+            conn.execute(Task.__table__.insert(), tasks)
+            conn.execute(user_task.insert(), [{'user_id': data['user']['idUser'], 'task_id': task['idTask']}
+                                              for task in tasks])
+    yield second_wg
+    with app.app_context():
+        db.session.execute(db.delete(TaskList).where(TaskList.idTaskList.in_([l['idTaskList'] for l in lists])))
+        db.session.commit()
+
+
+def test_undone_tasks_are_grouped_by_wg(client, seeded, other_tasks):
+    data = seeded(10)
+    response = client.get('/tasks/undone/me', headers={'Authorization': f"Bearer {data['token']}"})
+    assert response.status_code == 200
+    wgs = response.get_json()['wgs']
+    assert [(wg['id'], wg['title']) for wg in wgs] == [(data['wg_id'], 'WG 10-0'), (other_tasks, 'WG 10-1')]
+    assert len(wgs[0]['tasks']) == 10
+    assert wgs[0]['tasks'][0]['users'] == [{'id': data['user']['idUser'], 'name': 'member_10'}]
+    assert [task['title'] for task in wgs[1]['tasks']] == ['Open']
+
+
+def test_links_are_read_from_the_covering_index(app, client, seeded):
+    from sqlalchemy import event
+
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'user_wg' in statement:
+            executed.append((statement, parameters))
+
+    data = seeded(10)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            client.get('/tasks/undone/me', headers={'Authorization': f"Bearer {data['token']}"})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        statement, parameters = executed[0]
+        with db.engine.connect() as conn:
+            plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    assert any('COVERING INDEX ix_user_task_user_task (user_id=?)' in step for step in plan), plan
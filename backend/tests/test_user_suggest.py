@@ -0,0 +1,77 @@
+"""Username suggestions: prefix search, the LRU in front of it and the rate limit."""
+import pytest
+
+from extensions import db
+from models.types import new_id
+
+
+@pytest.fixture(scope='module')
+def suggestions(app, seeded):
+    from models import User
+
+    seeded(1)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [
+                {'idUser': new_id(), 'strUser': name, 'strEmail': f'{name}@example.com',
+                 'strPassword': 'x', 'strHomePage': '/'}
+                for name in ('Suggest_Bob', 'suggest_alice', 'suggest_carol', 'suggestion')])
+    yield
+    with app.app_context():
+        app.extensions['user_suggest_cache'].clear()
+
+
+@pytest.fixture
+def suggest(client, seeded, suggestions):
+    headers = {'Authorization': f"Bearer {seeded(1)['token']}"}
+
+    def get(prefix):
+        return client.get('/users/suggest', headers=headers, query_string={'prefix': prefix})
+    return get
+
+
+def _names(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [user['username'] for user in response.get_json()['users']]
+
+
+def test_prefix_is_case_insensitive_and_ordered(suggest):
+    assert _names(suggest('SUGGEST_')) == ['suggest_alice', 'Suggest_Bob', 'suggest_carol']
+    assert _names(suggest('suggesti')) == ['suggestion']
+    assert _names(suggest('uggest')) == []
+    assert suggest('  ').status_code == 400
+
+
+def test_caller_is_not_suggested(suggest, seeded):
+    username = seeded(1)['user']['strUser']
+    assert username not in _names(suggest(username))
+
+
+def test_hot_prefixes_are_answered_from_the_cache(app, suggest, count_statements):
+    _names(suggest('suggest_c'))
+    with count_statements() as counter:
+        assert _names(suggest('suggest_c')) == ['suggest_carol']
+    # Only the token's user is loaded
+    assert not [s for s in counter.statements if 'lower' in s], counter.statements
+
+
+def test_prefixes_differing_in_case_share_an_entry(app, suggest, count_statements):
+    _names(suggest('SUGGEST_B'))
+    with count_statements() as counter:
+        assert _names(suggest('Suggest_b')) == ['Suggest_Bob']
+    assert not [s for s in counter.statements if 'lower' in s], counter.statements
+    assert app.extensions['user_suggest_cache'].get('suggest_b') is not None
+
+
+def test_callers_over_the_limit_get_429(app, suggest):
+    limiter = app.extensions['rate_limiter']
+    rate, burst = app.config['USER_SUGGEST_RATE'], app.config['USER_SUGGEST_BURST']
+    app.config.update(USER_SUGGEST_RATE=0.5, USER_SUGGEST_BURST=3)
+    limiter.clear()
+    try:
+        statuses = [suggest('sugg').status_code for _ in range(4)]
+        assert statuses == [200, 200, 200, 429]
+        assert suggest('sugg').headers['Retry-After'] == '2'
+    finally:
+        app.config.update(USER_SUGGEST_RATE=rate, USER_SUGGEST_BURST=burst)
+        limiter.clear()
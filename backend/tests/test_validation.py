@@ -0,0 +1,24 @@
+"""Request bodies rejected by validate_json before the database is touched."""
+import pytest
+
+
+@pytest.mark.parametrize('body, field, rule', [
+    ('{"wg_id": ', '', 'json'),
+    ({'wg_id': 'wg', 'title': 5}, 'title', 'type'),
+    ({'wg_id': 'wg', 'title': 'Chores', 'colour': 'red'}, '', 'additionalProperties'),
+])
+def test_invalid_bodies_are_rejected_without_statements(client, seeded, count_statements, body, field, rule):
+    data = seeded(1)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+    if isinstance(body, dict):
+        body = dict(body, wg_id=data['wg_id'])
+    kwargs = {'json': body} if isinstance(body, dict) else {'data': body, 'content_type': 'application/json'}
+
+    with count_statements() as counter:
+        response = client.post('/tasklist', headers=headers, **kwargs)
+
+    assert response.status_code == 400
+    payload = response.get_json()
+    assert payload['message'] == 'Invalid request body'
+    assert [(error['field'], error['rule']) for error in payload['errors']] == [(field, rule)]
+    assert counter.count == 0, '\n'.join(counter.statements)
@@ -0,0 +1,81 @@
+"""Exporting a WG as JSON lines and importing it again."""
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from conftest import bearer
+from database.wg_transfer import import_wg, is_wg_conflict, iter_wg_export
+
+
+@pytest.fixture(scope='module')
+def transfer_app(file_app):
+    return file_app()
+
+
+def _export(app, data, wg_id=None):
+    response = app.test_client().get(f"/wg/{wg_id or data['wg_id']}/export",
+                                     headers=bearer(data['token']))
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def _import(app, data, records, **args):
+    body = ''.join(json.dumps(record) + '\n' for record in records)
+    return app.test_client().post('/wg/import', query_string=args, data=body,
+                                  content_type='application/x-ndjson',
+                                  headers=bearer(data['token']))
+
+
+def _counts(records):
+    counts = {}
+    for record in records[1:]:
+        counts[record['_table']] = counts.get(record['_table'], 0) + 1
+    return counts
+
+
+def test_an_exported_wg_imports_as_a_copy(transfer_app):
+    app, data = transfer_app
+    records = _export(app, data)
+    response = _import(app, data, records, title='Copy', address='Elsewhere 2')
+    assert response.status_code == 201, response.get_json()
+    copy = _export(app, data, response.get_json()['id'])
+    assert _counts(copy) == _counts(records)
+    wg = next(record for record in copy if record.get('_table') == 'WG')
+    assert wg['title'] == 'Copy' and wg['idWG'] != data['wg_id']
+
+
+@pytest.mark.parametrize('value', ['not-a-date', 42])
+def test_malformed_dates_are_rejected(transfer_app, value):
+    app, data = transfer_app
+    records = _export(app, data)
+    wg = next(record for record in records if record.get('_table') == 'WG')
+    wg['tasks_changed_at'] = value
+    response = _import(app, data, records, title=f'Bad {value}', address=f'Bad {value}')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid export: WG.tasks_changed_at: invalid datetime'
+
+
+def test_title_clashes_and_other_conflicts_are_told_apart(transfer_app):
+    app, data = transfer_app
+    records = _export(app, data)
+    response = _import(app, data, records)
+    assert response.status_code == 409
+    assert response.get_json()['message'] == 'WG with this title or address and etage already exists'
+
+    # Keeping the ids of rows that are still there clashes on their primary keys
+    lines = [json.dumps(record) for record in records]
+    with app.app_context(), pytest.raises(IntegrityError) as error:
+        import_wg(lines, keep_ids=True, overrides={'title': 'Kept', 'address': 'Kept 1'})
+    assert not is_wg_conflict(error.value)
+    with app.app_context(), pytest.raises(IntegrityError) as error:
+        import_wg(lines, creator_id=data['user']['idUser'])
+    assert is_wg_conflict(error.value)
+
+
+def test_export_streams_the_whole_subtree(transfer_app):
+    app, data = transfer_app
+    with app.app_context():
+        records = [json.loads(line) for line in iter_wg_export(data['wg_id'], batch_size=2)]
+    assert records[0]['_type'] == 'header'
+    assert _counts(records)['TASK'] == 3
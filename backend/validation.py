@@ -0,0 +1,56 @@
+# validation.py
+from functools import wraps
+from flask import request, jsonify
+import fastjsonschema
+
+# Reusable property schemas for the request bodies of the blueprints
+ID = {'type': 'string', 'minLength': 1, 'maxLength': 36}
+ID_LIST = {'type': 'array', 'items': ID}
+TITLE = {'type': 'string', 'minLength': 1, 'maxLength': 120}
+TEXT = {'type': ['string', 'null']}
+DATE = {'type': ['string', 'null']}
+AMOUNT = {'type': ['number', 'null']}
+BOOLEAN = {'type': 'boolean'}
+
+
+def object_schema(properties, required=()):
+    """An object with ``properties`` and nothing else; unknown fields are rejected."""
+    return {'type': 'object', 'required': list(required), 'properties': properties,
+            'additionalProperties': False}
+
+
+def compile_schema(schema):
+    """Compiles a JSON schema into a plain Python validation function."""
+    return fastjsonschema.compile(schema)
+
+
+def validation_error(field, rule, message):
+    return jsonify({
+        'message': 'Invalid request body',
+        'errors': [{'field': field, 'rule': rule, 'message': message}]
+    }), 400
+
+
+def validate_json(schema):
+    """Rejects requests whose JSON body does not match ``schema``.
+
+    The schema is compiled once when the view module is imported. Put the
+    decorator above ``token_required`` so malformed bodies are answered with a
+    400 before the token is looked up in the database.
+    """
+    validator = compile_schema(schema)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            data = request.get_json(silent=True)
+            if data is None:
+                return validation_error('', 'json', 'Request body must be a JSON document')
+            try:
+                validator(data)
+            except fastjsonschema.JsonSchemaValueException as e:
+                field = '.'.join(e.path[1:]) if e.path else ''
+                return validation_error(field, e.rule, e.message)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator